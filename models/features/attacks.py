@@ -0,0 +1,75 @@
+import chess
+
+
+def piece_attacks(board, square, bb_square):
+    """Casillas atacadas por la pieza en `square`, igual que `chess.Board.attacks_mask`"""
+    if bb_square & board.pawns:
+        return chess.BB_PAWN_ATTACKS[bool(bb_square & board.occupied_co[chess.WHITE])][square]
+    elif bb_square & board.knights:
+        return chess.BB_KNIGHT_ATTACKS[square]
+    elif bb_square & board.kings:
+        return chess.BB_KING_ATTACKS[square]
+    occupied = board.occupied
+    attacks = 0
+    if bb_square & (board.bishops | board.queens):
+        attacks = chess.BB_DIAG_ATTACKS[square][chess.BB_DIAG_MASKS[square] & occupied]
+    if bb_square & (board.rooks | board.queens):
+        attacks |= (chess.BB_RANK_ATTACKS[square][chess.BB_RANK_MASKS[square] & occupied] |
+                    chess.BB_FILE_ATTACKS[square][chess.BB_FILE_MASKS[square] & occupied])
+    return attacks
+
+
+def attackers_mask(board, color, square):
+    """Piezas de `color` que atacan `square`, igual que `chess.Board.attackers_mask`"""
+    occupied = board.occupied
+    queens_and_rooks = board.queens | board.rooks
+    queens_and_bishops = board.queens | board.bishops
+    attackers = (
+        (chess.BB_KING_ATTACKS[square] & board.kings) |
+        (chess.BB_KNIGHT_ATTACKS[square] & board.knights) |
+        (chess.BB_RANK_ATTACKS[square][chess.BB_RANK_MASKS[square] & occupied] & queens_and_rooks) |
+        (chess.BB_FILE_ATTACKS[square][chess.BB_FILE_MASKS[square] & occupied] & queens_and_rooks) |
+        (chess.BB_DIAG_ATTACKS[square][chess.BB_DIAG_MASKS[square] & occupied] & queens_and_bishops) |
+        (chess.BB_PAWN_ATTACKS[not color][square] & board.pawns))
+    return attackers & board.occupied_co[color]
+
+
+class AttackContext:
+    """Mapa de ataques de una posición, calculado una sola vez por jugada
+
+    - `attacked[color]`: unión de casillas atacadas por cada bando.
+    - `piece_attack_count`: suma de casillas atacadas por cada caballo, alfil,
+      torre y dama del bando al turno (base de movilidad y actividad).
+    - `king_attackers`: piezas rivales que atacan al rey del bando al turno.
+
+    Si se reciben los ataques de peones ya calculados (tabla hash de peones),
+    solo se recorren las piezas que no son peones.
+    """
+
+    __slots__ = ("attacked", "piece_attack_count", "king_attackers")
+
+    def __init__(self, board, pawn_attacks=None):
+        turn = board.turn
+        movers = board.knights | board.bishops | board.rooks | board.queens
+        attacked = [0, 0]
+        piece_attack_count = 0
+
+        for color in (chess.WHITE, chess.BLACK):
+            pieces = board.occupied_co[color]
+            side_attacks = 0
+            if pawn_attacks is not None:
+                pieces &= ~board.pawns
+                side_attacks = pawn_attacks[color]
+            while pieces:
+                bb_square = pieces & -pieces
+                attacks = piece_attacks(board, bb_square.bit_length() - 1, bb_square)
+                side_attacks |= attacks
+                if color == turn and bb_square & movers:
+                    piece_attack_count += attacks.bit_count()
+                pieces ^= bb_square
+            attacked[color] = side_attacks
+
+        king_mask = board.kings & board.occupied_co[turn]
+        self.attacked = (attacked[chess.BLACK], attacked[chess.WHITE])
+        self.piece_attack_count = piece_attack_count
+        self.king_attackers = attackers_mask(board, not turn, king_mask.bit_length() - 1) if king_mask else 0
@@ -0,0 +1,420 @@
+import chess
+import chess.pgn
+import numpy as np
+import sys
+
+from models.features.bitboards import CENTER_DISTANCE, ENEMY_TERRITORY_MASKS, KEY_SQUARES_MASK, PIECE_VALUES
+from models.features.extraction import (
+    EXTRACTION_ERROR, MOVES_TO_ANALYZE, OPENING_FEATURES_PER_MOVE, STYLE_FEATURES_PER_MOVE, parse_color, read_pgn
+)
+from models.features.replay import replay_mainline
+
+# Índices de los bitboards apilados por posición
+PAWNS, KNIGHTS, BISHOPS, ROOKS, QUEENS, KINGS, WHITE, BLACK = range(8)
+BITBOARDS_PER_POSITION = 8
+
+# Partidas por tarea en `extract_many` cuando se reparte entre procesos
+BATCH_CHUNK_SIZE = 64
+
+U64 = np.uint64
+NOT_FILE_A = U64(~chess.BB_FILE_A & chess.BB_ALL)
+NOT_FILE_H = U64(~chess.BB_FILE_H & chess.BB_ALL)
+NOT_FILE_AB = U64(~(chess.BB_FILE_A | chess.BB_FILE_B) & chess.BB_ALL)
+NOT_FILE_GH = U64(~(chess.BB_FILE_G | chess.BB_FILE_H) & chess.BB_ALL)
+FILE_BITS_TO_MASK = U64(0x0101010101010101)
+KEY_SQUARES = U64(KEY_SQUARES_MASK)
+ZERO = U64(0)
+ONE = U64(1)
+
+# Tablas de consulta indexadas por casilla
+KNIGHT_ATTACKS = np.array(chess.BB_KNIGHT_ATTACKS, dtype=np.uint64)
+KING_ATTACKS = np.array(chess.BB_KING_ATTACKS, dtype=np.uint64)
+PAWN_ATTACKS = np.array(chess.BB_PAWN_ATTACKS, dtype=np.uint64)
+CENTER_DISTANCES = np.array(CENTER_DISTANCE, dtype=np.float64)
+KNIGHT_ATTACK_COUNTS = np.array([bb.bit_count() for bb in chess.BB_KNIGHT_ATTACKS], dtype=np.int64)
+TERRITORY = np.array(ENEMY_TERRITORY_MASKS, dtype=np.uint64)
+
+
+def _ray(square, file_step, rank_step):
+    """Casillas desde `square` (exclusiva) hasta el borde en una dirección"""
+    ray = 0
+    file, rank = chess.square_file(square) + file_step, chess.square_rank(square) + rank_step
+    while 0 <= file < 8 and 0 <= rank < 8:
+        ray |= chess.BB_SQUARES[chess.square(file, rank)]
+        file, rank = file + file_step, rank + rank_step
+    return ray
+
+
+def _ray_table(file_step, rank_step):
+    return np.array([_ray(sq, file_step, rank_step) for sq in chess.SQUARES], dtype=np.uint64)
+
+
+# Rayos de piezas deslizantes; las direcciones "positivas" avanzan hacia casillas mayores
+ROOK_RAYS_POSITIVE = (_ray_table(0, 1), _ray_table(1, 0))
+ROOK_RAYS_NEGATIVE = (_ray_table(0, -1), _ray_table(-1, 0))
+BISHOP_RAYS_POSITIVE = (_ray_table(1, 1), _ray_table(-1, 1))
+BISHOP_RAYS_NEGATIVE = (_ray_table(-1, -1), _ray_table(1, -1))
+
+
+if hasattr(np, "bitwise_count"):
+    def popcount(bb):
+        """Número de bits activos por elemento"""
+        return np.bitwise_count(bb).astype(np.int64)
+else:
+    def popcount(bb):
+        """Número de bits activos por elemento (SWAR para NumPy < 2.0)"""
+        bb = bb - ((bb >> U64(1)) & U64(0x5555555555555555))
+        bb = (bb & U64(0x3333333333333333)) + ((bb >> U64(2)) & U64(0x3333333333333333))
+        bb = (bb + (bb >> U64(4))) & U64(0x0F0F0F0F0F0F0F0F)
+        return ((bb * FILE_BITS_TO_MASK) >> U64(56)).astype(np.int64)
+
+
+def _lsb(bb):
+    """Aísla el bit menos significativo"""
+    return bb & (~bb + ONE)
+
+
+def _msb(bb):
+    """Aísla el bit más significativo"""
+    for shift in (1, 2, 4, 8, 16, 32):
+        bb = bb | (bb >> U64(shift))
+    return bb ^ (bb >> ONE)
+
+
+def _bit_index(bb):
+    """Índice de un bitboard con un único bit activo (0 si está vacío)"""
+    return np.log2(np.maximum(bb, ONE).astype(np.float64)).astype(np.int64)
+
+
+def _slide(rays_positive, rays_negative, square, occupied):
+    """Ataques deslizantes desde `square` (escalar o arreglo) con ocupación por posición"""
+    attacks = np.zeros_like(occupied)
+    for rays in rays_positive:
+        ray = rays[square]
+        blocker = _lsb(ray & occupied)
+        attacks |= ray & ((blocker << ONE) - ONE)
+    for rays in rays_negative:
+        ray = rays[square]
+        blocker = _msb(ray & occupied)
+        attacks |= np.where(blocker == ZERO, ray, ray & ~(blocker - ONE))
+    return attacks
+
+
+def _file_set(bb):
+    bb = bb | (bb >> U64(32))
+    bb = bb | (bb >> U64(16))
+    bb = bb | (bb >> U64(8))
+    return bb & U64(0xFF)
+
+
+def _fill_south(bb):
+    for shift in (8, 16, 32):
+        bb = bb | (bb >> U64(shift))
+    return bb
+
+
+def _fill_north(bb):
+    for shift in (8, 16, 32):
+        bb = bb | (bb << U64(shift))
+    return bb
+
+
+def _widen(bb):
+    """Extiende un bitboard a sus columnas vecinas"""
+    return bb | ((bb << ONE) & NOT_FILE_A) | ((bb >> ONE) & NOT_FILE_H)
+
+
+def _pawn_attacks(pawns, white):
+    if white:
+        return ((pawns << U64(7)) & NOT_FILE_H) | ((pawns << U64(9)) & NOT_FILE_A)
+    return ((pawns >> U64(7)) & NOT_FILE_A) | ((pawns >> U64(9)) & NOT_FILE_H)
+
+
+def _knight_attacks(knights):
+    return (((knights << U64(17)) & NOT_FILE_A) | ((knights << U64(15)) & NOT_FILE_H) |
+            ((knights << U64(10)) & NOT_FILE_AB) | ((knights << U64(6)) & NOT_FILE_GH) |
+            ((knights >> U64(17)) & NOT_FILE_H) | ((knights >> U64(15)) & NOT_FILE_A) |
+            ((knights >> U64(10)) & NOT_FILE_GH) | ((knights >> U64(6)) & NOT_FILE_AB))
+
+
+def _king_attacks(kings):
+    sides = ((kings << ONE) & NOT_FILE_A) | ((kings >> ONE) & NOT_FILE_H)
+    row = kings | sides
+    return sides | (row << U64(8)) | (row >> U64(8))
+
+
+def _side_material(boards, color):
+    total = np.zeros(boards.shape[0], dtype=np.float64)
+    for piece_type, value in PIECE_VALUES:
+        total += popcount(boards[:, piece_type - 1] & color) * value
+    return total
+
+
+def _attack_maps(boards, turn):
+    """Casillas atacadas por cada bando y suma de ataques de piezas menores y mayores del bando al turno"""
+    pawns, knights, kings = boards[:, PAWNS], boards[:, KNIGHTS], boards[:, KINGS]
+    diagonal = boards[:, BISHOPS] | boards[:, QUEENS]
+    straight = boards[:, ROOKS] | boards[:, QUEENS]
+    white, black = boards[:, WHITE], boards[:, BLACK]
+    occupied = white | black
+    us = np.where(turn, white, black)
+
+    attacked_white = _pawn_attacks(pawns & white, True) | _knight_attacks(knights & white) | _king_attacks(kings & white)
+    attacked_black = _pawn_attacks(pawns & black, False) | _knight_attacks(knights & black) | _king_attacks(kings & black)
+
+    own_knights = knights & us
+    piece_attack_count = np.zeros(boards.shape[0], dtype=np.int64)
+    sliders = diagonal | straight
+    any_slider = np.bitwise_or.reduce(sliders) if sliders.size else ZERO
+
+    for square in chess.SQUARES:
+        bit = U64(chess.BB_SQUARES[square])
+        piece_attack_count += ((own_knights & bit) != ZERO) * KNIGHT_ATTACK_COUNTS[square]
+        if not any_slider & bit:
+            continue
+
+        attacks = np.zeros_like(occupied)
+        on_diagonal = (diagonal & bit) != ZERO
+        if on_diagonal.any():
+            attacks = np.where(on_diagonal, _slide(BISHOP_RAYS_POSITIVE, BISHOP_RAYS_NEGATIVE, square, occupied), attacks)
+        on_straight = (straight & bit) != ZERO
+        if on_straight.any():
+            attacks |= np.where(on_straight, _slide(ROOK_RAYS_POSITIVE, ROOK_RAYS_NEGATIVE, square, occupied), ZERO)
+
+        attacked_white |= np.where((white & bit) != ZERO, attacks, ZERO)
+        attacked_black |= np.where((black & bit) != ZERO, attacks, ZERO)
+        piece_attack_count += np.where((us & bit) != ZERO, popcount(attacks), 0)
+
+    return attacked_white, attacked_black, piece_attack_count
+
+
+def _king_attackers(boards, turn, king_square, has_king):
+    """Piezas rivales que atacan al rey del bando al turno"""
+    them = np.where(turn, boards[:, BLACK], boards[:, WHITE])
+    occupied = boards[:, WHITE] | boards[:, BLACK]
+    diagonal = boards[:, BISHOPS] | boards[:, QUEENS]
+    straight = boards[:, ROOKS] | boards[:, QUEENS]
+    attackers = (
+        (KING_ATTACKS[king_square] & boards[:, KINGS]) |
+        (KNIGHT_ATTACKS[king_square] & boards[:, KNIGHTS]) |
+        (_slide(ROOK_RAYS_POSITIVE, ROOK_RAYS_NEGATIVE, king_square, occupied) & straight) |
+        (_slide(BISHOP_RAYS_POSITIVE, BISHOP_RAYS_NEGATIVE, king_square, occupied) & diagonal) |
+        (PAWN_ATTACKS[turn.astype(np.int64), king_square] & boards[:, PAWNS]))
+    return np.where(has_king, attackers & them, ZERO)
+
+
+def own_material(boards, turn):
+    """Material del bando al turno para M posiciones apiladas"""
+    return np.where(turn, _side_material(boards, boards[:, WHITE]), _side_material(boards, boards[:, BLACK]))
+
+
+def position_feature_matrix(boards, turn, previous_material, with_territory=False):
+    """Características de M posiciones apiladas (M, 8) -> (M, 12|13) en float64"""
+    boards = np.asarray(boards, dtype=np.uint64)
+    turn = np.asarray(turn, dtype=bool)
+    white, black = boards[:, WHITE], boards[:, BLACK]
+    us = np.where(turn, white, black)
+    them = np.where(turn, black, white)
+    pawns = boards[:, PAWNS]
+    own_pawns, enemy_pawns = pawns & us, pawns & them
+
+    white_material = _side_material(boards, white)
+    black_material = _side_material(boards, black)
+    material = np.where(turn, white_material, black_material)
+    material_balance = (white_material - black_material) / 10
+
+    attacked_white, attacked_black, piece_attack_count = _attack_maps(boards, turn)
+    attacked_us = np.where(turn, attacked_white, attacked_black)
+
+    # Seguridad del rey (la casilla a1 cuenta como "sin rey", igual que el cálculo original)
+    king_bb = boards[:, KINGS] & us
+    king_square = _bit_index(_msb(king_bb))
+    has_king = (king_bb != ZERO) & (king_square != 0)
+    pawn_shield = popcount(KING_ATTACKS[king_square] & own_pawns)
+    attackers = popcount(_king_attackers(boards, turn, king_square, has_king))
+    king_safety = np.where(
+        has_king,
+        (pawn_shield * 0.5) - (attackers * 0.3) - (CENTER_DISTANCES[king_square] * 0.2),
+        0.0)
+
+    # Estructura de peones: doblados, pasados y aislados
+    files = _file_set(own_pawns)
+    doubled = popcount(own_pawns) - popcount(files)
+    blocked_white = _widen(_fill_south(pawns & black) >> U64(8))
+    blocked_black = _widen(_fill_north(pawns & white) << U64(8))
+    passed = popcount(own_pawns & ~np.where(turn, blocked_white, blocked_black))
+    isolated_files = files & ~((files << ONE) | (files >> ONE))
+    isolated = popcount(own_pawns & (isolated_files * FILE_BITS_TO_MASK))
+    pawn_structure = -doubled + passed - isolated
+
+    # Peones pasados mirando siempre hacia las filas superiores
+    forward_blocked = _widen(_fill_south(enemy_pawns) >> U64(8))
+    passed_forward = popcount(own_pawns & ~forward_blocked)
+
+    key_control = popcount(attacked_us & KEY_SQUARES)
+    sacrifice = ((previous_material - material) > 2) & (key_control > 4)
+    hanging = popcount(pawns & white & ~attacked_white) + popcount(pawns & black & ~attacked_black)
+    bishops = boards[:, BISHOPS]
+    bishop_pair = (popcount(bishops & white) >= 2).astype(np.int64) - (popcount(bishops & black) >= 2)
+
+    columns = [
+        material_balance,
+        king_safety,
+        pawn_structure,
+        piece_attack_count / 20,
+        key_control,
+        8 - popcount(_file_set(pawns)),
+        sacrifice,
+        np.where(turn, -hanging, hanging),
+        popcount(attacked_us) / 64,
+        piece_attack_count / 50,
+        passed_forward / 8,
+        bishop_pair
+    ]
+    if with_territory:
+        own = us & TERRITORY[turn.astype(np.int64)]
+        long_range = popcount(own & (boards[:, QUEENS] | boards[:, ROOKS] | bishops))
+        columns.append((long_range * 1.5 + (popcount(own) - long_range)) / 10)
+    return np.stack([np.asarray(c, dtype=np.float64) for c in columns], axis=1)
+
+
+def board_bitboards(board):
+    """Los 8 bitboards de una posición en el orden de `BITBOARDS_PER_POSITION`"""
+    return (board.pawns, board.knights, board.bishops, board.rooks, board.queens, board.kings,
+            board.occupied_co[chess.WHITE], board.occupied_co[chess.BLACK])
+
+
+class PositionStack:
+    """Bitboards de las jugadas analizadas de N partidas, apilados en (N, 30, 8)"""
+
+    def __init__(self, count):
+        self.boards = np.zeros((count, MOVES_TO_ANALYZE, BITBOARDS_PER_POSITION), dtype=np.uint64)
+        self.valid = np.zeros((count, MOVES_TO_ANALYZE), dtype=bool)
+        self.turn = np.zeros(count, dtype=bool)
+
+    def add_game(self, index, game, color):
+        """Reproduce la línea principal y guarda las posiciones en las que mueve `color`"""
+        self.turn[index] = color
+        analyzed = 0
+        for board in replay_mainline(game):
+            if board.turn != color:
+                continue
+            self.boards[index, analyzed] = board_bitboards(board)
+            self.valid[index, analyzed] = True
+            analyzed += 1
+            if analyzed >= MOVES_TO_ANALYZE:
+                break
+
+    @classmethod
+    def from_games(cls, games, colors):
+        stack = cls(len(games))
+        for index, (game, color) in enumerate(zip(games, colors)):
+            stack.add_game(index, game, color)
+        return stack
+
+
+def batch_features(stack, with_territory=False):
+    """Tensor (N, 30, 12) o (N, 30, 13) en float32 listo para los escaladores"""
+    count = stack.boards.shape[0]
+    per_move = OPENING_FEATURES_PER_MOVE if with_territory else STYLE_FEATURES_PER_MOVE
+    flat_boards = stack.boards.reshape(-1, BITBOARDS_PER_POSITION)
+    flat_turn = np.repeat(stack.turn, MOVES_TO_ANALYZE)
+
+    # El material previo de cada jugada es el de la jugada analizada anterior de la misma partida
+    material = own_material(flat_boards, flat_turn).reshape(count, MOVES_TO_ANALYZE)
+    previous_material = np.zeros_like(material)
+    previous_material[:, 1:] = material[:, :-1]
+
+    features = position_feature_matrix(flat_boards, flat_turn, previous_material.reshape(-1), with_territory)
+    features = features.reshape(count, MOVES_TO_ANALYZE, per_move)
+    features[~stack.valid] = 0
+    return features.astype(np.float32)
+
+
+def style_batch(games, colors):
+    """Características del detector de estilo para varias partidas: (N, 30, 12)"""
+    return batch_features(PositionStack.from_games(games, colors))
+
+
+def opening_batch(games, colors):
+    """Características del recomendador (sin estilo) para varias partidas: (N, 30, 13)"""
+    return batch_features(PositionStack.from_games(games, colors), with_territory=True)
+
+
+def _extract_chunk(pgns, colors, with_territory):
+    """Lee un grupo de PGN y extrae las válidas con el motor por lotes. Función de módulo para
+    poder ejecutarse en un pool de procesos"""
+    games, valid_colors, indices, errors = [], [], [], {}
+    for index, (pgn_text, color) in enumerate(zip(pgns, colors)):
+        try:
+            game, error = read_pgn(pgn_text)
+            if error:
+                errors[index] = error
+                continue
+            valid_color = parse_color(color)
+        except Exception as e:
+            # El fallo de una partida queda en su resultado, igual que con una sola partida
+            errors[index] = {"status": "error", "message": f"Error inesperado: {str(e)}"}
+            continue
+        games.append(game)
+        valid_colors.append(valid_color)
+        indices.append(index)
+
+    per_move = OPENING_FEATURES_PER_MOVE if with_territory else STYLE_FEATURES_PER_MOVE
+    if not games:
+        return np.zeros((0, MOVES_TO_ANALYZE * per_move), dtype=np.float32), indices, errors
+    try:
+        features = batch_features(PositionStack.from_games(games, valid_colors), with_territory)
+    except Exception as e:
+        print(f"Error en extracción: {str(e)}")
+        errors.update((index, dict(EXTRACTION_ERROR)) for index in indices)
+        return np.zeros((0, MOVES_TO_ANALYZE * per_move), dtype=np.float32), [], errors
+    return features.reshape(len(games), -1), indices, errors
+
+
+def extract_many(pgns, colors, with_territory=False, executor=None, chunk_size=BATCH_CHUNK_SIZE):
+    """Lee y extrae varias partidas de una vez
+
+    `colors` puede ser un color para todas o uno por partida. Con `executor` (por ejemplo un
+    ProcessPoolExecutor) los grupos de `chunk_size` partidas se procesan en paralelo.
+    Devuelve (características (M, 360|390) float32 de las partidas válidas, su índice en la
+    entrada, {índice: error} del resto).
+    """
+    pgns = list(pgns)
+    colors = [colors] * len(pgns) if isinstance(colors, str) else list(colors)
+    if len(colors) != len(pgns):
+        raise ValueError("Se necesita un color por partida")
+
+    starts = range(0, len(pgns), max(chunk_size, 1))
+    chunks = [(pgns[start:start + chunk_size], colors[start:start + chunk_size], with_territory) for start in starts]
+    results = executor.map(_extract_chunk, *zip(*chunks)) if executor and chunks else (_extract_chunk(*chunk) for chunk in chunks)
+
+    per_move = OPENING_FEATURES_PER_MOVE if with_territory else STYLE_FEATURES_PER_MOVE
+    all_features, all_indices, all_errors = [np.zeros((0, MOVES_TO_ANALYZE * per_move), dtype=np.float32)], [], {}
+    for start, (features, indices, errors) in zip(starts, results):
+        all_features.append(features)
+        all_indices.extend(start + index for index in indices)
+        all_errors.update((start + index, error) for index, error in errors.items())
+    return np.concatenate(all_features), all_indices, all_errors
+
+
+def read_games(path):
+    """Lee todas las partidas de un archivo PGN"""
+    games = []
+    with open(path, encoding="utf-8") as handle:
+        while True:
+            game = chess.pgn.read_game(handle)
+            if game is None:
+                break
+            games.append(game)
+    return games
+
+
+if __name__ == "__main__":
+    # Uso: python -m models.features.batch partidas.pgn white|black salida.npy [--style]
+    pgn_path, color_name, output_path = sys.argv[1:4]
+    games = read_games(pgn_path)
+    colors = [color_name.lower() == "white"] * len(games)
+    features = style_batch(games, colors) if "--style" in sys.argv[4:] else opening_batch(games, colors)
+    np.save(output_path, features)
+    print(f"{len(games)} partidas -> {features.shape} guardado en {output_path}")
@@ -0,0 +1,265 @@
+import chess
+
+# Valores de pieza usados por todas las características de material
+PIECE_VALUES = (
+    (chess.PAWN, 1.5),
+    (chess.KNIGHT, 3.2),
+    (chess.BISHOP, 3.5),
+    (chess.ROOK, 5.1),
+    (chess.QUEEN, 9.8),
+    (chess.KING, 0)
+)
+
+BB_ALL = chess.BB_ALL
+BB_FILE_BITS_TO_MASK = 0x0101010101010101
+
+# Casillas clave: centro clásico, centro extendido y acceso al centro
+KEY_SQUARES_MASK = (
+    chess.BB_D4 | chess.BB_D5 | chess.BB_E4 | chess.BB_E5 |
+    chess.BB_C3 | chess.BB_C6 | chess.BB_F3 | chess.BB_F6 |
+    chess.BB_D3 | chess.BB_E3 | chess.BB_D6 | chess.BB_E6
+)
+
+# Campo enemigo indexado por color: casillas 0-39 para negras y 24-63 para blancas
+ENEMY_TERRITORY_MASKS = (
+    (1 << 40) - 1,
+    BB_ALL & ~((1 << 24) - 1)
+)
+
+# Distancia Manhattan al centro, con la misma aritmética que el cálculo original
+CENTER_DISTANCE = tuple(
+    abs(3.5 - chess.square_file(sq)) + abs(3.5 - chess.square_rank(sq))
+    for sq in chess.SQUARES
+)
+
+
+def _adjacent_files_mask(file):
+    """Máscara de la columna indicada y sus columnas vecinas"""
+    mask = chess.BB_FILES[file]
+    if file > 0:
+        mask |= chess.BB_FILES[file - 1]
+    if file < 7:
+        mask |= chess.BB_FILES[file + 1]
+    return mask
+
+
+def _ranks_above(rank):
+    """Máscara de todas las filas estrictamente superiores"""
+    return BB_ALL & ~((1 << (8 * (rank + 1))) - 1)
+
+
+def _ranks_below(rank):
+    """Máscara de todas las filas estrictamente inferiores"""
+    return (1 << (8 * rank)) - 1
+
+
+# Casillas que un peón enemigo debe ocupar para impedir que el peón sea pasado
+PASSED_PAWN_MASKS = (
+    tuple(_adjacent_files_mask(chess.square_file(sq)) & _ranks_below(chess.square_rank(sq)) for sq in chess.SQUARES),
+    tuple(_adjacent_files_mask(chess.square_file(sq)) & _ranks_above(chess.square_rank(sq)) for sq in chess.SQUARES)
+)
+
+# `_passed_pawns_count` siempre revisa las filas superiores, para ambos colores
+FORWARD_SPAN_MASKS = PASSED_PAWN_MASKS[chess.WHITE]
+
+
+def popcount(bb):
+    """Número de bits activos en un bitboard"""
+    return bb.bit_count()
+
+
+def file_set(bb):
+    """Proyecta un bitboard sobre un byte con un bit por columna ocupada"""
+    bb |= bb >> 32
+    bb |= bb >> 16
+    bb |= bb >> 8
+    return bb & 0xFF
+
+
+def files_to_mask(files):
+    """Convierte un byte de columnas en la máscara de esas columnas completas"""
+    return files * BB_FILE_BITS_TO_MASK
+
+
+def pieces_mask(board, piece_type, color):
+    """Bitboard de las piezas de un tipo y color"""
+    if piece_type == chess.PAWN:
+        bb = board.pawns
+    elif piece_type == chess.KNIGHT:
+        bb = board.knights
+    elif piece_type == chess.BISHOP:
+        bb = board.bishops
+    elif piece_type == chess.ROOK:
+        bb = board.rooks
+    elif piece_type == chess.QUEEN:
+        bb = board.queens
+    else:
+        bb = board.kings
+    return bb & board.occupied_co[color]
+
+
+def king_square(board, color):
+    """Casilla del rey (o None), igual que `chess.Board.king`"""
+    king_mask = board.kings & board.occupied_co[color]
+    return king_mask.bit_length() - 1 if king_mask else None
+
+
+def material_from_counts(counts):
+    """Material a partir del número de piezas por tipo, en el orden de `PIECE_VALUES`"""
+    total = 0
+    for piece_type, value in PIECE_VALUES:
+        total += counts[piece_type] * value
+    return total
+
+
+def side_material(board, color):
+    """Material de un bando con los valores de `PIECE_VALUES`.
+    Si el tablero lleva el material incremental (`ReplayBoard`) no se recuenta"""
+    material = getattr(board, "material", None)
+    if material is not None:
+        return material[color]
+    total = 0
+    for piece_type, value in PIECE_VALUES:
+        total += popcount(pieces_mask(board, piece_type, color)) * value
+    return total
+
+
+def material_balance(board):
+    """Balance material con valores de pieza ajustados"""
+    return (side_material(board, chess.WHITE) - side_material(board, chess.BLACK)) / 10
+
+
+def total_material(board):
+    """Material total del jugador al que le toca mover"""
+    return side_material(board, board.turn)
+
+
+def king_safety(board, attacks):
+    """Escudo de peones, atacantes y centralización del rey del bando al turno"""
+    square = king_square(board, board.turn)
+    if not square:
+        return 0
+
+    pawn_shield = popcount(chess.BB_KING_ATTACKS[square] & board.pawns & board.occupied_co[board.turn])
+    attackers = popcount(attacks.king_attackers)
+    return (pawn_shield * 0.5) - (attackers * 0.3) - (CENTER_DISTANCE[square] * 0.2)
+
+
+def pawn_structure_score(pawns, enemy_pawns, color):
+    """Peones doblados, pasados y aislados a partir de los bitboards de peones"""
+    files = file_set(pawns)
+
+    doubled = popcount(pawns) - popcount(files)
+
+    passed = 0
+    passed_masks = PASSED_PAWN_MASKS[color]
+    bb = pawns
+    while bb:
+        bb_square = bb & -bb
+        if not passed_masks[bb_square.bit_length() - 1] & enemy_pawns:
+            passed += 1
+        bb ^= bb_square
+
+    isolated_files = files & ~((files << 1) | (files >> 1))
+    isolated = popcount(pawns & files_to_mask(isolated_files))
+
+    score = 0
+    score -= doubled
+    score += passed
+    score -= isolated
+    return score
+
+
+def forward_passed_count(pawns, enemy_pawns):
+    """Peones sin peones rivales delante en su columna o vecinas, mirando hacia las filas superiores"""
+    passed = 0
+    while pawns:
+        bb_square = pawns & -pawns
+        if not FORWARD_SPAN_MASKS[bb_square.bit_length() - 1] & enemy_pawns:
+            passed += 1
+        pawns ^= bb_square
+    return passed
+
+
+def open_files(all_pawns):
+    """Número de columnas sin peones"""
+    return 8 - popcount(file_set(all_pawns))
+
+
+def pawn_attacks(pawns, color):
+    """Casillas atacadas por un conjunto de peones del color indicado"""
+    if color == chess.WHITE:
+        return (((pawns << 7) & ~chess.BB_FILE_H) | ((pawns << 9) & ~chess.BB_FILE_A)) & BB_ALL
+    return ((pawns >> 7) & ~chess.BB_FILE_A) | ((pawns >> 9) & ~chess.BB_FILE_H)
+
+
+def pawn_structure(board):
+    """Peones doblados, pasados y aislados del bando al turno"""
+    return pawn_structure_score(
+        board.pawns & board.occupied_co[board.turn],
+        board.pawns & board.occupied_co[not board.turn],
+        board.turn)
+
+
+def passed_pawns_count(board):
+    """Conteo de peones pasados (revisando siempre las filas superiores)"""
+    return forward_passed_count(
+        board.pawns & board.occupied_co[board.turn],
+        board.pawns & board.occupied_co[not board.turn]) / 8
+
+
+def openness(board):
+    """Número de columnas sin peones de ningún color"""
+    return open_files(board.pawns)
+
+
+def piece_activity(board, attacks):
+    """Movilidad y actividad de piezas mayores"""
+    return attacks.piece_attack_count / 20
+
+
+def piece_mobility(board, attacks):
+    """Movilidad de las piezas (casillas atacadas por piezas menores y mayores)"""
+    return attacks.piece_attack_count / 50
+
+
+def key_squares_control(board, attacks):
+    """Casillas clave atacadas por el bando al turno"""
+    return popcount(attacks.attacked[board.turn] & KEY_SQUARES_MASK)
+
+
+def sacrifice(board, previous_material, attacks):
+    """1 si se perdieron más de 2 puntos de material y se controla el centro"""
+    material_diff = previous_material - total_material(board)
+    if material_diff > 2 and key_squares_control(board, attacks) > 4:
+        return 1
+    return 0
+
+
+def tactical_opportunities(board, attacks):
+    """Peones sin defensa de ambos bandos, con signo según el turno"""
+    hanging_pieces = 0
+    for color in (chess.WHITE, chess.BLACK):
+        pawns = board.pawns & board.occupied_co[color]
+        hanging_pieces += popcount(pawns & ~attacks.attacked[color])
+    return -hanging_pieces if board.turn == chess.WHITE else hanging_pieces
+
+
+def space_advantage(board, attacks):
+    """Fracción del tablero atacada por el bando al turno"""
+    return popcount(attacks.attacked[board.turn]) / 64
+
+
+def bishop_pair(board):
+    """Ventaja de pareja de alfiles"""
+    white_pair = 1 if popcount(board.bishops & board.occupied_co[chess.WHITE]) >= 2 else 0
+    black_pair = 1 if popcount(board.bishops & board.occupied_co[chess.BLACK]) >= 2 else 0
+    return white_pair - black_pair
+
+
+def pieces_in_enemy_territory(board):
+    """Piezas propias en campo enemigo, con peso 1.5 para damas, torres y alfiles"""
+    own = board.occupied_co[board.turn] & ENEMY_TERRITORY_MASKS[board.turn]
+    long_range = popcount(own & (board.queens | board.rooks | board.bishops))
+    others = popcount(own) - long_range
+    return (long_range * 1.5 + others) / 10
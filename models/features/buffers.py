@@ -0,0 +1,83 @@
+import numpy as np
+import threading
+import weakref
+from contextlib import contextmanager
+
+from models.features.extraction import OPENING_TOTAL_FEATURES, STYLE_TOTAL_FEATURES
+
+# Buffers libres que se conservan por pool
+MAX_FREE_BUFFERS = 32
+
+
+class BufferPool:
+    """Pool de buffers float32 (1, n) preasignados y reutilizables entre peticiones
+
+    Cada buffer se entrega a un solo usuario a la vez, así que puede pasar de un
+    hilo a otro (extracción, escalado y predicción) sin copias.
+    """
+
+    def __init__(self, size, max_free=MAX_FREE_BUFFERS):
+        self.size = size
+        self.max_free = max_free
+        self._free = []
+        self._lock = threading.Lock()
+        self.allocated = 0
+
+    def acquire(self):
+        with self._lock:
+            if self._free:
+                return self._free.pop()
+            self.allocated += 1
+        return np.zeros((1, self.size), dtype=np.float32)
+
+    def release(self, buffer):
+        with self._lock:
+            if len(self._free) < self.max_free:
+                self._free.append(buffer)
+
+    @contextmanager
+    def borrow(self):
+        buffer = self.acquire()
+        try:
+            yield buffer
+        finally:
+            self.release(buffer)
+
+
+style_buffers = BufferPool(STYLE_TOTAL_FEATURES)
+opening_buffers = BufferPool(OPENING_TOTAL_FEATURES)
+
+_scaler_params = weakref.WeakKeyDictionary()
+
+
+def _float32_params(scaler):
+    """Media y escala del StandardScaler en float32, calculadas una sola vez por escalador"""
+    params = _scaler_params.get(scaler)
+    if params is None:
+        mean = scaler.mean_.astype(np.float32) if scaler.with_mean and scaler.mean_ is not None else None
+        scale = scaler.scale_.astype(np.float32) if scaler.with_std and scaler.scale_ is not None else None
+        params = (mean, scale)
+        _scaler_params[scaler] = params
+    return params
+
+
+def scale_in_place(scaler, features):
+    """Aplica la transformación del StandardScaler sobre el mismo buffer float32"""
+    mean, scale = _float32_params(scaler)
+    if mean is not None:
+        np.subtract(features, mean, out=features)
+    if scale is not None:
+        np.divide(features, scale, out=features)
+    return features
+
+
+def as_feature_buffer(features, size):
+    """Devuelve `features` como buffer float32 (1, size), sin copiar si ya lo es"""
+    features = np.asarray(features, dtype=np.float32)
+    if features.ndim == 1:
+        features = features.reshape(1, -1)
+    if features.shape[1] != size:
+        padded = np.zeros((features.shape[0], size), dtype=np.float32)
+        padded[:, :features.shape[1]] = features
+        features = padded
+    return features
@@ -0,0 +1,86 @@
+import os
+import threading
+import time
+
+# Tiempo máximo de un análisis completo, en segundos
+ANALYSIS_TIMEOUT = float(os.environ.get("OPEN_REPER_ANALYSIS_TIMEOUT", 10))
+
+TIMEOUT_ERROR = {
+    "status": "error",
+    "message": "El análisis ha tardado demasiado, inténtalo de nuevo en unos segundos"
+}
+
+CANCELLED_ERROR = {
+    "status": "cancelled",
+    "message": "El análisis se ha cancelado: se envió otra partida o se abandonó la página"
+}
+
+
+class AnalysisCancelled(Exception):
+    """Se lanza al comprobar un token cancelado o vencido; `error` es el dict que se devuelve"""
+
+    def __init__(self, error):
+        super().__init__(error["message"])
+        self.error = dict(error)
+
+
+class CancelToken:
+    """Token de cancelación con plazo para un trabajo de análisis
+
+    El trabajo llama a `check()` entre fases (lectura del PGN, cada jugada
+    reproducida, inferencia) y se detiene con `AnalysisCancelled`. El plazo usa
+    `time.monotonic`, que en Linux es común a todos los procesos, así que puede
+    viajar a un proceso de extracción como un simple número.
+    """
+
+    def __init__(self, deadline=None):
+        self.deadline = deadline
+        self._cancelled = threading.Event()
+        self._callbacks = []
+        self._lock = threading.Lock()
+
+    @classmethod
+    def with_timeout(cls, timeout=ANALYSIS_TIMEOUT):
+        return cls(time.monotonic() + timeout if timeout and timeout > 0 else None)
+
+    def cancel(self):
+        with self._lock:
+            if self._cancelled.is_set():
+                return
+            self._cancelled.set()
+            callbacks, self._callbacks = self._callbacks, []
+        for callback in callbacks:
+            callback()
+
+    def on_cancel(self, callback):
+        """Llama a `callback` al cancelar (o ya, si estaba cancelado)"""
+        with self._lock:
+            if not self._cancelled.is_set():
+                self._callbacks.append(callback)
+                return
+        callback()
+
+    @property
+    def cancelled(self):
+        return self._cancelled.is_set()
+
+    @property
+    def expired(self):
+        return self.deadline is not None and time.monotonic() >= self.deadline
+
+    def remaining(self):
+        """Segundos hasta el plazo (None si no tiene)"""
+        return None if self.deadline is None else max(self.deadline - time.monotonic(), 0.0)
+
+    def error(self):
+        """Error que corresponde al estado del token, o None si puede seguir"""
+        if self._cancelled.is_set():
+            return dict(CANCELLED_ERROR)
+        if self.expired:
+            return dict(TIMEOUT_ERROR)
+        return None
+
+    def check(self):
+        error = self.error()
+        if error:
+            raise AnalysisCancelled(error)
@@ -0,0 +1,237 @@
+import chess
+import io
+import os
+import numpy as np
+
+from models.features.attacks import AttackContext
+from models.features.bitboards import (
+    bishop_pair, king_safety, key_squares_control, material_balance, pieces_in_enemy_territory, piece_activity,
+    piece_mobility, sacrifice, space_advantage, tactical_opportunities
+)
+from models.features.cancellation import AnalysisCancelled
+from models.features.pawn_hash import pawn_hash
+from models.features.pgn_reader import mainline_tokens, read_mainline
+from models.features.position_cache import position_cache
+from models.features.replay import replay_mainline
+
+MOVES_TO_ANALYZE = 30
+STYLE_FEATURES_PER_MOVE = 12
+OPENING_FEATURES_PER_MOVE = 13
+STYLE_TOTAL_FEATURES = MOVES_TO_ANALYZE * STYLE_FEATURES_PER_MOVE
+OPENING_MOVE_FEATURES = MOVES_TO_ANALYZE * OPENING_FEATURES_PER_MOVE
+STYLE_CLASSES = 3
+OPENING_TOTAL_FEATURES = OPENING_MOVE_FEATURES + STYLE_CLASSES
+MIN_PLIES = 60
+# Jugadas que se leen del PGN: el mínimo exigido y la ventana de 30 jugadas de cada color
+PARSE_PLIES = max(MIN_PLIES, 2 * MOVES_TO_ANALYZE)
+# Límites de entrada: caracteres del texto pegado y medias jugadas de la línea principal
+MAX_PGN_LENGTH = int(os.environ.get("OPEN_REPER_MAX_PGN_LENGTH", 200000))
+MAX_PLIES = int(os.environ.get("OPEN_REPER_MAX_PLIES", 1000))
+# Cada cuántas jugadas analizadas se informa del progreso de la extracción
+PROGRESS_MOVES = 10
+
+INVALID_PGN_ERROR = {
+    "status": "error",
+    "message": "No se ha enviado un PGN válido"
+}
+TOO_SHORT_ERROR = {
+    "status": "error",
+    "message": "El PGN enviado debe contener un mínimo de 30 movimientos"
+}
+EXTRACTION_ERROR = {
+    "status": "error",
+    "message": "No se pudo extraer características del PGN"
+}
+TOO_LARGE_ERROR = {
+    "status": "error",
+    "message": "El PGN enviado supera el tamaño máximo permitido"
+}
+TOO_LONG_ERROR = {
+    "status": "error",
+    "message": f"El PGN enviado debe contener un máximo de {MAX_PLIES // 2} movimientos"
+}
+
+
+def position_features(board, previous_material, with_territory=False):
+    """Vector de 12 características (13 con campo enemigo) de una posición"""
+    pawns = pawn_hash.probe(
+        board.pawns & board.occupied_co[chess.WHITE],
+        board.pawns & board.occupied_co[chess.BLACK],
+        board.turn)
+    attacks = AttackContext(board, pawns.attacks)
+    features = [
+        material_balance(board),
+        king_safety(board, attacks),
+        pawns.structure,
+        piece_activity(board, attacks),
+        key_squares_control(board, attacks),
+        pawns.openness,
+        sacrifice(board, previous_material, attacks),
+        tactical_opportunities(board, attacks),
+        space_advantage(board, attacks),
+        piece_mobility(board, attacks),
+        pawns.passed_count,
+        bishop_pair(board)
+    ]
+    if with_territory:
+        features.append(pieces_in_enemy_territory(board))
+    return features
+
+
+def scan_pgn(pgn_text):
+    """Validación léxica previa al parseo completo. Devuelve (error o None, tokens, cabeceras)
+
+    Rechaza textos vacíos, demasiado grandes o sin jugadas y partidas cortas
+    o demasiado largas contando tokens, sin reproducir la partida. Los tokens
+    de jugada y las cabeceras leídos sirven después para la clave de la caché.
+    """
+    headers = {}
+    # --- Validación 1: Input vacío o texto no válido ---
+    if not pgn_text or not isinstance(pgn_text, str) or pgn_text.isspace():
+        return dict(INVALID_PGN_ERROR), [], headers
+
+    if len(pgn_text) > MAX_PGN_LENGTH:
+        return dict(TOO_LARGE_ERROR), [], headers
+
+    try:
+        tokens = mainline_tokens(pgn_text, headers, MAX_PLIES + 1)
+        if not tokens:
+            return dict(INVALID_PGN_ERROR), tokens, headers
+        if len(tokens) > MAX_PLIES:
+            return dict(TOO_LONG_ERROR), tokens, headers
+        if len(tokens) < MIN_PLIES:
+            # Partida corta: solo falta saber si la primera jugada es legal
+            game = read_mainline(io.StringIO(pgn_text), max_plies=1)
+            error = TOO_SHORT_ERROR if game and game.mainline_moves() else INVALID_PGN_ERROR
+            return dict(error), tokens, headers
+    except:
+        return dict(INVALID_PGN_ERROR), [], headers
+
+    return None, tokens, headers
+
+
+def prevalidate_pgn(pgn_text):
+    """Error de la validación léxica de `scan_pgn`, o None"""
+    return scan_pgn(pgn_text)[0]
+
+
+def read_pgn(pgn_text, validated=False):
+    """Valida y parsea un PGN. Devuelve (partida, None) o (None, error).
+    Con `validated` se omite la validación léxica porque ya la hizo quien llama"""
+    # --- Validación 1: Validación léxica sin parsear jugadas ---
+    error = None if validated else prevalidate_pgn(pgn_text)
+    if error:
+        return None, error
+
+    # --- Validación 2: Verificar formato PGN válido ---
+    # Solo se lee la línea principal y hasta las jugadas que se necesitan
+    try:
+        game = read_mainline(io.StringIO(pgn_text), max_plies=PARSE_PLIES)
+        if not game or not game.mainline_moves():
+            raise ValueError("Formato PGN inválido")
+    except:
+        return None, dict(INVALID_PGN_ERROR)
+
+    # --- Validación 3: Mínimo de movimientos ---
+    if game.plies < MIN_PLIES:
+        return None, dict(TOO_SHORT_ERROR)
+
+    return game, None
+
+
+def parse_color(color):
+    """Convierte 'white'/'black' al color de python-chess"""
+    return chess.WHITE if color.lower() == 'white' else chess.BLACK
+
+
+def extract_move_features(game, color, token=None, progress=None):
+    """Reproduce la línea principal una sola vez y devuelve una fila de 13 características
+    por cada jugada analizada del color indicado. Con `token` se comprueba la cancelación en cada jugada
+    y `progress("plies", n)` se llama cada PROGRESS_MOVES jugadas analizadas"""
+    rows = []
+    previous_material = 0
+
+    for board in replay_mainline(game):
+        if token is not None:
+            token.check()
+        if board.turn != color:
+            continue
+
+        # Las aperturas populares repiten posiciones entre partidas: se consulta la caché primero
+        key = (board.key, previous_material)
+        cached = position_cache.get(key)
+        if cached is None:
+            row = tuple(position_features(board, previous_material, with_territory=True))
+            material = board.material[board.turn]
+            position_cache.put(key, (row, material))
+        else:
+            row, material = cached
+
+        rows.append(row)
+        previous_material = material
+        if progress is not None and len(rows) % PROGRESS_MOVES == 0:
+            progress("plies", len(rows))
+        if len(rows) >= MOVES_TO_ANALYZE:
+            break
+
+    return rows
+
+
+def write_style_features(rows, out):
+    """Escribe las 12 primeras características de cada jugada en el buffer (1, 360)"""
+    moves = out.reshape(MOVES_TO_ANALYZE, STYLE_FEATURES_PER_MOVE)
+    analyzed = len(rows)
+    if analyzed:
+        moves[:analyzed] = [row[:STYLE_FEATURES_PER_MOVE] for row in rows]
+    moves[analyzed:] = 0
+    return out
+
+
+def write_opening_features(rows, out):
+    """Escribe las 13 características de cada jugada en el buffer (1, 393) y deja ceros detrás.
+    Devuelve la posición donde empieza el one-hot de estilo (justo después de la última jugada)"""
+    moves = out[0, :OPENING_MOVE_FEATURES].reshape(MOVES_TO_ANALYZE, OPENING_FEATURES_PER_MOVE)
+    analyzed = len(rows)
+    if analyzed:
+        moves[:analyzed] = rows
+    style_offset = analyzed * OPENING_FEATURES_PER_MOVE
+    out[0, style_offset:] = 0
+    return style_offset
+
+
+def analyze_pgn(pgn_text, color, style_out=None, opening_out=None, token=None, progress=None, validated=False):
+    """Parsea y reproduce la partida una sola vez para ambos modelos.
+    Las características se escriben en los buffers float32 recibidos (o en buffers nuevos).
+    Con `token` (CancelToken) se devuelve su error si se cancela o vence antes de terminar;
+    `progress(etapa, detalle)` recibe "parsed" y "plies" a medida que avanza.
+    `validated` indica que el texto ya pasó por `scan_pgn`"""
+    if token is not None and token.error():
+        return token.error()
+    game, error = read_pgn(pgn_text, validated)
+    if error:
+        return error
+
+    if progress is not None:
+        progress("parsed", game.plies)
+
+    try:
+        if token is not None:
+            token.check()
+        rows = extract_move_features(game, parse_color(color), token, progress)
+        if style_out is None:
+            style_out = np.zeros((1, STYLE_TOTAL_FEATURES), dtype=np.float32)
+        if opening_out is None:
+            opening_out = np.zeros((1, OPENING_TOTAL_FEATURES), dtype=np.float32)
+        write_style_features(rows, style_out)
+        write_opening_features(rows, opening_out)
+    except AnalysisCancelled as e:
+        return e.error
+    except Exception as e:
+        print(f"Error en extracción: {str(e)}")
+        return dict(EXTRACTION_ERROR)
+
+    return {
+        "status": "success",
+        "style_features": style_out,
+        "opening_features": opening_out
+    }
@@ -0,0 +1,69 @@
+import chess
+import os
+
+from models.features.bitboards import forward_passed_count, open_files, pawn_attacks, pawn_structure_score
+
+# Número de entradas (se redondea a potencia de dos)
+PAWN_HASH_SIZE = int(os.environ.get("OPEN_REPER_PAWN_HASH_SIZE", 16384))
+
+
+class PawnEntry:
+    """Características que dependen solo de los peones y del turno"""
+
+    __slots__ = ("structure", "passed_count", "openness", "attacks")
+
+    def __init__(self, white_pawns, black_pawns, turn):
+        own, enemy = (white_pawns, black_pawns) if turn == chess.WHITE else (black_pawns, white_pawns)
+        self.structure = pawn_structure_score(own, enemy, turn)
+        self.passed_count = forward_passed_count(own, enemy) / 8
+        self.openness = open_files(white_pawns | black_pawns)
+        # Casillas atacadas por los peones, indexadas por color
+        self.attacks = (pawn_attacks(black_pawns, chess.BLACK), pawn_attacks(white_pawns, chess.WHITE))
+
+
+class PawnHashTable:
+    """Tabla hash de peones de tamaño fijo, indexada por (peones blancos, peones negros, turno)
+
+    Como en los motores clásicos, cada clave cae en una sola ranura y una
+    entrada nueva reemplaza a la anterior, así que la memoria queda acotada.
+    """
+
+    def __init__(self, size=PAWN_HASH_SIZE):
+        self.size = 1 << max(size - 1, 1).bit_length()
+        self._mask = self.size - 1
+        self._slots = [None] * self.size
+        self.hits = 0
+        self.misses = 0
+
+    def probe(self, white_pawns, black_pawns, turn):
+        """Devuelve la entrada de la estructura, calculándola si no está en la tabla"""
+        key = (white_pawns, black_pawns, turn)
+        index = hash(key) & self._mask
+        slot = self._slots[index]
+        if slot is not None and slot[0] == key:
+            self.hits += 1
+            return slot[1]
+
+        self.misses += 1
+        entry = PawnEntry(white_pawns, black_pawns, turn)
+        # Clave y entrada se guardan juntas para que la escritura sea atómica entre hilos
+        self._slots[index] = (key, entry)
+        return entry
+
+    def clear(self):
+        self._slots = [None] * self.size
+        self.hits = 0
+        self.misses = 0
+
+    def stats(self):
+        total = self.hits + self.misses
+        return {
+            "size": self.size,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / total if total else 0.0
+        }
+
+
+# Tabla compartida por el detector de estilo y el recomendador
+pawn_hash = PawnHashTable()
@@ -0,0 +1,136 @@
+import chess.pgn
+
+
+class _EnoughPlies(Exception):
+    """Corta el parseo en cuanto se tienen las jugadas necesarias"""
+
+
+class MainlineGame:
+    """Partida reducida a su posición inicial y a las jugadas de la línea principal
+
+    Expone `board()` y `mainline_moves()` como `chess.pgn.Game`, que es todo
+    lo que usa la extracción de características.
+    """
+
+    def __init__(self, start_board, moves, errors):
+        self._start_board = start_board
+        self.moves = moves
+        self.errors = errors
+
+    def board(self):
+        return self._start_board.copy(stack=False)
+
+    def mainline_moves(self):
+        return self.moves
+
+    @property
+    def plies(self):
+        return len(self.moves)
+
+
+class MainlineVisitor(chess.pgn.BaseVisitor):
+    """Visitante que solo recoge la línea principal
+
+    Ignora comentarios ([%eval], [%clk]), NAGs y variantes sin construir el
+    árbol de nodos, cuenta las jugadas en la misma pasada y se detiene al
+    llegar a `max_plies`. Los errores de SAN se guardan en lugar de lanzarse,
+    igual que con el lector por defecto.
+    """
+
+    def __init__(self, max_plies=None):
+        self.max_plies = max_plies
+        self.start_board = None
+        self.moves = []
+        self.errors = []
+
+    def visit_board(self, board):
+        # La primera llamada es la posición inicial (respeta la cabecera FEN)
+        if self.start_board is None:
+            self.start_board = board.copy(stack=False)
+
+    def begin_variation(self):
+        return chess.pgn.SKIP
+
+    def visit_move(self, board, move):
+        self.moves.append(move)
+        if self.max_plies is not None and len(self.moves) >= self.max_plies:
+            raise _EnoughPlies()
+
+    def handle_error(self, error):
+        self.errors.append(error)
+
+    def result(self):
+        if self.start_board is None:
+            return None
+        return MainlineGame(self.start_board, self.moves, self.errors)
+
+
+def read_mainline(handle, max_plies=None):
+    """Lee la línea principal de la siguiente partida de `handle`, o None si no hay partida.
+    Con `max_plies` deja de leer al alcanzar ese número de jugadas"""
+    visitor = MainlineVisitor(max_plies)
+    try:
+        return chess.pgn.read_game(handle, Visitor=lambda: visitor)
+    except _EnoughPlies:
+        return visitor.result()
+
+
+def mainline_tokens(pgn_text, headers=None, limit=None):
+    """Tokens de jugada (SAN) de la línea principal de la primera partida, sin parsearlos
+
+    Validación léxica que no toca python-chess más allá de sus expresiones
+    regulares: sigue la tokenización de `chess.pgn.read_game`, y comentarios,
+    variantes, NAGs y resultados no cuentan. Si se pasa `headers`, guarda ahí
+    las etiquetas de cabecera. Con `limit` deja de leer al llegar a ese número de tokens.
+    """
+    tokens = []
+    depth = 0
+    in_comment = False
+    in_movetext = False
+    for line in pgn_text.lstrip("\ufeff").splitlines():
+        position = 0
+        if in_comment:
+            position = line.find("}") + 1
+            if not position:
+                continue
+            in_comment = False
+        elif not in_movetext:
+            if line.startswith("[") and headers is not None:
+                tag = chess.pgn.TAG_REGEX.match(line)
+                if tag:
+                    headers[tag.group(1)] = tag.group(2)
+            if not line or line.isspace() or line.startswith(("[", "%", ";")):
+                continue
+            in_movetext = True
+        elif not line or line.isspace():
+            # Una línea vacía cierra la partida
+            break
+        elif line.startswith(("%", ";")):
+            continue
+
+        while True:
+            match = chess.pgn.MOVETEXT_REGEX.search(line, position)
+            if match is None:
+                break
+            token = match.group(0)
+            position = match.end()
+            if token.startswith("{"):
+                position = line.find("}", match.start()) + 1
+                if not position:
+                    in_comment = True
+                    break
+            elif token.startswith(";"):
+                break
+            elif token == "(":
+                # Antes de la primera jugada no hay variante que abrir
+                if depth or tokens:
+                    depth += 1
+            elif token == ")":
+                depth = max(depth - 1, 0)
+            elif depth or match.group(1) is None:
+                continue
+            else:
+                tokens.append(token)
+                if limit is not None and len(tokens) >= limit:
+                    return tokens
+    return tokens
@@ -0,0 +1,112 @@
+import chess
+import chess.polyglot
+import os
+import sys
+import threading
+from collections import OrderedDict
+
+# Memoria máxima de la caché de posiciones, en MB
+FEATURE_CACHE_MB = float(os.environ.get("OPEN_REPER_FEATURE_CACHE_MB", 64))
+
+# Claves Zobrist de Polyglot: 12 tablas de 64 casillas y una para el turno de las blancas
+ZOBRIST_PIECES = chess.polyglot.POLYGLOT_RANDOM_ARRAY[:768]
+ZOBRIST_WHITE_TURN = chess.polyglot.POLYGLOT_RANDOM_ARRAY[780]
+
+
+def zobrist_piece_key(piece_type, color, square):
+    """Clave Zobrist de una pieza en una casilla"""
+    return ZOBRIST_PIECES[64 * ((piece_type - 1) * 2 + int(color)) + square]
+
+
+def position_key(board):
+    """Hash Zobrist de la colocación de piezas y el turno
+
+    Enroques y captura al paso no afectan a las características, así que no
+    forman parte de la clave y más posiciones comparten entrada.
+    """
+    key = ZOBRIST_WHITE_TURN if board.turn == chess.WHITE else 0
+    piece_sets = (board.pawns, board.knights, board.bishops, board.rooks, board.queens, board.kings)
+    for piece_index, bb in enumerate(piece_sets):
+        for color in (chess.BLACK, chess.WHITE):
+            base = 64 * (piece_index * 2 + int(color))
+            pieces = bb & board.occupied_co[color]
+            while pieces:
+                bb_square = pieces & -pieces
+                key ^= ZOBRIST_PIECES[base + bb_square.bit_length() - 1]
+                pieces ^= bb_square
+    return key
+
+
+def _entry_size(features_per_row=13):
+    """Estimación en bytes de una entrada (clave, fila de características y material)"""
+    row = tuple(0.1 * i for i in range(features_per_row))
+    key = (1 << 63, 12.3)
+    value = (row, 45.6)
+    ordered_dict_overhead = 100
+    return (sys.getsizeof(key) + sum(sys.getsizeof(k) for k in key) +
+            sys.getsizeof(value) + sys.getsizeof(row) + sum(sys.getsizeof(v) for v in row) +
+            sys.getsizeof(value[1]) + ordered_dict_overhead)
+
+
+class PositionFeatureCache:
+    """Caché LRU de filas de características por posición, compartida en todo el proceso
+
+    La clave es (hash Zobrist, material previo): el material previo es la única
+    entrada de `_sacrifice_detection` que no sale de la propia posición.
+    """
+
+    def __init__(self, max_mb=FEATURE_CACHE_MB):
+        self.entry_bytes = _entry_size()
+        self.max_entries = max(int(max_mb * 1024 * 1024) // self.entry_bytes, 0)
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key):
+        with self._lock:
+            value = self._entries.get(key)
+            if value is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def put(self, key, value):
+        if not self.max_entries:
+            return
+        with self._lock:
+            self._entries[key] = value
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def resize(self, max_mb):
+        """Cambia el techo de memoria, descartando las entradas más antiguas si hace falta"""
+        with self._lock:
+            self.max_entries = max(int(max_mb * 1024 * 1024) // self.entry_bytes, 0)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self.hits = 0
+            self.misses = 0
+
+    def stats(self):
+        with self._lock:
+            total = self.hits + self.misses
+            return {
+                "entries": len(self._entries),
+                "max_entries": self.max_entries,
+                "approx_mb": len(self._entries) * self.entry_bytes / (1024 * 1024),
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": self.hits / total if total else 0.0
+            }
+
+
+# Caché compartida por el detector de estilo y el recomendador
+position_cache = PositionFeatureCache()
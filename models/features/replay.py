@@ -0,0 +1,128 @@
+import chess
+
+from models.features.bitboards import material_from_counts
+from models.features.position_cache import ZOBRIST_WHITE_TURN, position_key, zobrist_piece_key
+
+# Atributos de bitboard por tipo de pieza, igual que en `chess.BaseBoard`
+PIECE_ATTRIBUTES = (None, "pawns", "knights", "bishops", "rooks", "queens", "kings")
+
+
+class ReplayBoard:
+    """Tablero mínimo para reproducir líneas principales ya validadas
+
+    Solo mantiene lo que usan las características: bitboards por tipo y color,
+    turno, número de piezas, material por bando y clave Zobrist, todo de forma
+    incremental. No guarda pila de jugadas, enroques ni repeticiones, así que
+    las jugadas deben venir de `chess.pgn` (legales en la posición).
+    """
+
+    __slots__ = ("pawns", "knights", "bishops", "rooks", "queens", "kings",
+                 "occupied_co", "occupied", "turn", "counts", "material", "key", "_piece_types")
+
+    def __init__(self, board):
+        self.pawns = board.pawns
+        self.knights = board.knights
+        self.bishops = board.bishops
+        self.rooks = board.rooks
+        self.queens = board.queens
+        self.kings = board.kings
+        self.occupied_co = [board.occupied_co[chess.BLACK], board.occupied_co[chess.WHITE]]
+        self.occupied = board.occupied
+        self.turn = board.turn
+        self.key = position_key(board)
+
+        # Tipo de pieza por casilla y número de piezas por [color][tipo]
+        self._piece_types = [board.piece_type_at(square) for square in chess.SQUARES]
+        self.counts = [[0] * 7, [0] * 7]
+        for square, piece_type in enumerate(self._piece_types):
+            if piece_type:
+                self.counts[bool(board.occupied_co[chess.WHITE] & chess.BB_SQUARES[square])][piece_type] += 1
+        self.material = [material_from_counts(self.counts[chess.BLACK]), material_from_counts(self.counts[chess.WHITE])]
+
+    def _toggle(self, piece_type, color, square):
+        """Pone o quita una pieza de los bitboards y de la clave Zobrist"""
+        bb_square = chess.BB_SQUARES[square]
+        attribute = PIECE_ATTRIBUTES[piece_type]
+        setattr(self, attribute, getattr(self, attribute) ^ bb_square)
+        self.occupied_co[color] ^= bb_square
+        self.occupied ^= bb_square
+        self.key ^= zobrist_piece_key(piece_type, color, square)
+
+    def _capture(self, piece_type, color, square):
+        self._toggle(piece_type, color, square)
+        self._piece_types[square] = None
+        self.counts[color][piece_type] -= 1
+        self.material[color] = material_from_counts(self.counts[color])
+
+    def push(self, move):
+        """Aplica una jugada legal (o nula) y cambia el turno"""
+        color = self.turn
+        self.turn = not color
+        self.key ^= ZOBRIST_WHITE_TURN
+        if not move:
+            return
+
+        from_square, to_square = move.from_square, move.to_square
+        piece_type = self._piece_types[from_square]
+        captured = self._piece_types[to_square]
+
+        # Enroque: rey dos columnas o rey sobre su propia torre
+        if piece_type == chess.KING and (
+                abs(from_square - to_square) == 2 or
+                (captured and self.occupied_co[color] & chess.BB_SQUARES[to_square])):
+            self._castle(color, from_square, to_square)
+            return
+
+        if captured:
+            self._capture(captured, not color, to_square)
+        elif piece_type == chess.PAWN and (from_square - to_square) % 8:
+            # Captura al paso: el peón capturado está detrás de la casilla de llegada
+            self._capture(chess.PAWN, not color, to_square - 8 if color == chess.WHITE else to_square + 8)
+
+        self._toggle(piece_type, color, from_square)
+        self._piece_types[from_square] = None
+        if move.promotion:
+            self.counts[color][chess.PAWN] -= 1
+            self.counts[color][move.promotion] += 1
+            self.material[color] = material_from_counts(self.counts[color])
+            piece_type = move.promotion
+        self._toggle(piece_type, color, to_square)
+        self._piece_types[to_square] = piece_type
+
+    def _castle(self, color, king_from, to_square):
+        rank = chess.square_rank(king_from)
+        if self._piece_types[to_square] == chess.ROOK and self.occupied_co[color] & chess.BB_SQUARES[to_square]:
+            rook_from = to_square
+        else:
+            rook_from = chess.square(7 if to_square > king_from else 0, rank)
+        short = rook_from > king_from
+        king_to = chess.square(6 if short else 2, rank)
+        rook_to = chess.square(5 if short else 3, rank)
+
+        self._toggle(chess.KING, color, king_from)
+        self._toggle(chess.ROOK, color, rook_from)
+        self._piece_types[king_from] = None
+        self._piece_types[rook_from] = None
+        self._toggle(chess.KING, color, king_to)
+        self._toggle(chess.ROOK, color, rook_to)
+        self._piece_types[king_to] = chess.KING
+        self._piece_types[rook_to] = chess.ROOK
+
+
+def replay_mainline(game):
+    """Reproduce la línea principal y devuelve un `ReplayBoard` tras cada jugada
+
+    Las variantes (Chess960, crazyhouse, atómico...) tienen reglas propias de
+    movimiento, así que se reproducen con `chess.Board.push` y se reconstruye
+    el tablero ligero en cada jugada.
+    """
+    board = game.board()
+    if type(board) is chess.Board and not board.chess960:
+        replay = ReplayBoard(board)
+        for move in game.mainline_moves():
+            replay.push(move)
+            yield replay
+    else:
+        for move in game.mainline_moves():
+            board.push(move)
+            yield ReplayBoard(board)
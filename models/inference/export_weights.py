@@ -0,0 +1,84 @@
+import joblib
+import numpy as np
+import sys
+
+# Modelos del proyecto: (modelo Keras, metadatos con el escalador, pesos exportados)
+MODELS = {
+    "style": (
+        "models/style_detector/chess_model.keras",
+        "models/style_detector/chess_model_data.joblib",
+        "models/style_detector/chess_model.npz"
+    ),
+    "opening": (
+        "models/opening_recommender/opening_recommender_model.keras",
+        "models/opening_recommender/opening_recommender_model_metadata.joblib",
+        "models/opening_recommender/opening_recommender_model.npz"
+    )
+}
+
+
+def dense_layers(model):
+    """Pesos y activación de cada capa Dense. Dropout no interviene en inferencia"""
+    layers = []
+    for layer in model.layers:
+        kind = type(layer).__name__
+        if kind in ("Dropout", "InputLayer"):
+            continue
+        if kind != "Dense":
+            raise ValueError(f"Capa no soportada por el motor NumPy: {kind}")
+        kernel, bias = layer.get_weights()
+        layers.append((kernel.astype(np.float64), bias.astype(np.float64), layer.activation.__name__))
+    return layers
+
+
+def fold_scaler(kernel, bias, scaler):
+    """Pliega `(x - mean) / scale` en la primera capa: W' = W / scale, b' = b - (mean / scale) @ W"""
+    mean = scaler.mean_ if scaler.with_mean and scaler.mean_ is not None else np.zeros(kernel.shape[0])
+    scale = scaler.scale_ if scaler.with_std and scaler.scale_ is not None else np.ones(kernel.shape[0])
+    folded_kernel = kernel / scale[:, None]
+    folded_bias = bias - (mean / scale) @ kernel
+    return folded_kernel, folded_bias
+
+
+def export_weights(model, scaler, output_path):
+    """Guarda las capas densas del modelo en un .npz con el escalador plegado"""
+    layers = dense_layers(model)
+    kernel, bias, activation = layers[0]
+    layers[0] = (*fold_scaler(kernel, bias, scaler), activation)
+
+    arrays = {"activations": np.array([activation for _, _, activation in layers])}
+    for i, (kernel, bias, _) in enumerate(layers):
+        arrays[f"kernel_{i}"] = kernel.astype(np.float32)
+        arrays[f"bias_{i}"] = bias.astype(np.float32)
+    np.savez(output_path, **arrays)
+    return output_path
+
+
+def max_difference(model, scaler, output_path, samples=256, seed=0):
+    """Máxima diferencia de probabilidades entre Keras y el motor NumPy con entradas aleatorias"""
+    from models.inference.numpy_engine import NumpyDenseModel
+
+    engine = NumpyDenseModel.load(output_path)
+    rng = np.random.default_rng(seed)
+    mean = scaler.mean_ if scaler.mean_ is not None else 0
+    scale = scaler.scale_ if scaler.scale_ is not None else 1
+    features = (rng.standard_normal((samples, engine.input_size)) * scale + mean).astype(np.float32)
+    expected = model.predict(scaler.transform(features), verbose=0)
+    return float(np.abs(engine.predict(features) - expected).max())
+
+
+def export_model(name):
+    from tensorflow.keras.models import load_model
+
+    keras_path, metadata_path, output_path = MODELS[name]
+    model = load_model(keras_path)
+    scaler = joblib.load(metadata_path)["scaler"]
+    export_weights(model, scaler, output_path)
+    print(f"Pesos exportados en {output_path} (diferencia máxima con Keras: "
+          f"{max_difference(model, scaler, output_path):.2e})")
+
+
+if __name__ == "__main__":
+    # Uso: python -m models.inference.export_weights [style] [opening]
+    for name in sys.argv[1:] or MODELS:
+        export_model(name)
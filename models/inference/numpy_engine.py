@@ -0,0 +1,245 @@
+import numpy as np
+import os
+import shutil
+
+# Motor de inferencia: 'numpy' usa los pesos exportados si existen, 'keras' fuerza TensorFlow
+INFERENCE_BACKEND = os.environ.get("OPEN_REPER_INFERENCE", "numpy").lower()
+# Precisión de los pesos en memoria: 'float32', 'float16' o 'int8' (por canal); se acumula en float32
+WEIGHT_PRECISION = os.environ.get("OPEN_REPER_WEIGHT_PRECISION", "float32").lower()
+PRECISIONS = ("float32", "float16", "int8")
+# Pesos en archivos .npy mapeados en memoria (solo lectura), compartidos entre procesos.
+# Solo sirve con carga previa al fork: por defecto sigue a OPEN_REPER_PREFORK
+WEIGHTS_MMAP = os.environ.get("OPEN_REPER_WEIGHTS_MMAP", os.environ.get("OPEN_REPER_PREFORK", "0")) != "0"
+# Raíz del repositorio: las rutas relativas no dependen del directorio de trabajo
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+# Directorio de datos generados (los .npy mapeados van en `weights/`); nunca dentro de models/
+CACHE_DIR = os.path.join(ROOT_DIR, os.environ.get("OPEN_REPER_CACHE_DIR", ".cache"))
+# Filas de un kernel float16/int8 que se amplían a float32 a la vez (el bloque cabe en caché)
+KERNEL_BLOCK_ROWS = 128
+
+
+def _relu(x):
+    return np.maximum(x, 0, out=x)
+
+
+def _softmax(x):
+    x -= x.max(axis=-1, keepdims=True)
+    np.exp(x, out=x)
+    x /= x.sum(axis=-1, keepdims=True)
+    return x
+
+
+def _sigmoid(x):
+    np.negative(x, out=x)
+    np.exp(x, out=x)
+    x += 1
+    return np.reciprocal(x, out=x)
+
+
+def _linear(x):
+    return x
+
+
+ACTIVATIONS = {
+    "relu": _relu,
+    "softmax": _softmax,
+    "sigmoid": _sigmoid,
+    "tanh": lambda x: np.tanh(x, out=x),
+    "linear": _linear
+}
+
+
+def block_matmul(x, kernel, block_rows=KERNEL_BLOCK_ROWS):
+    """`x @ kernel` con un kernel float16/int8 sin ampliarlo entero a float32
+
+    NumPy no tiene productos en int8 ni float16 con acumulación en float32: el
+    kernel se recorre por bloques de filas que se amplían en un buffer pequeño y
+    se acumulan en float32. En memoria (y en el mapeo) solo viven los pesos
+    reducidos, y de RAM solo se leen esos bytes.
+    """
+    if kernel.dtype == np.float32:
+        return x @ kernel
+    rows, columns = kernel.shape
+    out = np.zeros((x.shape[0], columns), dtype=np.float32)
+    partial = np.empty_like(out)
+    widened = np.empty((min(block_rows, rows), columns), dtype=np.float32)
+    for start in range(0, rows, block_rows):
+        block = kernel[start:start + block_rows]
+        np.copyto(widened[:len(block)], block, casting="unsafe")
+        np.matmul(x[:, start:start + len(block)], widened[:len(block)], out=partial)
+        out += partial
+    return out
+
+
+def quantize_kernel(kernel, precision):
+    """Devuelve (pesos, escala por fila o None, escala por columna o None) en la precisión indicada
+
+    En int8 primero se igualan las filas (el escalador plegado deja entradas con
+    pesos cientos de veces mayores que el resto) y después cada columna (neurona
+    de salida) usa su propia escala simétrica: `kernel ≈ fila * pesos * columna`.
+    """
+    kernel = np.asarray(kernel, dtype=np.float32)
+    if precision == "float32":
+        return np.ascontiguousarray(kernel), None, None
+    if precision == "float16":
+        return np.ascontiguousarray(kernel, dtype=np.float16), None, None
+    if precision == "int8":
+        row_scale = np.abs(kernel).max(axis=1)
+        row_scale[row_scale == 0] = 1
+        equalized = kernel / row_scale[:, None]
+        column_scale = np.abs(equalized).max(axis=0) / 127
+        column_scale[column_scale == 0] = 1
+        quantized = np.clip(np.rint(equalized / column_scale), -127, 127).astype(np.int8)
+        return np.ascontiguousarray(quantized), row_scale.astype(np.float32), column_scale.astype(np.float32)
+    raise ValueError(f"Precisión no soportada: {precision}. Opciones: {list(PRECISIONS)}")
+
+
+class NumpyDenseModel:
+    """Red densa exportada de Keras que se evalúa solo con NumPy
+
+    Sustituye a `model.predict` sin TensorFlow. El `StandardScaler` ya está
+    plegado en la primera capa, así que recibe las características sin escalar
+    (`scaler_folded`). Los pesos pueden guardarse en float16 o int8 para
+    reducir memoria; se multiplican en esa precisión por bloques (`block_matmul`)
+    y siempre se acumula en float32.
+    """
+
+    scaler_folded = True
+
+    def __init__(self, kernels, biases, activations, precision="float32"):
+        self.precision = precision
+        self.kernels = []
+        self.row_scales = []
+        self.column_scales = []
+        for kernel in kernels:
+            weights, row_scale, column_scale = quantize_kernel(kernel, precision)
+            self.kernels.append(weights)
+            self.row_scales.append(row_scale)
+            self.column_scales.append(column_scale)
+        self.biases = [np.asarray(bias, dtype=np.float32) for bias in biases]
+        self.activations = [ACTIVATIONS[name] for name in activations]
+        self.activation_names = list(activations)
+
+    @classmethod
+    def load(cls, path, precision=None):
+        """Carga los pesos guardados por `models.inference.export_weights`"""
+        with np.load(path, allow_pickle=False) as weights:
+            activations = [str(name) for name in weights["activations"]]
+            kernels = [weights[f"kernel_{i}"] for i in range(len(activations))]
+            biases = [weights[f"bias_{i}"] for i in range(len(activations))]
+        return cls(kernels, biases, activations, precision or WEIGHT_PRECISION)
+
+    def save_arrays(self, directory):
+        """Guarda cada array ya cuantizado en su propio .npy para poder mapearlo"""
+        os.makedirs(directory, exist_ok=True)
+        np.save(os.path.join(directory, "activations.npy"), np.array(self.activation_names))
+        for i, (kernel, row_scale, column_scale, bias) in enumerate(
+                zip(self.kernels, self.row_scales, self.column_scales, self.biases)):
+            np.save(os.path.join(directory, f"kernel_{i}.npy"), kernel)
+            np.save(os.path.join(directory, f"bias_{i}.npy"), bias)
+            if row_scale is not None:
+                np.save(os.path.join(directory, f"row_scale_{i}.npy"), row_scale)
+                np.save(os.path.join(directory, f"column_scale_{i}.npy"), column_scale)
+
+    @classmethod
+    def load_arrays(cls, directory, precision):
+        """Abre los .npy de `save_arrays` mapeados en memoria y de solo lectura.
+        Las páginas vienen del archivo, así que los procesos las comparten sin copiarlas"""
+        def mapped(name):
+            path = os.path.join(directory, f"{name}.npy")
+            if not os.path.exists(path):
+                return None
+            return np.load(path, mmap_mode="r", allow_pickle=False).view(np.ndarray)
+
+        model = cls.__new__(cls)
+        model.precision = precision
+        model.activation_names = [str(name) for name in np.load(os.path.join(directory, "activations.npy"))]
+        model.activations = [ACTIVATIONS[name] for name in model.activation_names]
+        layers = range(len(model.activation_names))
+        model.kernels = [mapped(f"kernel_{i}") for i in layers]
+        model.biases = [mapped(f"bias_{i}") for i in layers]
+        model.row_scales = [mapped(f"row_scale_{i}") for i in layers]
+        model.column_scales = [mapped(f"column_scale_{i}") for i in layers]
+        return model
+
+    @property
+    def input_size(self):
+        return self.kernels[0].shape[0]
+
+    @property
+    def weight_bytes(self):
+        """Memoria ocupada por pesos, escalas y sesgos"""
+        scales = [s for s in self.row_scales + self.column_scales if s is not None]
+        return sum(k.nbytes for k in self.kernels) + sum(s.nbytes for s in scales) + sum(b.nbytes for b in self.biases)
+
+    def predict(self, features, verbose=0):
+        """Probabilidades por clase para un lote (n, entradas), igual que `keras.Model.predict`"""
+        x = np.asarray(features, dtype=np.float32)
+        if x.ndim == 1:
+            x = x.reshape(1, -1)
+        layers = zip(self.kernels, self.row_scales, self.column_scales, self.biases, self.activations)
+        for kernel, row_scale, column_scale, bias, activation in layers:
+            if row_scale is not None:
+                x = x * row_scale
+            x = block_matmul(x, kernel)
+            if column_scale is not None:
+                x *= column_scale
+            x += bias
+            x = activation(x)
+        return x
+
+
+def has_exported_weights(filename):
+    """True si el modelo se servirá con el motor NumPy"""
+    return INFERENCE_BACKEND != "keras" and os.path.exists(f"{filename}.npz")
+
+
+def _remove_stale_staging(directory):
+    # Directorios a medio escribir de procesos que murieron antes de renombrarlos
+    for name in os.listdir(directory):
+        if not name.endswith(".tmp"):
+            continue
+        try:
+            pid = int(name.rsplit(".", 2)[-2])
+            os.kill(pid, 0)
+        except ProcessLookupError:
+            shutil.rmtree(os.path.join(directory, name), ignore_errors=True)
+        except (ValueError, PermissionError):
+            pass
+
+
+def _mapped_model(path, precision, cache_dir=None):
+    """Modelo con los pesos de `path` mapeados; los .npy se generan en el directorio de caché
+    una vez por versión del .npz"""
+    stat = os.stat(path)
+    name = os.path.splitext(os.path.basename(path))[0]
+    root = os.path.join(cache_dir or CACHE_DIR, "weights")
+    directory = os.path.join(root, f"{name}-{precision}-{int(stat.st_mtime)}-{stat.st_size}")
+    if not os.path.exists(directory):
+        os.makedirs(root, exist_ok=True)
+        _remove_stale_staging(root)
+        # Se escribe aparte y se renombra para que otro proceso no lea a medias
+        staging = f"{directory}.{os.getpid()}.tmp"
+        try:
+            NumpyDenseModel.load(path, precision).save_arrays(staging)
+            os.rename(staging, directory)
+        except OSError:
+            if not os.path.exists(directory):
+                raise
+        finally:
+            shutil.rmtree(staging, ignore_errors=True)
+    return NumpyDenseModel.load_arrays(directory, precision)
+
+
+def load_inference_model(filename):
+    """Carga `{filename}.npz` con el motor NumPy, o None si no hay pesos exportados
+    o se ha pedido Keras con OPEN_REPER_INFERENCE=keras"""
+    if not has_exported_weights(filename):
+        return None
+    path = f"{filename}.npz"
+    if WEIGHTS_MMAP:
+        try:
+            return _mapped_model(path, WEIGHT_PRECISION)
+        except OSError as e:
+            print(f"No se pudieron mapear los pesos de {path}: {str(e)}")
+    return NumpyDenseModel.load(path)
@@ -0,0 +1,91 @@
+import chess
+import joblib
+import numpy as np
+import os
+import sys
+
+from models.features.batch import opening_batch, read_games, style_batch
+from models.features.extraction import (
+    MIN_PLIES, OPENING_MOVE_FEATURES, OPENING_TOTAL_FEATURES, STYLE_CLASSES, STYLE_TOTAL_FEATURES
+)
+from models.inference.export_weights import MODELS
+from models.inference.numpy_engine import PRECISIONS, NumpyDenseModel
+
+
+def model_inputs(games, colors):
+    """Entradas sin escalar de ambos modelos para las partidas con el mínimo de jugadas.
+    El recomendador se evalúa con cada uno de los estilos"""
+    selected = [(game, color) for game, color in zip(games, colors)
+                if sum(1 for _ in game.mainline_moves()) >= MIN_PLIES]
+    if not selected:
+        return np.zeros((0, STYLE_TOTAL_FEATURES), np.float32), np.zeros((0, OPENING_TOTAL_FEATURES), np.float32)
+    games, colors = zip(*selected)
+
+    style = style_batch(games, colors).reshape(len(games), -1)
+    opening = np.zeros((len(games), STYLE_CLASSES, OPENING_TOTAL_FEATURES), dtype=np.float32)
+    opening[:, :, :OPENING_MOVE_FEATURES] = opening_batch(games, colors).reshape(len(games), 1, -1)
+    for style_index in range(STYLE_CLASSES):
+        opening[:, style_index, OPENING_MOVE_FEATURES + style_index] = 1
+    return style, opening.reshape(-1, OPENING_TOTAL_FEATURES)
+
+
+def compare(reference, probabilities):
+    """Coincidencia de la clase más probable y deriva de probabilidades frente a la referencia"""
+    drift = np.abs(probabilities - reference)
+    return {
+        "top1_agreement": float(np.mean(probabilities.argmax(axis=1) == reference.argmax(axis=1))),
+        "max_drift": float(drift.max()),
+        "mean_drift": float(drift.mean())
+    }
+
+
+def keras_reference(name, inputs):
+    """Probabilidades del modelo Keras float32 original, o None si no está o no hay TensorFlow"""
+    keras_path, metadata_path, _ = MODELS[name]
+    if not os.path.exists(keras_path):
+        return None
+    try:
+        from tensorflow.keras.models import load_model
+    except ImportError:
+        return None
+    scaler = joblib.load(metadata_path)["scaler"]
+    return load_model(keras_path).predict(scaler.transform(inputs), verbose=0)
+
+
+def precision_report(weights_path, inputs, reference=None):
+    """Compara cada precisión con `reference` (las probabilidades del modelo Keras float32)
+    sobre las mismas entradas; sin ella, con el motor NumPy en float32"""
+    if reference is None:
+        reference = NumpyDenseModel.load(weights_path, "float32").predict(inputs)
+    report = {}
+    for precision in PRECISIONS:
+        model = NumpyDenseModel.load(weights_path, precision)
+        report[precision] = {"weight_kb": model.weight_bytes / 1024, **compare(reference, model.predict(inputs))}
+    return report
+
+
+def print_report(name, report, samples, baseline):
+    print(f"\n{name} ({samples} entradas, referencia: {baseline})")
+    print(f"{'precisión':<10}{'pesos KB':>10}{'top-1':>9}{'deriva máx':>12}{'deriva media':>14}")
+    for precision, row in report.items():
+        print(f"{precision:<10}{row['weight_kb']:>10.0f}{row['top1_agreement']:>9.2%}"
+              f"{row['max_drift']:>12.2e}{row['mean_drift']:>14.2e}")
+
+
+if __name__ == "__main__":
+    # Uso: python -m models.inference.precision_report partidas.pgn [white|black]
+    games = read_games(sys.argv[1])
+    if len(sys.argv) > 2:
+        colors = [sys.argv[2].lower() == "white"] * len(games)
+    else:
+        games, colors = games * 2, [chess.WHITE] * len(games) + [chess.BLACK] * len(games)
+
+    style_inputs, opening_inputs = model_inputs(games, colors)
+    for name, inputs in (("style", style_inputs), ("opening", opening_inputs)):
+        weights_path = MODELS[name][2]
+        if not os.path.exists(weights_path):
+            print(f"\n{name}: no hay pesos exportados en {weights_path}")
+            continue
+        reference = keras_reference(name, inputs)
+        baseline = "modelo Keras float32" if reference is not None else "motor NumPy float32 (no hay modelo Keras)"
+        print_report(name, precision_report(weights_path, inputs, reference), len(inputs), baseline)
@@ -1,10 +1,19 @@
-import chess.pgn
-import io
-from sklearn.preprocessing import StandardScaler, LabelEncoder
-from tensorflow.keras.models import load_model
-import joblib
-from collections import  Counter
+import chess
+import numpy as np
 import time
+from models.features.attacks import AttackContext
+from models.features.bitboards import (
+    PASSED_PAWN_MASKS, bishop_pair, king_safety, key_squares_control, material_balance, openness,
+    passed_pawns_count, pawn_structure, piece_activity, piece_mobility, pieces_in_enemy_territory,
+    sacrifice, space_advantage, tactical_opportunities, total_material
+)
+from models.features.batch import extract_many
+from models.features.buffers import as_feature_buffer, opening_buffers, scale_in_place
+from models.features.extraction import (
+    OPENING_MOVE_FEATURES, OPENING_TOTAL_FEATURES, extract_move_features, parse_color, read_pgn,
+    write_opening_features
+)
+from models.inference.numpy_engine import load_inference_model
 
 class OpeningRecommender:
     def __init__(self):
@@ -27,6 +36,9 @@ class OpeningRecommender:
             'universal': 'universal'
         }
 
+        # sklearn se importa al crear el modelo, no al importar el módulo
+        from sklearn.preprocessing import StandardScaler, LabelEncoder
+
         self.scaler = StandardScaler()
         self.opening_encoder = LabelEncoder()
         self.style_encoder = LabelEncoder()
@@ -39,268 +51,89 @@ class OpeningRecommender:
 
         self.model = None
         
-    def _extract_game_features(self, game, style, color=chess.WHITE):
-        """Extrae características avanzadas de una partida de ajedrez con estilo"""
-        MOVES_TO_ANALYZE = 30
-        FEATURES_PER_MOVE = 13
-        STYLE_FEATURES = len(self.style_encoder.classes_)
-        TOTAL_FEATURES = MOVES_TO_ANALYZE * FEATURES_PER_MOVE + STYLE_FEATURES
-
-        board = game.board()
-        features = []
-        previous_material = 0
-        moves_analyzed = 0
-
+    def _extract_game_features(self, game, style, color=chess.WHITE, out=None):
+        """Extrae características avanzadas de una partida de ajedrez con estilo en un buffer float32 (1, 393)"""
         try:
-            for i, move in enumerate(game.mainline_moves()):
-                board.push(move)
-                if board.turn != color:
-                    continue
-
-                if moves_analyzed < MOVES_TO_ANALYZE:
-                    move_features = [
-                        self._calculate_material_balance(board),
-                        self._king_safety_score(board),
-                        self._pawn_structure_analysis(board),
-                        self._piece_activity_score(board),
-                        self._control_of_key_squares(board),
-                        self._openness_position(board),
-                        self._sacrifice_detection(board, move, previous_material),
-                        self._tactical_opportunities(board),
-                        self._space_advantage(board),
-                        self._piece_mobility(board),
-                        self._passed_pawns_count(board),
-                        self._bishop_pair_advantage(board),
-                        self._pieces_in_enemy_territory(board)
-                    ]
-                    features.extend(move_features)
-                    previous_material = self._calculate_total_material(board)
-                    moves_analyzed += 1
-
-                if len(features) >= MOVES_TO_ANALYZE * FEATURES_PER_MOVE:
-                    break
-
-            style_encoded = self.style_encoder.transform([style])[0]
-            style_onehot = [0] * STYLE_FEATURES
-            style_onehot[style_encoded] = 1
-            features += style_onehot
-
-            current_length = len(features)
-            if current_length < TOTAL_FEATURES:
-                features += [0] * (TOTAL_FEATURES - current_length)
-            return features[:TOTAL_FEATURES]
+            if out is None:
+                out = np.zeros((1, OPENING_TOTAL_FEATURES), dtype=np.float32)
+            style_offset = write_opening_features(extract_move_features(game, color), out)
+            return self._set_style(out, style_offset, style)
 
         except Exception as e:
             print(f"Error en extracción: {str(e)}")
             return None
 
+    def _set_style(self, features, style_offset, style):
+        """Escribe el one-hot de estilo a partir de `style_offset`, con ceros en el resto"""
+        style_encoded = self.style_encoder.transform([style])[0]
+        features[0, style_offset:] = 0
+        if style_offset + style_encoded < features.shape[1]:
+            features[0, style_offset + style_encoded] = 1
+        return features
+
     def _calculate_material_balance(self, board):
         """Balance material con valores de pieza ajustados"""
-        piece_values = {
-            chess.PAWN: 1.5,    # Valor ligeramente mayor por estructura
-            chess.KNIGHT: 3.2,
-            chess.BISHOP: 3.5,  # Par de alfiles bonus se maneja aparte
-            chess.ROOK: 5.1,
-            chess.QUEEN: 9.8,
-            chess.KING: 0
-        }
-        white = sum(len(board.pieces(pt, chess.WHITE)) * val for pt, val in piece_values.items())
-        black = sum(len(board.pieces(pt, chess.BLACK)) * val for pt, val in piece_values.items())
-        return (white - black) / 10  # Sin la division por 10, la maxima diferencia es de +-45.4
+        return material_balance(board)
 
     def _king_safety_score(self, board):
         """Evaluación detallada de la seguridad del rey"""
-        king_square = board.king(board.turn)
-        if not king_square:
-            return 0
-
-        # Escudo de peones
-        pawn_shield = sum(1 for sq in board.attacks(king_square)
-              if board.piece_type_at(sq) == chess.PAWN
-              and board.color_at(sq) == board.turn)
-
-        # Ataques potenciales
-        attackers = len(board.attackers(not board.turn, king_square))
-
-        # Posición del rey (centro vs esquina)
-        file = chess.square_file(king_square)
-        rank = chess.square_rank(king_square)
-        center_distance = abs(3.5 - file) + abs(3.5 - rank)
-
-        return (pawn_shield * 0.5) - (attackers * 0.3) - (center_distance * 0.2) # Entre -2 y +3
+        return king_safety(board, AttackContext(board))
 
     def _piece_mobility(self, board):
         """Movilidad de las piezas (número de movimientos legales disponibles)"""
-        mobility = 0
-        for piece_type in [chess.KNIGHT, chess.BISHOP, chess.ROOK, chess.QUEEN]:
-            for sq in board.pieces(piece_type, board.turn):
-                mobility += len(board.attacks(sq))
-        return mobility / 50
+        return piece_mobility(board, AttackContext(board))
 
     def _is_passed_pawn(self, board, pawn_square):
         """Verifica si un peón es pasado"""
         color = board.color_at(pawn_square)
         if color is None:
             return False
-
-        pawn_file = chess.square_file(pawn_square)
-        pawn_rank = chess.square_rank(pawn_square)
-
-        # Determinar dirección según color
-        direction = 1 if color == chess.WHITE else -1
-        start_rank = pawn_rank + direction
-
-        # Verificar casillas hacia adelante en columnas adyacentes
-        for rank in range(start_rank, 8) if color == chess.WHITE else range(start_rank, -1, -1):
-            for file_offset in (-1, 0, 1):
-                current_file = pawn_file + file_offset
-                if 0 <= current_file <= 7:
-                    square = chess.square(current_file, rank)
-                    # Verificar peones enemigos
-                    if board.piece_type_at(square) == chess.PAWN and board.color_at(square) != color:
-                        return False
-        return True
+        enemy_pawns = board.pawns & board.occupied_co[not color]
+        return not PASSED_PAWN_MASKS[color][pawn_square] & enemy_pawns
 
     def _passed_pawns_count(self, board):
         """Conteo de peones pasados"""
-        passed = 0
-        pawns = board.pieces(chess.PAWN, board.turn)
-        enemy_pawns = board.pieces(chess.PAWN, not board.turn)
-        for pawn in pawns:
-            is_passed = True
-            pawn_file = chess.square_file(pawn)
-            pawn_rank = chess.square_rank(pawn)
-            # Verificar columnas adyacentes y frente del peón
-            for file in [pawn_file-1, pawn_file, pawn_file+1]:
-                if 0 <= file <= 7:
-                    for rank in range(pawn_rank+1, 8):
-                        if chess.square(file, rank) in enemy_pawns:
-                            is_passed = False
-                            break
-                    if not is_passed:
-                        break
-            if is_passed:
-                passed += 1
-        return passed / 8
+        return passed_pawns_count(board)
 
     def _pawn_structure_analysis(self, board):
         """Análisis completo de estructura de peones"""
-        pawns = board.pieces(chess.PAWN, board.turn)
-        score = 0
-
-        # Peones doblados
-        files = [chess.square_file(p) for p in pawns]
-        score -= sum(v-1 for v in Counter(files).values())
-
-        # Peones pasados
-        score += sum(1 for p in pawns if self._is_passed_pawn(board, p))
-
-        # Peones aislados
-        adjacent_files = set()
-        for f in files:
-            adjacent_files.update([f-1, f+1])
-        score -= sum(1 for f in files if f not in adjacent_files)
-
-        return score
+        return pawn_structure(board)
 
     def _piece_activity_score(self, board):
         """Movilidad y actividad de piezas mayores"""
-        activity = 0
-        for piece_type in [chess.KNIGHT, chess.BISHOP, chess.ROOK, chess.QUEEN]:
-            for sq in board.pieces(piece_type, board.turn):
-                activity += len(board.attacks(sq))
-        return activity / 20
+        return piece_activity(board, AttackContext(board))
 
     def _control_of_key_squares(self, board):
         """Control de centros estratégicos y casillas clave"""
-        key_squares = [
-            chess.D4, chess.D5, chess.E4, chess.E5,  # Centro clásico
-            chess.C3, chess.C6, chess.F3, chess.F6,  # Centro extendido
-            chess.D3, chess.E3, chess.D6, chess.E6  # Acceso al centro
-        ]
-        return sum(1 for sq in key_squares if board.is_attacked_by(board.turn, sq))
+        return key_squares_control(board, AttackContext(board))
 
     def _openness_position(self, board):
         """Evalúa si la posición es abierta o cerrada"""
-        open_files = 0
-        for file in range(8):
-            # Verificar si hay peones en el archivo para ambos colores
-            has_pawns = False
-            for color in [chess.WHITE, chess.BLACK]:
-                for sq in board.pieces(chess.PAWN, color):
-                    if chess.square_file(sq) == file:
-                        has_pawns = True
-                        break
-                if has_pawns:
-                    break
-            if not has_pawns:
-                open_files += 1
-        return open_files
+        return openness(board)
 
     def _calculate_total_material(self, board):
         """Calcula el material total del jugador actual"""
-        piece_values = {
-            chess.PAWN: 1.5,
-            chess.KNIGHT: 3.2,
-            chess.BISHOP: 3.5,
-            chess.ROOK: 5.1,
-            chess.QUEEN: 9.8,
-            chess.KING: 0
-        }
-        total = 0
-        for piece_type, value in piece_values.items():
-            total += len(board.pieces(piece_type, board.turn)) * value
-        return total
+        return total_material(board)
 
     def _sacrifice_detection(self, board, move, previous_material):
         """Detección de sacrificios posicionales y materiales"""
-        current_material = self._calculate_total_material(board)
-        material_diff = previous_material - current_material
-
-        # Sacrificio si pérdida material > 2 puntos y control del centro aumenta
-        if material_diff > 2 and self._control_of_key_squares(board) > 4:
-            return 1
-        return 0
+        return sacrifice(board, previous_material, AttackContext(board))
 
     def _tactical_opportunities(self, board):
         """Oportunidades tácticas potenciales"""
-        hanging_pieces = 0
-        for color in [chess.WHITE, chess.BLACK]:
-            for sq in board.pieces(chess.PAWN, color):
-                if not board.attackers(color, sq):
-                    hanging_pieces += 1
-        return -hanging_pieces if board.turn == chess.WHITE else hanging_pieces
+        return tactical_opportunities(board, AttackContext(board))
 
     def _space_advantage(self, board):
         """Ventaja espacial en el tablero"""
-        squares_controlled = 0
-        for sq in chess.SQUARES:
-            if board.is_attacked_by(board.turn, sq):
-                squares_controlled += 1
-        return squares_controlled / 64
+        return space_advantage(board, AttackContext(board))
 
     def _bishop_pair_advantage(self, board):
         """Ventaja de pareja de alfiles"""
-        white_bishops = len(board.pieces(chess.BISHOP, chess.WHITE))
-        black_bishops = len(board.pieces(chess.BISHOP, chess.BLACK))
-
-        white_pair = 1 if white_bishops >= 2 else 0
-        black_pair = 1 if black_bishops >= 2 else 0
-        return white_pair - black_pair
+        return bishop_pair(board)
 
     def _pieces_in_enemy_territory(self, board):
         """Calcula cuántas piezas están en campo enemigo"""
-        enemy_territory = range(24, 64) if board.turn == chess.WHITE else range(0, 40)
-        count = 0
-        for square in chess.SQUARES:
-            if square in enemy_territory and board.piece_at(square) and board.color_at(square) == board.turn:
-                # Dar mayor peso a piezas de ataque
-                piece_type = board.piece_type_at(square)
-                if piece_type in [chess.QUEEN, chess.ROOK, chess.BISHOP]:
-                    count += 1.5
-                else:
-                    count += 1
-        return count / 10
+        return pieces_in_enemy_territory(board)
 
     def recommend_for_pgn(self, pgn_text, color, player_style=None):
         """Recomienda aperturas basadas en un PGN de partida y estilo de jugador"""
@@ -311,66 +144,132 @@ class OpeningRecommender:
                 return f"Estilo '{player_style}' no válido. Opciones: {list(self.style_spanish_mapping.values())}"
 
             # Procesar PGN
-            if not pgn_text or not isinstance(pgn_text, str) or pgn_text.isspace():
-                return {
-                    "status": "error",
-                    "message": "No se ha enviado un PGN válido"
-                }
-                
-            try:
-                game = chess.pgn.read_game(io.StringIO(pgn_text))
-                if not game or not game.mainline_moves():
-                    raise ValueError("Formato PGN inválido")
-            except:
-                return {
-                    "status": "error",
-                    "message": "No se ha enviado un PGN válido"
-                }
-                
-            move_count = sum(1 for _ in game.mainline_moves())
-            if move_count < 60:
-                return {
-                    "status": "error",
-                    "message": "El PGN enviado debe contener un mínimo de 30 movimientos"
-                }
-
-            chess_color = chess.WHITE if color.lower() == 'white' else chess.BLACK
-
-            features = self._extract_game_features(game, player_style, chess_color)
-            if not features:
-                return "Error: No se pudieron extraer características"
-
-            scaled_features = self.scaler.transform([features])
-
-            # Predecir probabilidades
-            prediction = self.model.predict(scaled_features, verbose=0)[0]
-
-            opening_names = list(self.opening_mapping.keys())
-            recommendations = []
-            for idx, prob in enumerate(prediction):
-                opening = opening_names[idx]
-                if opening not in self.opening_mapping:
-                    continue
-                recommendations.append({
-                    'apertura': opening,
-                    'probabilidad': round(float(prob), 2)
-                })
-
-            recommendations.sort(key=lambda x: (-x['probabilidad'], x['apertura']))
+            game, error = read_pgn(pgn_text)
+            if error:
+                return error
+
+            with opening_buffers.borrow() as buffer:
+                features = self._extract_game_features(game, player_style, parse_color(color), buffer)
+                if features is None:
+                    return "Error: No se pudieron extraer características"
+
+                recommendations = self._rank_openings(features)
             end_time = time.time()
             elapsed_time = end_time - start_time
             print(f"Tiempo de ejecución para recomendar una apertura: {elapsed_time:.2f} segundos")
-            return recommendations[:3]
+            return recommendations
 
         except Exception as e:
             return f"Error: {str(e)}"
 
+    def recommend_from_features(self, features, player_style):
+        """Recomienda aperturas a partir de las 390 características ya extraídas.
+        Si se recibe un buffer float32 (1, 393), el estilo y el escalado se escriben sobre él"""
+        try:
+            if player_style not in self.style_spanish_mapping.values():
+                return f"Estilo '{player_style}' no válido. Opciones: {list(self.style_spanish_mapping.values())}"
+
+            features = as_feature_buffer(features, OPENING_TOTAL_FEATURES)
+            return self._rank_openings(self._set_style(features, OPENING_MOVE_FEATURES, player_style))
+
+        except Exception as e:
+            return f"Error: {str(e)}"
+
+    def style_variants(self, features):
+        """Copia (estilos, 393) de las características con el one-hot de cada estilo, en el
+        orden de `style_encoder.classes_` y ya escalada para el modelo. Al ser una copia
+        propia puede evaluarse en otro hilo mientras el buffer original se reutiliza"""
+        features = as_feature_buffer(features, OPENING_TOTAL_FEATURES)
+        variants = np.repeat(features[:1], len(self.style_encoder.classes_), axis=0)
+        variants[:, OPENING_MOVE_FEATURES:] = 0
+        for style_index in range(len(variants)):
+            variants[style_index, OPENING_MOVE_FEATURES + style_index] = 1
+        if not getattr(self.model, "scaler_folded", False):
+            scale_in_place(self.scaler, variants)
+        return variants
+
+    def recommend_from_variants(self, predictions, player_style):
+        """Recomienda aperturas eligiendo la fila del estilo en las predicciones de `style_variants`"""
+        try:
+            if player_style not in self.style_spanish_mapping.values():
+                return f"Estilo '{player_style}' no válido. Opciones: {list(self.style_spanish_mapping.values())}"
+
+            return self._top_openings(predictions[self.style_encoder.transform([player_style])[0]])
+
+        except Exception as e:
+            return f"Error: {str(e)}"
+
+    def recommend_many(self, pgns, colors, styles, executor=None):
+        """Recomienda aperturas para varias partidas con un único escalado y una sola predicción
+
+        `colors` y `styles` pueden ser un valor para todas o uno por partida. Devuelve, en el
+        orden de entrada, lo mismo que `recommend_for_pgn` para cada partida (o su error).
+        """
+        pgns = list(pgns)
+        styles = [styles] * len(pgns) if styles is None or isinstance(styles, str) else list(styles)
+        if len(styles) != len(pgns) or (not isinstance(colors, str) and len(colors) != len(pgns)):
+            raise ValueError("Se necesita un color y un estilo por partida")
+        try:
+            start_time = time.time()
+            valid_styles = self.style_spanish_mapping.values()
+            results = [None if style in valid_styles else
+                       f"Estilo '{style}' no válido. Opciones: {list(valid_styles)}" for style in styles]
+            pending = [index for index, result in enumerate(results) if result is None]
+
+            features, indices, errors = extract_many(
+                [pgns[index] for index in pending],
+                colors if isinstance(colors, str) else [colors[index] for index in pending],
+                with_territory=True, executor=executor)
+            for index, error in errors.items():
+                results[pending[index]] = error
+
+            if indices:
+                batch = np.zeros((len(indices), OPENING_TOTAL_FEATURES), dtype=np.float32)
+                batch[:, :OPENING_MOVE_FEATURES] = features
+                style_codes = self.style_encoder.transform([styles[pending[index]] for index in indices])
+                batch[np.arange(len(indices)), OPENING_MOVE_FEATURES + style_codes] = 1
+                if not getattr(self.model, "scaler_folded", False):
+                    scale_in_place(self.scaler, batch)
+                predictions = self.model.predict(batch, verbose=0)
+                for index, prediction in zip(indices, predictions):
+                    results[pending[index]] = self._top_openings(prediction)
+            elapsed_time = time.time() - start_time
+            print(f"Tiempo de ejecución para recomendar {len(results)} aperturas: {elapsed_time:.2f} segundos")
+            return results
+
+        except Exception as e:
+            return [f"Error: {str(e)}" for _ in pgns]
+
+    def _rank_openings(self, features):
+        """Predice las probabilidades y devuelve las 3 mejores aperturas"""
+        # Predecir probabilidades (el motor NumPy ya lleva el escalado en la primera capa)
+        if not getattr(self.model, "scaler_folded", False):
+            scale_in_place(self.scaler, features)
+        return self._top_openings(self.model.predict(features, verbose=0)[0])
+
+    def _top_openings(self, prediction):
+        """Las 3 aperturas más probables de un vector de probabilidades"""
+        opening_names = list(self.opening_mapping.keys())
+        recommendations = []
+        for idx, prob in enumerate(prediction):
+            opening = opening_names[idx]
+            if opening not in self.opening_mapping:
+                continue
+            recommendations.append({
+                'apertura': opening,
+                'probabilidad': round(float(prob), 2)
+            })
+
+        recommendations.sort(key=lambda x: (-x['probabilidad'], x['apertura']))
+        return recommendations[:3]
+
     @classmethod
     def load_model(cls, filename="opening_recommender"):
         """Carga el modelo y metadatos"""
         recommender = cls()
 
         # Cargar metadatos
+        import joblib
         model_data = joblib.load(f"{filename}_metadata.joblib")
         recommender.scaler = model_data['scaler']
         recommender.opening_encoder = model_data['opening_encoder']
@@ -378,7 +277,12 @@ class OpeningRecommender:
         recommender.opening_mapping = model_data['opening_mapping']
         recommender.style_spanish_mapping = model_data['style_spanish_mapping']
 
-        # Cargar modelo
-        recommender.model = load_model(f"{filename}.keras")
-        print(f"Modelo cargado desde {filename}.keras")
+        # Cargar modelo: motor NumPy con los pesos exportados; Keras solo si no existen
+        recommender.model = load_inference_model(filename)
+        if recommender.model is not None:
+            print(f"Modelo cargado desde {filename}.npz")
+        else:
+            from tensorflow.keras.models import load_model
+            recommender.model = load_model(f"{filename}.keras")
+            print(f"Modelo cargado desde {filename}.keras")
         return recommender
\ No newline at end of file
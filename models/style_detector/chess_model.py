@@ -1,12 +1,17 @@
-import chess
-import chess.pgn
-import io
 import numpy as np
-import joblib
-from collections import Counter
-from sklearn.preprocessing import StandardScaler, LabelEncoder
-from tensorflow.keras.models import load_model
 import time
+from models.features.attacks import AttackContext
+from models.features.bitboards import (
+    PASSED_PAWN_MASKS, bishop_pair, king_safety, key_squares_control, material_balance, openness,
+    passed_pawns_count, pawn_structure, piece_activity, piece_mobility, sacrifice,
+    space_advantage, tactical_opportunities, total_material
+)
+from models.features.batch import extract_many
+from models.features.buffers import as_feature_buffer, scale_in_place, style_buffers
+from models.features.extraction import (
+    EXTRACTION_ERROR, STYLE_TOTAL_FEATURES, extract_move_features, parse_color, read_pgn, write_style_features
+)
+from models.inference.numpy_engine import load_inference_model
 
 class ChessStyleAnalyzer:
     
@@ -37,6 +42,9 @@ class ChessStyleAnalyzer:
         self.unique_styles = list(set(self.style_mapping.values()))
         self.num_classes = len(self.unique_styles)
 
+        # sklearn se importa al crear el modelo, no al importar el módulo
+        from sklearn.preprocessing import StandardScaler, LabelEncoder
+
         self.scaler = StandardScaler()
         self.label_encoder = LabelEncoder()
         self.label_encoder.fit(self.unique_styles)
@@ -48,47 +56,13 @@ class ChessStyleAnalyzer:
             'universal' : 'Universal'
         }
     
-    def _extract_game_features(self, game, color):
-      """Extrae características avanzadas de una partida de ajedrez"""
-      MOVES_TO_ANALYZE = 30
-      FEATURES_PER_MOVE = 12
-      TOTAL_FEATURES = MOVES_TO_ANALYZE * FEATURES_PER_MOVE
-
-      board = game.board()
-      features = []
-      previous_material = 0
-      moves_analyzed = 0
-
+    def _extract_game_features(self, game, color, out=None):
+      """Extrae características avanzadas de una partida de ajedrez en un buffer float32 (1, 360)"""
       try:
-          for i, move in enumerate(game.mainline_moves()):
-              board.push(move)
-              if board.turn != color:
-                  continue
-
-              if moves_analyzed < MOVES_TO_ANALYZE:
-                  move_features = [
-                      # Características estratégicas
-                      self._calculate_material_balance(board),
-                      self._king_safety_score(board),
-                      self._pawn_structure_analysis(board),
-                      self._piece_activity_score(board),
-                      self._control_of_key_squares(board),
-                      self._openness_position(board),
-                      self._sacrifice_detection(board, move, previous_material),
-                      self._tactical_opportunities(board),
-                      self._space_advantage(board),
-                      self._piece_mobility(board),
-                      self._passed_pawns_count(board),
-                      self._bishop_pair_advantage(board)
-                  ]
-                  features.extend(move_features)
-                  previous_material = self._calculate_total_material(board)
-                  moves_analyzed += 1
-
-              if len(features) >= TOTAL_FEATURES:
-                  break
-
-          return features[:TOTAL_FEATURES]
+          if out is None:
+              out = np.zeros((1, STYLE_TOTAL_FEATURES), dtype=np.float32)
+          # Características estratégicas calculadas sobre los bitboards
+          return write_style_features(extract_move_features(game, color), out)
 
       except Exception as e:
           print(f"Error en extracción: {str(e)}")
@@ -96,250 +70,85 @@ class ChessStyleAnalyzer:
 
     def _calculate_material_balance(self, board):
         """Balance material con valores de pieza ajustados"""
-        piece_values = {
-            chess.PAWN: 1.5,    # Valor ligeramente mayor por estructura
-            chess.KNIGHT: 3.2,
-            chess.BISHOP: 3.5,  # Par de alfiles bonus se maneja aparte
-            chess.ROOK: 5.1,
-            chess.QUEEN: 9.8,
-            chess.KING: 0
-        }
-        white = sum(len(board.pieces(pt, chess.WHITE)) * val for pt, val in piece_values.items())
-        black = sum(len(board.pieces(pt, chess.BLACK)) * val for pt, val in piece_values.items())
-        return (white - black) / 10  # Sin la division por 10, la maxima diferencia es de +-45.4
+        return material_balance(board)
 
     def _king_safety_score(self, board):
         """Evaluación detallada de la seguridad del rey"""
-        king_square = board.king(board.turn)
-        if not king_square:
-            return 0
-
-        # Escudo de peones
-        pawn_shield = sum(1 for sq in board.attacks(king_square)
-              if board.piece_type_at(sq) == chess.PAWN
-              and board.color_at(sq) == board.turn)
-
-        # Ataques potenciales
-        attackers = len(board.attackers(not board.turn, king_square))
-
-        # Posición del rey (centro vs esquina)
-        file = chess.square_file(king_square)
-        rank = chess.square_rank(king_square)
-        center_distance = abs(3.5 - file) + abs(3.5 - rank)
-
-        return (pawn_shield * 0.5) - (attackers * 0.3) - (center_distance * 0.2) # Entre -2 y +3
+        return king_safety(board, AttackContext(board))
 
     def _piece_mobility(self, board):
         """Movilidad de las piezas (número de movimientos legales disponibles)"""
-        mobility = 0
-        for piece_type in [chess.KNIGHT, chess.BISHOP, chess.ROOK, chess.QUEEN]:
-            for sq in board.pieces(piece_type, board.turn):
-                mobility += len(board.attacks(sq))
-        return mobility / 50
+        return piece_mobility(board, AttackContext(board))
 
     def _is_passed_pawn(self, board, pawn_square):
         """Verifica si un peón es pasado"""
         color = board.color_at(pawn_square)
         if color is None:
             return False
-
-        pawn_file = chess.square_file(pawn_square)
-        pawn_rank = chess.square_rank(pawn_square)
-
-        # Determinar dirección según color
-        direction = 1 if color == chess.WHITE else -1
-        start_rank = pawn_rank + direction
-
-        # Verificar casillas hacia adelante en columnas adyacentes
-        for rank in range(start_rank, 8) if color == chess.WHITE else range(start_rank, -1, -1):
-            for file_offset in (-1, 0, 1):
-                current_file = pawn_file + file_offset
-                if 0 <= current_file <= 7:
-                    square = chess.square(current_file, rank)
-                    # Verificar peones enemigos
-                    if board.piece_type_at(square) == chess.PAWN and board.color_at(square) != color:
-                        return False
-        return True
+        enemy_pawns = board.pawns & board.occupied_co[not color]
+        return not PASSED_PAWN_MASKS[color][pawn_square] & enemy_pawns
 
     def _passed_pawns_count(self, board):
         """Conteo de peones pasados"""
-        passed = 0
-        pawns = board.pieces(chess.PAWN, board.turn)
-        enemy_pawns = board.pieces(chess.PAWN, not board.turn)
-        for pawn in pawns:
-            is_passed = True
-            pawn_file = chess.square_file(pawn)
-            pawn_rank = chess.square_rank(pawn)
-            # Verificar columnas adyacentes y frente del peón
-            for file in [pawn_file-1, pawn_file, pawn_file+1]:
-                if 0 <= file <= 7:
-                    for rank in range(pawn_rank+1, 8):
-                        if chess.square(file, rank) in enemy_pawns:
-                            is_passed = False
-                            break
-                    if not is_passed:
-                        break
-            if is_passed:
-                passed += 1
-        return passed / 8
+        return passed_pawns_count(board)
 
     def _pawn_structure_analysis(self, board):
         """Análisis completo de estructura de peones"""
-        pawns = board.pieces(chess.PAWN, board.turn)
-        score = 0
-
-        # Peones doblados
-        files = [chess.square_file(p) for p in pawns]
-        score -= sum(v-1 for v in Counter(files).values())
-
-        # Peones pasados
-        score += sum(1 for p in pawns if self._is_passed_pawn(board, p))
-
-        # Peones aislados
-        adjacent_files = set()
-        for f in files:
-            adjacent_files.update([f-1, f+1])
-        score -= sum(1 for f in files if f not in adjacent_files)
-
-        return score
+        return pawn_structure(board)
 
     def _piece_activity_score(self, board):
         """Movilidad y actividad de piezas mayores"""
-        activity = 0
-        for piece_type in [chess.KNIGHT, chess.BISHOP, chess.ROOK, chess.QUEEN]:
-            for sq in board.pieces(piece_type, board.turn):
-                activity += len(board.attacks(sq))
-        return activity / 20
+        return piece_activity(board, AttackContext(board))
 
     def _control_of_key_squares(self, board):
         """Control de centros estratégicos y casillas clave"""
-        key_squares = [
-            chess.D4, chess.D5, chess.E4, chess.E5,  # Centro clásico
-            chess.C3, chess.C6, chess.F3, chess.F6,  # Centro extendido
-            chess.D3, chess.E3, chess.D6, chess.E6  # Acceso al centro
-        ]
-        return sum(1 for sq in key_squares if board.is_attacked_by(board.turn, sq))
+        return key_squares_control(board, AttackContext(board))
 
     def _openness_position(self, board):
         """Evalúa si la posición es abierta o cerrada"""
-        open_files = 0
-        for file in range(8):
-            # Verificar si hay peones en el archivo para ambos colores
-            has_pawns = False
-            for color in [chess.WHITE, chess.BLACK]:
-                for sq in board.pieces(chess.PAWN, color):
-                    if chess.square_file(sq) == file:
-                        has_pawns = True
-                        break
-                if has_pawns:
-                    break
-            if not has_pawns:
-                open_files += 1
-        return open_files
+        return openness(board)
 
     def _calculate_total_material(self, board):
         """Calcula el material total del jugador actual"""
-        piece_values = {
-            chess.PAWN: 1.5,
-            chess.KNIGHT: 3.2,
-            chess.BISHOP: 3.5,
-            chess.ROOK: 5.1,
-            chess.QUEEN: 9.8,
-            chess.KING: 0
-        }
-        total = 0
-        for piece_type, value in piece_values.items():
-            total += len(board.pieces(piece_type, board.turn)) * value
-        return total
+        return total_material(board)
 
     def _sacrifice_detection(self, board, move, previous_material):
         """Detección de sacrificios posicionales y materiales"""
-        current_material = self._calculate_total_material(board)
-        material_diff = previous_material - current_material
-
-        # Sacrificio si pérdida material > 2 puntos y control del centro aumenta
-        if material_diff > 2 and self._control_of_key_squares(board) > 4:
-            return 1
-        return 0
+        return sacrifice(board, previous_material, AttackContext(board))
 
     def _tactical_opportunities(self, board):
         """Oportunidades tácticas potenciales"""
-        hanging_pieces = 0
-        for color in [chess.WHITE, chess.BLACK]:
-            for sq in board.pieces(chess.PAWN, color):
-                if not board.attackers(color, sq):
-                    hanging_pieces += 1
-        return -hanging_pieces if board.turn == chess.WHITE else hanging_pieces
+        return tactical_opportunities(board, AttackContext(board))
 
     def _space_advantage(self, board):
         """Ventaja espacial en el tablero"""
-        squares_controlled = 0
-        for sq in chess.SQUARES:
-            if board.is_attacked_by(board.turn, sq):
-                squares_controlled += 1
-        return squares_controlled / 64
+        return space_advantage(board, AttackContext(board))
 
     def _bishop_pair_advantage(self, board):
         """Ventaja de pareja de alfiles"""
-        white_bishops = len(board.pieces(chess.BISHOP, chess.WHITE))
-        black_bishops = len(board.pieces(chess.BISHOP, chess.BLACK))
-
-        white_pair = 1 if white_bishops >= 2 else 0
-        black_pair = 1 if black_bishops >= 2 else 0
-        return white_pair - black_pair
+        return bishop_pair(board)
 
     def detect_style(self, pgn_text, color):
         """Realiza una recomendación de apertura con validaciones mejoradas"""
         try:
             ChessStyleAnalyzer.user_count += 1
             print(f"Usuario {ChessStyleAnalyzer.user_count} detectando estilo...")
-            start_time = time.time()            
-            # --- Validación 1: Input vacío o texto no válido ---
-            if not pgn_text or not isinstance(pgn_text, str) or pgn_text.isspace():
-                return {
-                    "status": "error",
-                    "message": "No se ha enviado un PGN válido"
-                }
-
-            # --- Validación 2: Verificar formato PGN válido ---
-            try:
-                game = chess.pgn.read_game(io.StringIO(pgn_text))
-                if not game or not game.mainline_moves():
-                    raise ValueError("Formato PGN inválido")
-            except:
-                return {
-                    "status": "error",
-                    "message": "No se ha enviado un PGN válido"
-                }
-
-            # --- Validación 3: Mínimo de movimientos ---
-            move_count = sum(1 for _ in game.mainline_moves())
-            if move_count < 60:
-                return {
-                    "status": "error",
-                    "message": "El PGN enviado debe contener un mínimo de 30 movimientos"
-                }
+            start_time = time.time()
+            game, error = read_pgn(pgn_text)
+            if error:
+                return error
 
             # --- Procesamiento normal si pasa validaciones ---
-            chess_color = chess.WHITE if color.lower() == 'white' else chess.BLACK
-            features = self._extract_game_features(game, chess_color)
-            if features is None:
-                return {
-                    "status": "error",
-                    "message": "No se pudo extraer características del PGN"
-                }
-
-            features_scaled = self.scaler.transform([features])
-            pred = self.model.predict(features_scaled, verbose=0)
-            style_code = np.argmax(pred)
-            style = self.label_encoder.inverse_transform([style_code])[0]
+            with style_buffers.borrow() as buffer:
+                features = self._extract_game_features(game, parse_color(color), buffer)
+                if features is None:
+                    return dict(EXTRACTION_ERROR)
+
+                result = self.detect_style_from_features(features)
             end_time = time.time()
             elapsed_time = end_time - start_time
             print(f"Tiempo de ejecución para detectar estilo: {elapsed_time:.2f} segundos")
-            return {
-                "status": "success",
-                "style": self.style_spanish_mapping[style],
-            }
+            return result
 
         except Exception as e:
             return {
@@ -347,12 +156,55 @@ class ChessStyleAnalyzer:
                 "message": f"Error inesperado: {str(e)}"
             }
 
+    def detect_style_from_features(self, features):
+        """Predice el estilo a partir de las 360 características ya extraídas.
+        Si se recibe un buffer float32 (1, 360), se escala sobre el mismo buffer"""
+        features = as_feature_buffer(features, STYLE_TOTAL_FEATURES)
+        if not getattr(self.model, "scaler_folded", False):
+            scale_in_place(self.scaler, features)
+        pred = self.model.predict(features, verbose=0)
+        style_code = np.argmax(pred)
+        style = self.label_encoder.inverse_transform([style_code])[0]
+        return {
+            "status": "success",
+            "style": self.style_spanish_mapping[style],
+        }
+
+    def detect_styles(self, pgns, colors, executor=None):
+        """Detecta el estilo de varias partidas con un único escalado y una sola predicción.
+        Devuelve, en el orden de entrada, el mismo resultado (o error) que `detect_style`"""
+        pgns = list(pgns)
+        colors = colors if isinstance(colors, str) else list(colors)
+        if not isinstance(colors, str) and len(colors) != len(pgns):
+            raise ValueError("Se necesita un color por partida")
+        try:
+            start_time = time.time()
+            features, indices, errors = extract_many(pgns, colors, executor=executor)
+            results = [errors.get(index) for index in range(len(pgns))]
+            if indices:
+                if not getattr(self.model, "scaler_folded", False):
+                    scale_in_place(self.scaler, features)
+                pred = self.model.predict(features, verbose=0)
+                styles = self.label_encoder.inverse_transform(np.argmax(pred, axis=1))
+                for index, style in zip(indices, styles):
+                    results[index] = {
+                        "status": "success",
+                        "style": self.style_spanish_mapping[style],
+                    }
+            elapsed_time = time.time() - start_time
+            print(f"Tiempo de ejecución para detectar {len(results)} estilos: {elapsed_time:.2f} segundos")
+            return results
+
+        except Exception as e:
+            return [{"status": "error", "message": f"Error inesperado: {str(e)}"} for _ in pgns]
+
     @classmethod
     def load_model(cls, filename):
         """Carga el modelo y metadatos con verificación de integridad"""
         analyzer = cls()
 
         # Cargar metadatos
+        import joblib
         with open(f"{filename}_data.joblib", 'rb') as f:
             model_data = joblib.load(f)
 
@@ -363,10 +215,14 @@ class ChessStyleAnalyzer:
         analyzer.opening_mapping = model_data['opening_mapping']
         analyzer.style_spanish_mapping = model_data.get('style_spanish_mapping', {})
 
-        try:
-            analyzer.model = load_model(f"{filename}.keras")
-        except:
-            analyzer.model = load_model(f"{filename}.h5")
+        # Motor NumPy con los pesos exportados; Keras solo si no existen
+        analyzer.model = load_inference_model(filename)
+        if analyzer.model is None:
+            from tensorflow.keras.models import load_model
+            try:
+                analyzer.model = load_model(f"{filename}.keras")
+            except:
+                analyzer.model = load_model(f"{filename}.h5")
 
         print(f"Modelo cargado exitosamente desde {filename}")
         return analyzer
\ No newline at end of file
@@ -0,0 +1,152 @@
+import asyncio
+import os
+import threading
+import time
+from collections import OrderedDict, deque
+
+from models.features.cancellation import TIMEOUT_ERROR
+from open_reper.threads import apply_thread_budget
+
+# Análisis que pueden esperar turno (en total y por sesión); el resto recibe BUSY_ERROR al momento
+ANALYSIS_QUEUE = int(os.environ.get("OPEN_REPER_ANALYSIS_QUEUE", 32))
+ANALYSIS_QUEUE_PER_SESSION = int(os.environ.get("OPEN_REPER_ANALYSIS_QUEUE_PER_SESSION", 2))
+
+BUSY_ERROR = {
+    "status": "busy",
+    "message": "El servidor está ocupado, inténtalo de nuevo en unos segundos"
+}
+
+
+class AdmissionController:
+    """Limita los análisis simultáneos de un worker y reparte los turnos entre sesiones
+
+    Hasta `limit` análisis se ejecutan a la vez; los siguientes esperan en una
+    cola acotada sin ocupar hilos. Los turnos se dan por rondas entre sesiones,
+    así que una sesión que envía muchas partidas no deja atrás a las demás. Con
+    la cola (o la cuota de la sesión) llena se responde BUSY_ERROR en el acto.
+    """
+
+    def __init__(self, limit=None, max_queue=ANALYSIS_QUEUE, max_queue_per_session=ANALYSIS_QUEUE_PER_SESSION):
+        self._limit = limit
+        self.max_queue = max_queue
+        self.max_queue_per_session = max_queue_per_session
+        self._queues = OrderedDict()
+        self._lock = threading.Lock()
+        self.running = 0
+        self.queued = 0
+        self.admitted = 0
+        self.waited = 0
+        self.rejected = 0
+        self.gave_up = 0
+        self.max_queued = 0
+        self.wait_seconds = 0.0
+
+    @property
+    def limit(self):
+        if self._limit is None:
+            self._limit = max(apply_thread_budget()["analysis_concurrency"], 1)
+        return self._limit
+
+    async def acquire(self, session=None, token=None):
+        """Espera turno. Devuelve None con el turno concedido (hay que llamar a `release`)
+        o el dict de error: BUSY_ERROR si no cabe en la cola, o el error de `token` si
+        se cancela o vence mientras espera"""
+        with self._lock:
+            if self.running < self.limit and not self.queued:
+                self.running += 1
+                self.admitted += 1
+                return None
+            # Sin sesión, cada petición cuenta como una sesión propia
+            session = session if session is not None else object()
+            queue = self._queues.get(session)
+            if (self.queued >= self.max_queue
+                    or (queue is not None and len(queue) >= self.max_queue_per_session)):
+                self.rejected += 1
+                return dict(BUSY_ERROR)
+            turn = asyncio.get_running_loop().create_future()
+            self._queues.setdefault(session, deque()).append(turn)
+            self.queued += 1
+            self.max_queued = max(self.max_queued, self.queued)
+
+        start = time.monotonic()
+        stop = None
+        try:
+            if token is None:
+                await asyncio.shield(turn)
+            else:
+                loop = asyncio.get_running_loop()
+                stop = loop.create_future()
+                token.on_cancel(lambda: loop.call_soon_threadsafe(lambda: stop.done() or stop.set_result(None)))
+                await asyncio.wait({turn, stop}, timeout=token.remaining(), return_when=asyncio.FIRST_COMPLETED)
+        finally:
+            if stop is not None:
+                stop.cancel()
+            granted = self._withdraw(session, turn)
+            with self._lock:
+                if granted:
+                    self.wait_seconds += time.monotonic() - start
+                    self.waited += 1
+                    self.admitted += 1
+                else:
+                    self.gave_up += 1
+        if granted:
+            return None
+        return token.error() or dict(TIMEOUT_ERROR)
+
+    def _withdraw(self, session, turn):
+        # Quien deja de esperar sale de la cola; si el turno ya se le había dado, lo conserva
+        with self._lock:
+            if turn.done() and not turn.cancelled():
+                return True
+            turn.cancel()
+            queue = self._queues.get(session)
+            if queue is not None and turn in queue:
+                queue.remove(turn)
+                self.queued -= 1
+                if not queue:
+                    del self._queues[session]
+            return False
+
+    def release(self):
+        """Libera un turno y se lo pasa a la siguiente sesión en espera"""
+        with self._lock:
+            while self._queues:
+                session, queue = next(iter(self._queues.items()))
+                turn = queue.popleft()
+                self.queued -= 1
+                if queue:
+                    self._queues.move_to_end(session)
+                else:
+                    del self._queues[session]
+                if not turn.done():
+                    # El turno pasa directamente: `running` no cambia
+                    turn.get_loop().call_soon_threadsafe(self._grant, turn)
+                    return
+            self.running -= 1
+
+    def _grant(self, turn):
+        # Si quien esperaba se fue entre tanto, el turno pasa al siguiente
+        if turn.done():
+            self.release()
+        else:
+            turn.set_result(None)
+
+    def stats(self):
+        with self._lock:
+            return {
+                "limit": self.limit,
+                "in_flight": self.running,
+                "queued": self.queued,
+                "queued_sessions": len(self._queues),
+                "max_queue": self.max_queue,
+                "max_queue_per_session": self.max_queue_per_session,
+                "admitted": self.admitted,
+                "waited": self.waited,
+                "rejected": self.rejected,
+                "gave_up": self.gave_up,
+                "max_queued": self.max_queued,
+                "avg_wait_ms": 1000 * self.wait_seconds / self.waited if self.waited else 0.0
+            }
+
+
+admission = AdmissionController()
@@ -0,0 +1,190 @@
+import asyncio
+import os
+import time
+from concurrent.futures import FIRST_COMPLETED, Future, wait
+from functools import partial
+
+from models.features.buffers import opening_buffers, style_buffers
+from models.features.cancellation import TIMEOUT_ERROR, AnalysisCancelled
+from models.features.extraction import MOVES_TO_ANALYZE, scan_pgn
+from open_reper.admission import admission
+from open_reper.coalescer import submit_prediction
+from open_reper.extraction_pool import extraction_pool
+from open_reper.model_loader import analyzer, model_version, recommender
+from open_reper.result_cache import result_cache, result_key
+from open_reper.single_flight import SingleFlight
+
+# Recomendación especulativa: los tres estilos se evalúan a la vez que se detecta el estilo
+SPECULATIVE_RECOMMENDATION = os.environ.get("OPEN_REPER_SPECULATIVE", "1") != "0"
+
+# Análisis en curso por clave de partida
+analysis_flights = SingleFlight("analysis")
+
+# Etapas del análisis: porcentaje alcanzado y texto para la interfaz
+PROGRESS_STAGES = {
+    "parsed": (15, "Partida leída"),
+    "plies": (15, "Jugadas analizadas: {} de {}"),
+    "features": (60, "Características extraídas"),
+    "style": (80, "Estilo detectado: {}"),
+    "openings": (100, "Aperturas ordenadas"),
+    "cached": (100, "Resultado recuperado de la caché")
+}
+
+
+def _no_progress(stage, detail=None):
+    pass
+
+
+def run_analysis(pgn_text, color, use_cache=True, token=None, progress=None):
+    """Detecta el estilo y recomienda aperturas leyendo y reproduciendo la partida una sola vez.
+    Con `use_cache` los resultados correctos se guardan y se reutilizan para la misma partida,
+    y las peticiones simultáneas de la misma partida comparten un único cálculo.
+    Con `token` (CancelToken) el análisis se detiene y devuelve su error al cancelarse o vencer.
+    `progress(etapa, detalle)` recibe las etapas de PROGRESS_STAGES a medida que se completan"""
+    if not use_cache:
+        return _analyze(pgn_text, color, token, progress)
+
+    key = _analysis_key(pgn_text, color)
+    if isinstance(key, dict):
+        return key
+    return analysis_flights.run(key, partial(_cached_analysis, key, pgn_text, color), token, progress)
+
+
+async def analyze(pgn_text, color, executor=None, token=None, progress=None, session=None):
+    """`run_analysis` para los manejadores asíncronos: el cálculo va al executor y las
+    peticiones repetidas esperan en el bucle de eventos sin ocupar hilos. Si `token` se
+    cancela o vence, se deja de esperar en el acto. `progress` se llama desde el hilo del cálculo.
+    Los análisis nuevos pasan por el control de admisión: con el servidor saturado esperan
+    turno (repartido entre sesiones) o reciben BUSY_ERROR"""
+    # La validación recorre el texto completo (hasta MAX_PGN_LENGTH): no se hace en el bucle de eventos
+    key = await asyncio.get_running_loop().run_in_executor(executor, _analysis_key, pgn_text, color)
+    if isinstance(key, dict):
+        return key
+    flight = partial(_cached_analysis, key, pgn_text, color)
+    # Sumarse a un análisis en curso no añade trabajo: no necesita turno
+    if analysis_flights.in_flight(key):
+        return await analysis_flights.run_async(key, flight, executor, token, progress)
+
+    error = await admission.acquire(session, token)
+    if error:
+        return error
+    try:
+        return await analysis_flights.run_async(key, flight, executor, token, progress)
+    finally:
+        admission.release()
+
+
+async def analyze_stream(pgn_text, color, executor=None, token=None, session=None):
+    """Generador asíncrono de `analyze`: produce (porcentaje, texto) por cada etapa completada
+    y termina con (100, resultado), donde el resultado es el dict del análisis"""
+    loop = asyncio.get_running_loop()
+    updates = asyncio.Queue()
+
+    def progress(stage, detail=None):
+        loop.call_soon_threadsafe(updates.put_nowait, progress_message(stage, detail))
+
+    task = asyncio.ensure_future(analyze(pgn_text, color, executor, token, progress, session))
+    try:
+        while not task.done():
+            update = asyncio.ensure_future(updates.get())
+            await asyncio.wait({task, update}, return_when=asyncio.FIRST_COMPLETED)
+            if update.done():
+                yield update.result()
+            else:
+                update.cancel()
+        yield 100, task.result()
+    finally:
+        # El consumidor puede dejar el generador a medias: el análisis no se queda huérfano
+        task.cancel()
+
+
+def progress_message(stage, detail=None):
+    """(porcentaje, texto) para mostrar una etapa del análisis"""
+    percent, text = PROGRESS_STAGES[stage]
+    if stage == "plies":
+        percent += round((PROGRESS_STAGES["features"][0] - percent) * detail / MOVES_TO_ANALYZE)
+        text = text.format(detail, MOVES_TO_ANALYZE)
+    elif stage == "style":
+        text = text.format(detail)
+    return percent, text
+
+
+def _analysis_key(pgn_text, color):
+    # Una sola lectura de tokens valida el PGN completo y da las jugadas de la clave
+    error, tokens, headers = scan_pgn(pgn_text)
+    if error:
+        return error
+    return result_key(pgn_text, color, model_version(), tokens, headers)
+
+
+def _cached_analysis(key, pgn_text, color, token=None, progress=None):
+    result = result_cache.get(key)
+    if result is None:
+        result = _analyze(pgn_text, color, token, progress, validated=True)
+        if result["status"] == "success":
+            result_cache.put(key, result)
+    elif progress is not None:
+        progress("cached")
+    return result
+
+
+def _wait_result(future, token=None):
+    """Resultado de `future`. Si `token` se cancela o vence antes, se cancela el futuro
+    y se lanza AnalysisCancelled con el error del token"""
+    if token is None:
+        return future.result()
+    stop = Future()
+    token.on_cancel(lambda: stop.set_result(None))
+    wait({future, stop}, timeout=token.remaining(), return_when=FIRST_COMPLETED)
+    if future.done():
+        return future.result()
+    future.cancel()
+    raise AnalysisCancelled(token.error() or TIMEOUT_ERROR)
+
+
+def _analyze(pgn_text, color, token=None, progress=None, validated=False):
+    progress = progress or _no_progress
+    try:
+        start_time = time.time()
+        with style_buffers.borrow() as style_buffer, opening_buffers.borrow() as opening_buffer:
+            analysis = extraction_pool.analyze(pgn_text, color, style_buffer, opening_buffer, token, progress, validated)
+            if analysis["status"] != "success":
+                return analysis
+            progress("features")
+            # Sin inferencia si el trabajo ya no interesa
+            if token is not None:
+                token.check()
+
+            # Mientras se predice el estilo, el recomendador ya evalúa los tres estilos posibles
+            speculative = None
+            if SPECULATIVE_RECOMMENDATION:
+                speculative = submit_prediction(recommender.model, recommender.style_variants(opening_buffer))
+
+            result = analyzer.detect_style_from_features(style_buffer)
+            if result["status"] != "success":
+                return result
+
+            style = result["style"]
+            progress("style", style)
+            if token is not None:
+                token.check()
+            if speculative is not None:
+                openings = recommender.recommend_from_variants(_wait_result(speculative, token), style.lower())
+            else:
+                openings = recommender.recommend_from_features(opening_buffer, style.lower())
+            progress("openings")
+        elapsed_time = time.time() - start_time
+        print(f"Tiempo de ejecución del análisis completo: {elapsed_time:.2f} segundos")
+        return {
+            "status": "success",
+            "style": style,
+            "openings": openings
+        }
+
+    except AnalysisCancelled as e:
+        return e.error
+    except Exception as e:
+        return {
+            "status": "error",
+            "message": f"Error inesperado: {str(e)}"
+        }
@@ -0,0 +1,70 @@
+from fastapi import FastAPI
+from fastapi.responses import JSONResponse
+
+from models.features.buffers import opening_buffers, style_buffers
+from models.features.pawn_hash import pawn_hash
+from models.features.position_cache import position_cache
+from open_reper.admission import admission
+from open_reper.analysis import analysis_flights
+from open_reper.extraction_pool import extraction_pool
+from open_reper.jobs import session_jobs
+from open_reper.model_loader import analyzer, load_report, recommender
+from open_reper.prefork import process_memory
+from open_reper.result_cache import result_cache
+from open_reper.threads import effective_threads, thread_budget
+from open_reper.warmup import is_ready, warmup_report
+
+# Endpoints propios del backend, montados en la app de Reflex con `api_transformer`
+api = FastAPI()
+
+
+def _model_stats(handle):
+    # Consultar métricas no debe cargar un modelo que aún no se ha usado
+    if not handle.loaded:
+        return {}
+    stats = getattr(handle.model, "stats", None)
+    return stats() if stats else {}
+
+
+def metrics():
+    """Estado de los modelos, cachés y buffers del backend"""
+    return {
+        "ready": is_ready(),
+        "warmup": dict(warmup_report),
+        "inference": {
+            "style": _model_stats(analyzer),
+            "opening": _model_stats(recommender)
+        },
+        "extraction": extraction_pool.stats(),
+        "model_load_seconds": load_report(),
+        "memory": process_memory(),
+        "threads": {"budget": dict(thread_budget), "effective": effective_threads()},
+        "result_cache": result_cache.stats(),
+        "admission": admission.stats(),
+        "analysis_in_flight": analysis_flights.stats(),
+        "analysis_jobs": session_jobs.stats(),
+        "position_cache": position_cache.stats(),
+        "pawn_hash": pawn_hash.stats(),
+        "buffers": {
+            "style_allocated": style_buffers.allocated,
+            "opening_allocated": opening_buffers.allocated
+        }
+    }
+
+
+@api.get("/ready")
+async def ready():
+    """200 cuando la réplica está calentada; 503 mientras tanto, para el balanceador"""
+    return JSONResponse({"ready": is_ready(), "warmup": dict(warmup_report)}, status_code=200 if is_ready() else 503)
+
+
+@api.get("/metrics")
+async def get_metrics():
+    return metrics()
+
+
+@api.get("/load")
+async def load():
+    """Carga de análisis del worker (en curso y en cola), para el autoescalado"""
+    stats = admission.stats()
+    return {key: stats[key] for key in ("limit", "in_flight", "queued", "rejected")}
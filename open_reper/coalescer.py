@@ -0,0 +1,140 @@
+import numpy as np
+import os
+import queue
+import threading
+import time
+from concurrent.futures import Future
+
+# Ventana de espera para juntar filas y tamaño máximo de lote
+BATCH_WINDOW_MS = float(os.environ.get("OPEN_REPER_BATCH_WINDOW_MS", 2))
+MAX_BATCH_SIZE = int(os.environ.get("OPEN_REPER_MAX_BATCH_SIZE", 32))
+
+
+class InferenceCoalescer:
+    """Dueño único de un modelo: agrupa las filas que llegan de varios hilos en una sola pasada
+
+    Un hilo dedicado espera la primera fila, junta las que lleguen durante
+    `window_ms` (o hasta `max_batch`), ejecuta un único `predict` y resuelve el
+    futuro de cada llamada con su fila de probabilidades. `predict` mantiene la
+    interfaz de `keras.Model.predict`, así que puede sustituir al modelo.
+    """
+
+    def __init__(self, model, name="model", window_ms=BATCH_WINDOW_MS, max_batch=MAX_BATCH_SIZE):
+        self.model = model
+        self.name = name
+        self.window = window_ms / 1000
+        self.max_batch = max(max_batch, 1)
+        self._lock = threading.Lock()
+        self._batches = 0
+        self._rows = 0
+        self._max_batch_seen = 0
+        self._batch_sizes = {}
+        self._restart_lock = threading.Lock()
+        self._start_worker()
+
+    def _start_worker(self):
+        # Los hilos no sobreviven a un fork: cada proceso arranca el suyo (ver `submit`)
+        self._queue = queue.Queue()
+        self._worker = threading.Thread(
+            target=self._run, args=(self._queue,), name=f"inference-{self.name}", daemon=True)
+        self._worker.start()
+        # El pid se anota al final: quien lo vea ya encola en la cola nueva
+        self._pid = os.getpid()
+
+    def _restart_after_fork(self):
+        # En el padre nunca se toma (el pid coincide), así que el hijo no lo hereda tomado
+        with self._restart_lock:
+            if self._pid == os.getpid():
+                return
+            # El lock de las métricas heredado podría estar tomado por un hilo que ya no existe
+            self._lock = threading.Lock()
+            self._start_worker()
+
+    @property
+    def scaler_folded(self):
+        return getattr(self.model, "scaler_folded", False)
+
+    def submit(self, features):
+        """Encola las filas (n, entradas) y devuelve un futuro con sus probabilidades (n, clases)"""
+        # Sin copia: los buffers float32 del llamador se encolan tal cual
+        rows = np.asarray(features, dtype=np.float32)
+        if rows.ndim == 1:
+            rows = rows.reshape(1, -1)
+        if self._pid != os.getpid():
+            self._restart_after_fork()
+        future = Future()
+        self._queue.put((rows, future))
+        return future
+
+    def predict(self, features, verbose=0):
+        return self.submit(features).result()
+
+    def _collect(self, requests):
+        """Espera la primera petición y junta las que lleguen dentro de la ventana"""
+        batch = [requests.get()]
+        size = batch[0][0].shape[0]
+        deadline = time.monotonic() + self.window
+        while size < self.max_batch:
+            remaining = deadline - time.monotonic()
+            try:
+                item = requests.get(timeout=remaining) if remaining > 0 else requests.get_nowait()
+            except queue.Empty:
+                break
+            batch.append(item)
+            size += item[0].shape[0]
+        return batch, size
+
+    def _run(self, requests):
+        while True:
+            batch, size = self._collect(requests)
+            # Las peticiones que ya nadie espera (futuro cancelado) no entran en el lote
+            batch = [(rows, future) for rows, future in batch if future.set_running_or_notify_cancel()]
+            if not batch:
+                continue
+            size = sum(rows.shape[0] for rows, _ in batch)
+            try:
+                probabilities = self.model.predict(np.concatenate([rows for rows, _ in batch]), verbose=0)
+            except Exception as e:
+                for _, future in batch:
+                    future.set_exception(e)
+                continue
+
+            start = 0
+            for rows, future in batch:
+                end = start + rows.shape[0]
+                future.set_result(probabilities[start:end])
+                start = end
+            self._record(size)
+
+    def _record(self, size):
+        with self._lock:
+            self._batches += 1
+            self._rows += size
+            self._max_batch_seen = max(self._max_batch_seen, size)
+            self._batch_sizes[size] = self._batch_sizes.get(size, 0) + 1
+
+    def stats(self):
+        with self._lock:
+            return {
+                "model": self.name,
+                "queue_depth": self._queue.qsize(),
+                "batches": self._batches,
+                "rows": self._rows,
+                "mean_batch_size": self._rows / self._batches if self._batches else 0.0,
+                "max_batch_size": self._max_batch_seen,
+                "batch_sizes": dict(sorted(self._batch_sizes.items()))
+            }
+
+
+def submit_prediction(model, features):
+    """Futuro con las probabilidades de `model`. Si el modelo no tiene coalescedor
+    se evalúa en el hilo actual y se devuelve el futuro ya resuelto"""
+    submit = getattr(model, "submit", None)
+    if submit is not None:
+        return submit(features)
+    future = Future()
+    try:
+        future.set_result(model.predict(features, verbose=0))
+    except Exception as e:
+        future.set_exception(e)
+    return future
@@ -0,0 +1,298 @@
+import multiprocessing
+import os
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor, TimeoutError
+from concurrent.futures.process import BrokenProcessPool
+
+from models.features.cancellation import CancelToken
+from models.features.extraction import analyze_pgn
+from open_reper.threads import apply_thread_budget
+
+# Tareas que atiende cada proceso antes de reciclarse (acota fugas y crecimiento de cachés)
+MAX_TASKS_PER_WORKER = int(os.environ.get("OPEN_REPER_EXTRACTION_MAX_TASKS", 500))
+# forkserver: los procesos no heredan los hilos de inferencia ni los modelos del padre
+START_METHOD = os.environ.get("OPEN_REPER_EXTRACTION_START_METHOD", "forkserver")
+# Cada cuánto se comprueba la cancelación mientras se espera a un proceso, en segundos
+CANCEL_POLL = 0.05
+# Trabajos en el pool con marca de cancelación y progreso compartidos; los que no caben solo llevan el plazo
+JOB_SLOTS = 256
+# Campos de cada hueco: marca de cancelación, jugadas leídas y jugadas analizadas
+SLOT_FIELDS = 3
+
+# Memoria compartida con el padre, en cada proceso hijo (ver `_JobSlots`)
+_job_state = None
+
+
+class _JobSlots:
+    """Memoria compartida entre el padre y los procesos del pool: por trabajo, una marca de
+    cancelación que escribe el padre y el progreso que escribe el proceso
+
+    Cada trabajo ocupa un hueco hasta que su futuro termina, aunque el padre lo
+    haya abandonado: así un proceso que aún lo ejecuta nunca lee la marca ni
+    pisa el progreso de otro trabajo.
+    """
+
+    def __init__(self, context, count=JOB_SLOTS):
+        self.state = context.RawArray("i", count * SLOT_FIELDS)
+        self._free = list(range(count))
+        self._lock = threading.Lock()
+
+    def acquire(self):
+        with self._lock:
+            if not self._free:
+                return None
+            slot = self._free.pop()
+        base = slot * SLOT_FIELDS
+        self.state[base:base + SLOT_FIELDS] = [0] * SLOT_FIELDS
+        return slot
+
+    def release(self, slot):
+        with self._lock:
+            self._free.append(slot)
+
+    def cancel(self, slot, future):
+        # Con el cerrojo: si el futuro ya terminó, el hueco puede ser ya de otro trabajo
+        with self._lock:
+            if not future.done():
+                self.state[slot * SLOT_FIELDS] = 1
+
+    def forward(self, slot, progress, forwarded):
+        """Pasa a `progress` las etapas que el proceso ha escrito desde la última llamada"""
+        base = slot * SLOT_FIELDS
+        # El proceso escribe primero las jugadas leídas: se leen en orden inverso
+        plies = self.state[base + 2]
+        parsed = self.state[base + 1]
+        if parsed and not forwarded[0]:
+            forwarded[0] = parsed
+            progress("parsed", parsed)
+        if forwarded[0] and plies > forwarded[1]:
+            forwarded[1] = plies
+            progress("plies", plies)
+
+
+class _SharedCancelToken(CancelToken):
+    """Token del proceso hijo: además del plazo atiende la marca que pone el padre al cancelar"""
+
+    def __init__(self, deadline, slot):
+        super().__init__(deadline)
+        self.base = slot * SLOT_FIELDS
+
+    def error(self):
+        if _job_state[self.base] and not self.cancelled:
+            self.cancel()
+        return super().error()
+
+
+def _shared_progress(slot):
+    # El proceso hijo deja su progreso en el hueco del trabajo; el padre lo reenvía
+    base = slot * SLOT_FIELDS
+
+    def progress(stage, detail=None):
+        if stage == "parsed":
+            _job_state[base + 1] = detail
+        elif stage == "plies":
+            _job_state[base + 2] = detail
+    return progress
+
+
+def _init_worker(warmup_pgn, job_state=None):
+    global _job_state
+    _job_state = job_state
+    # Se calientan parser, tabla de peones y caché de posiciones de cada proceso nuevo
+    if warmup_pgn:
+        analyze_pgn(warmup_pgn, "white")
+
+
+def _extract(pgn_text, color, submitted_at, deadline=None, validated=False, slot=None):
+    """Se ejecuta en el proceso hijo: devuelve el análisis (arrays float32 compactos) y sus tiempos.
+    Con `slot` el análisis se detiene en cuanto el padre marca el trabajo como cancelado,
+    y las etapas "parsed" y "plies" se publican en la memoria compartida"""
+    started_at = time.monotonic()
+    progress = None
+    if slot is not None:
+        token = _SharedCancelToken(deadline, slot)
+        progress = _shared_progress(slot)
+    else:
+        token = CancelToken(deadline) if deadline is not None else None
+    analysis = analyze_pgn(pgn_text, color, token=token, progress=progress, validated=validated)
+    return analysis, started_at - submitted_at, time.monotonic() - started_at, os.getpid()
+
+
+class ExtractionPool:
+    """Pool de procesos para la extracción de características, que es Python puro y retiene el GIL
+
+    Solo viajan el PGN y los dos vectores de características; la inferencia sigue en el
+    proceso padre. Con `processes=0` la extracción se hace en el hilo que llama.
+    """
+
+    def __init__(self, processes=None, max_tasks=MAX_TASKS_PER_WORKER, start_method=START_METHOD):
+        self.processes = processes
+        self.max_tasks = max_tasks
+        self.start_method = start_method
+        self.warmup_pgn = None
+        self._executor = None
+        self._slots = None
+        self._pid = None
+        self._lock = threading.Lock()
+        self._tasks = 0
+        self._errors = 0
+        self._restarts = 0
+        self._abandoned = 0
+        self._queue_wait = 0.0
+        self._max_queue_wait = 0.0
+        self._extraction = 0.0
+        self._worker_pids = set()
+
+    @property
+    def size(self):
+        if self.processes is None:
+            self.processes = apply_thread_budget()["extraction_processes"]
+        return self.processes
+
+    @property
+    def enabled(self):
+        return self.size > 0
+
+    def start(self, warmup_pgn=None):
+        """Arranca los procesos; cada uno (también los reciclados) se calienta con `warmup_pgn`"""
+        if warmup_pgn is not None:
+            self.warmup_pgn = warmup_pgn
+        if self.enabled:
+            self._get_executor()
+        return self
+
+    def _get_executor(self):
+        with self._lock:
+            # Tras un fork el executor heredado no es utilizable: cada proceso crea el suyo
+            if self._executor is None or self._pid != os.getpid():
+                self._pid = os.getpid()
+                context = multiprocessing.get_context(self.start_method)
+                if self.start_method == "forkserver":
+                    # El servidor importa el extractor una vez y cada proceso nace con él cargado
+                    context.set_forkserver_preload([__name__])
+                # Las marcas se comparten al crear cada proceso, también los reciclados
+                self._slots = _JobSlots(context)
+                self._executor = ProcessPoolExecutor(
+                    max_workers=self.size,
+                    mp_context=context,
+                    initializer=_init_worker,
+                    initargs=(self.warmup_pgn, self._slots.state),
+                    max_tasks_per_child=self.max_tasks or None)
+            return self._executor, self._slots
+
+    def _discard(self, executor):
+        with self._lock:
+            if self._executor is executor:
+                self._executor = None
+                self._restarts += 1
+        executor.shutdown(wait=False, cancel_futures=True)
+
+    def analyze(self, pgn_text, color, style_out=None, opening_out=None, token=None, progress=None, validated=False):
+        """Igual que `analyze_pgn`, con la extracción en un proceso del pool. El progreso
+        ("parsed" y "plies") llega desde el proceso a través de la memoria compartida"""
+        if not self.enabled:
+            return analyze_pgn(pgn_text, color, style_out, opening_out, token, progress, validated)
+
+        if token is not None and token.error():
+            return token.error()
+        executor, slots = self._get_executor()
+        deadline = token.deadline if token is not None else None
+        slot = slots.acquire() if token is not None or progress is not None else None
+        future = None
+        try:
+            future = executor.submit(_extract, pgn_text, color, time.monotonic(), deadline, validated, slot)
+            if slot is not None and token is not None:
+                # La cancelación llega al proceso en el acto; el plazo lo vigila el propio proceso
+                token.on_cancel(lambda: slots.cancel(slot, future))
+            outcome = self._wait(future, token, slots, slot, progress)
+            if isinstance(outcome, dict):
+                return outcome
+            analysis, queue_wait, extraction, pid = outcome
+        except BrokenProcessPool as e:
+            # Un proceso murió (OOM, señal): se recrea el pool y esta petición se atiende aquí
+            print(f"Pool de extracción caído, se recrea: {str(e)}")
+            self._discard(executor)
+            with self._lock:
+                self._errors += 1
+            return analyze_pgn(pgn_text, color, style_out, opening_out, token, progress, validated)
+        finally:
+            self._release_slot(future, slots, slot)
+
+        with self._lock:
+            self._tasks += 1
+            self._queue_wait += queue_wait
+            self._max_queue_wait = max(self._max_queue_wait, queue_wait)
+            self._extraction += extraction
+            self._worker_pids.add(pid)
+
+        if analysis["status"] == "success":
+            if progress is not None and slot is None:
+                progress("parsed", None)
+            if style_out is not None:
+                style_out[...] = analysis["style_features"]
+                analysis["style_features"] = style_out
+            if opening_out is not None:
+                opening_out[...] = analysis["opening_features"]
+                analysis["opening_features"] = opening_out
+        return analysis
+
+    @staticmethod
+    def _release_slot(future, slots, slot):
+        # Un trabajo abandonado conserva su hueco hasta que el proceso termina con él
+        if slot is None:
+            return
+        if future is None:
+            slots.release(slot)
+        else:
+            future.add_done_callback(lambda _: slots.release(slot))
+
+    def _wait(self, future, token, slots=None, slot=None, progress=None):
+        """Espera el resultado del proceso reenviando su progreso; si el token se cancela o
+        vence, lo abandona y devuelve el error del token. Si aún estaba en cola ni siquiera
+        llega a ejecutarse, y si ya se ejecutaba, el proceso lo detiene al ver la marca o el plazo"""
+        if token is None and (slot is None or progress is None):
+            return future.result()
+        forwarded = [0, 0]
+        while True:
+            try:
+                outcome = future.result(timeout=CANCEL_POLL)
+            except TimeoutError:
+                if slot is not None and progress is not None:
+                    slots.forward(slot, progress, forwarded)
+                error = token.error() if token is not None else None
+                if error:
+                    future.cancel()
+                    with self._lock:
+                        self._abandoned += 1
+                    return error
+            else:
+                if slot is not None and progress is not None:
+                    slots.forward(slot, progress, forwarded)
+                return outcome
+
+    def shutdown(self):
+        with self._lock:
+            executor, self._executor = self._executor, None
+        if executor is not None:
+            executor.shutdown(wait=True, cancel_futures=True)
+
+    def stats(self):
+        with self._lock:
+            tasks = self._tasks
+            return {
+                "processes": self.size,
+                "max_tasks_per_worker": self.max_tasks,
+                "start_method": self.start_method,
+                "tasks": tasks,
+                "errors": self._errors,
+                "restarts": self._restarts,
+                "abandoned": self._abandoned,
+                "workers_seen": len(self._worker_pids),
+                "avg_queue_wait_ms": round(self._queue_wait / tasks * 1000, 3) if tasks else 0.0,
+                "max_queue_wait_ms": round(self._max_queue_wait * 1000, 3),
+                "avg_extraction_ms": round(self._extraction / tasks * 1000, 3) if tasks else 0.0
+            }
+
+
+extraction_pool = ExtractionPool()
@@ -0,0 +1,69 @@
+import threading
+
+from models.features.cancellation import ANALYSIS_TIMEOUT, TIMEOUT_ERROR, CancelToken
+
+
+class SessionJobs:
+    """Trabajo de análisis vigente de cada sesión del navegador
+
+    Al empezar un trabajo se cancela el anterior de la misma sesión: una partida
+    reenviada o una página abandonada no siguen ocupando el executor.
+    """
+
+    def __init__(self, timeout=ANALYSIS_TIMEOUT):
+        self.timeout = timeout
+        self._jobs = {}
+        self._lock = threading.Lock()
+        self.started = 0
+        self.superseded = 0
+        self.cancelled = 0
+        self.timed_out = 0
+
+    def start(self, session):
+        """Token (con plazo) del nuevo trabajo de `session`; cancela el anterior"""
+        token = CancelToken.with_timeout(self.timeout)
+        with self._lock:
+            previous = self._jobs.get(session)
+            self._jobs[session] = token
+            self.started += 1
+            if previous is not None:
+                self.superseded += 1
+        if previous is not None:
+            previous.cancel()
+        return token
+
+    def current(self, session):
+        """Token del trabajo en curso de `session`, o None"""
+        with self._lock:
+            return self._jobs.get(session)
+
+    def cancel(self, session):
+        """Cancela el trabajo en curso de `session`, si lo hay"""
+        with self._lock:
+            token = self._jobs.pop(session, None)
+            if token is not None:
+                self.cancelled += 1
+        if token is not None:
+            token.cancel()
+
+    def finish(self, session, token, result=None):
+        """Retira el trabajo al terminar; anota si acabó por vencer el plazo"""
+        with self._lock:
+            if self._jobs.get(session) is token:
+                del self._jobs[session]
+            if result is not None and result.get("message") == TIMEOUT_ERROR["message"]:
+                self.timed_out += 1
+
+    def stats(self):
+        with self._lock:
+            return {
+                "active": len(self._jobs),
+                "started": self.started,
+                "superseded": self.superseded,
+                "cancelled": self.cancelled,
+                "timed_out": self.timed_out,
+                "timeout_seconds": self.timeout
+            }
+
+
+session_jobs = SessionJobs()
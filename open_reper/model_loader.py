@@ -1,5 +1,116 @@
-from models.style_detector.chess_model import ChessStyleAnalyzer
-from models.opening_recommender.opening_recommender_model import OpeningRecommender
+import functools
+import glob
+import hashlib
+import os
+import threading
+import time
 
-analyzer = ChessStyleAnalyzer.load_model("models/style_detector/chess_model")
-recommender = OpeningRecommender().load_model("models/opening_recommender/opening_recommender_model")
\ No newline at end of file
+from models.inference.numpy_engine import has_exported_weights
+from open_reper.coalescer import InferenceCoalescer
+from open_reper.threads import apply_thread_budget
+
+STYLE_MODEL = "models/style_detector/chess_model"
+OPENING_MODEL = "models/opening_recommender/opening_recommender_model"
+
+
+class LazyModel:
+    """Acceso diferido a un modelo: se carga la primera vez que se usa o con `preload()`
+
+    Los atributos se reenvían al modelo cargado, así que `analyzer.detect_style(...)`
+    funciona igual que con la instancia. Importar este módulo no carga TensorFlow,
+    sklearn ni los pesos.
+    """
+
+    def __init__(self, name, loader, model_path=None):
+        self._name = name
+        self._loader = loader
+        self.model_path = model_path
+        self._instance = None
+        self._lock = threading.Lock()
+        self.load_seconds = None
+
+    @property
+    def loaded(self):
+        return self._instance is not None
+
+    @property
+    def fork_safe(self):
+        """Solo el motor NumPy puede cargarse antes de un fork; TensorFlow no lo admite"""
+        return self.model_path is not None and has_exported_weights(self.model_path)
+
+    def get(self):
+        instance = self._instance
+        if instance is None:
+            with self._lock:
+                if self._instance is None:
+                    # Los pools de BLAS y TensorFlow se dimensionan al crearse: antes de cargar
+                    apply_thread_budget()
+                    start_time = time.time()
+                    self._instance = self._loader()
+                    self.load_seconds = time.time() - start_time
+                    print(f"Tiempo de carga del modelo {self._name}: {self.load_seconds:.2f} segundos")
+                instance = self._instance
+        return instance
+
+    def preload(self):
+        self.get()
+        return self
+
+    def __getattr__(self, attribute):
+        # Los atributos especiales (copy, pickle...) no deben forzar la carga
+        if attribute.startswith("__"):
+            raise AttributeError(attribute)
+        return getattr(self.get(), attribute)
+
+
+def _load_analyzer():
+    from models.style_detector.chess_model import ChessStyleAnalyzer
+
+    analyzer = ChessStyleAnalyzer.load_model(STYLE_MODEL)
+    # Cada modelo tiene un único hilo de inferencia que agrupa las peticiones concurrentes
+    analyzer.model = InferenceCoalescer(analyzer.model, "style")
+    return analyzer
+
+
+def _load_recommender():
+    from models.opening_recommender.opening_recommender_model import OpeningRecommender
+
+    recommender = OpeningRecommender().load_model(OPENING_MODEL)
+    recommender.model = InferenceCoalescer(recommender.model, "opening")
+    return recommender
+
+
+analyzer = LazyModel("style", _load_analyzer, STYLE_MODEL)
+recommender = LazyModel("opening", _load_recommender, OPENING_MODEL)
+
+
+def preload_models(background=False):
+    """Carga ambos modelos; con `background=True` lo hace en un hilo y lo devuelve"""
+    if background:
+        thread = threading.Thread(target=preload_models, name="model-preload", daemon=True)
+        thread.start()
+        return thread
+    analyzer.preload()
+    recommender.preload()
+
+
+@functools.lru_cache(maxsize=None)
+def model_version():
+    """Huella de los archivos de ambos modelos (nombre, tamaño y fecha), o OPEN_REPER_MODEL_VERSION.
+    Cambia al reentrenar o reexportar un modelo, y con ella las claves de la caché de resultados.
+    Se calcula una vez por proceso, igual que los modelos se cargan una vez"""
+    version = os.environ.get("OPEN_REPER_MODEL_VERSION")
+    if version:
+        return version
+    digest = hashlib.blake2b(digest_size=8)
+    for path in (STYLE_MODEL, OPENING_MODEL):
+        for filename in sorted(glob.glob(f"{path}*")):
+            if os.path.isfile(filename):
+                stat = os.stat(filename)
+                digest.update(f"{os.path.basename(filename)}:{stat.st_size}:{stat.st_mtime_ns}\n".encode("utf-8"))
+    return digest.hexdigest()
+
+
+def load_report():
+    """Segundos de carga de cada modelo (None si aún no se ha cargado)"""
+    return {"style": analyzer.load_seconds, "opening": recommender.load_seconds}
@@ -1,5 +1,10 @@
 import reflex as rx
-from open_reper.model_loader import analyzer, recommender
+from open_reper.analysis import analyze_stream
+from open_reper.jobs import session_jobs
+from open_reper.api import api
+from open_reper.prefork import PREFORK, prefork_load
+from open_reper.threads import apply_thread_budget, configure_executor
+from open_reper.warmup import is_ready, warm_up_models
 import asyncio
 import chess
 import chess.svg
@@ -28,6 +33,8 @@ class State(rx.State):
         "plans": []
     }
     is_loading: bool = False
+    progress_percent: int = 0
+    progress_text: str = ""
     error: str = ""
     current_move: int = 0
     board_svg: str = ""
@@ -93,56 +100,92 @@ class State(rx.State):
         """Carga el estado al iniciar la página"""
         self.reset_board()
     
-    @rx.event
+    @rx.event(background=True)
+    async def cancel_analysis(self):
+        """Cancela el análisis en curso de esta sesión. Es una tarea en segundo plano para
+        no esperar al bloqueo del estado, que retiene el propio análisis"""
+        session_jobs.cancel(self.router.session.client_token)
+
+    @rx.event(background=True)
     async def get_recommendation(self):
-        self.is_loading = True
-        self.error = ""
-        color = self.selected_color
+        """Analiza la partida en segundo plano. El estado solo se bloquea para publicar cada
+        etapa del progreso, así que el tablero y la navegación siguen respondiendo"""
+        async with self:
+            session = self.router.session.client_token
+            pgn_text = self.pgn_text
+            color = self.selected_color
+            self.error = ""
+            self.progress_percent = 0
+            self.progress_text = ""
+            if not is_ready():
+                self.error = "El servidor se está preparando, inténtalo de nuevo en unos segundos"
+                return
+            self.is_loading = True
+
+        # Un envío nuevo de la misma sesión cancela el anterior; todos tienen un plazo
+        token = session_jobs.start(session)
+        result = None
         try:
-            result = await asyncio.get_event_loop().run_in_executor(
-                None, 
-                lambda: analyzer.detect_style(self.pgn_text, color)
-            )
-            
-            if result['status'] != 'success':
-                self.error = result['message']
+            # Los textos vacíos, enormes o sin jugadas se rechazan antes de ocupar el executor;
+            # si la misma partida ya se está analizando, se espera ese resultado
+            async for percent, update in analyze_stream(pgn_text, color, token=token, session=session):
+                if isinstance(update, dict):
+                    result = update
+                    continue
+                async with self:
+                    if not token.cancelled:
+                        self.progress_percent = percent
+                        self.progress_text = update
+        except Exception as e:
+            result = {"status": "error", "message": f"Error procesando PGN: {str(e)}"}
+        finally:
+            session_jobs.finish(session, token, result)
+
+        async with self:
+            # Si lo sustituye un análisis más reciente, ese es el que muestra su resultado
+            if session_jobs.current(session) is not None:
                 return
+            self.is_loading = False
+            if result is None or result['status'] == 'cancelled':
+                return
+            try:
+                self._show_recommendation(result)
+            except Exception as e:
+                self.error = f"Error procesando PGN: {str(e)}"
 
-            style = result['style']
-            self.recommendation = {
-                "style": style,
-                "description": self.style_descriptions.get(style, ""),
-            }
+    def _show_recommendation(self, result):
+        """Publica en el estado el estilo, la apertura recomendada y sus partidas modelo"""
+        if result['status'] != 'success':
+            self.error = result['message']
+            return
 
-            result_opening = await asyncio.get_event_loop().run_in_executor(
-                None,
-                lambda: recommender.recommend_for_pgn(self.pgn_text, color, style.lower())
-            )
+        style = result['style']
+        self.recommendation = {
+            "style": style,
+            "description": self.style_descriptions.get(style, ""),
+        }
 
-            if not isinstance(result_opening, list) or len(result_opening) == 0:
-                self.error = "No se encontraron recomendaciones válidas"
-                return
+        result_opening = result['openings']
 
-            recommended_opening = result_opening[0]['apertura']
-            eco_code = self.openings.get(recommended_opening)
-            
-            if not eco_code:
-                self.error = f"No se encontró código ECO para {recommended_opening}"
-                return
+        if not isinstance(result_opening, list) or len(result_opening) == 0:
+            self.error = "No se encontraron recomendaciones válidas"
+            return
 
-            self.recommendation['opening'] = f"Apertura {recommended_opening.replace('_', ' ')}"
-            self.set_recommended_opening(recommended_opening, style)
-            self.game_moves = self._get_model_games(eco_code)
-            self.current_move = 0
-            
-            if self.game_moves:
-                self.board_svg = self._render_board(self.game_moves[:self.current_move+1])
+        recommended_opening = result_opening[0]['apertura']
+        eco_code = self.openings.get(recommended_opening)
+        
+        if not eco_code:
+            self.error = f"No se encontró código ECO para {recommended_opening}"
+            return
+
+        self.recommendation['opening'] = f"Apertura {recommended_opening.replace('_', ' ')}"
+        self.set_recommended_opening(recommended_opening, style)
+        self.game_moves = self._get_model_games(eco_code)
+        self.current_move = 0
+        
+        if self.game_moves:
+            self.board_svg = self._render_board(self.game_moves[:self.current_move+1])
 
-        except Exception as e:
-            self.error = f"Error procesando PGN: {str(e)}"
-        finally:
-            self.is_loading = False
-    
     def update_position(self):
         """Actualiza la posición de las piezas desde el FEN."""
         board = chess.Board(self.fen)
@@ -1053,7 +1096,7 @@ def moves_table():
             width="100%",
         )
 
-@rx.page(route="/send-game", on_load=State.on_load)
+@rx.page(route="/send-game", on_load=[State.cancel_analysis, State.on_load])
 def send_game():
     return rx.box(
         rx.box(
@@ -1166,6 +1209,16 @@ def send_game():
                                 _hover={"bg": "#e03d00"},
                                 font_family=FONT_FAMILY
                             ),
+                            rx.cond(
+                                State.is_loading,
+                                rx.vstack(
+                                    rx.progress(value=State.progress_percent, width="100%", color_scheme="orange"),
+                                    rx.text(State.progress_text, font_family=FONT_FAMILY, size="2"),
+                                    align="center",
+                                    width="100%",
+                                    max_width="400px"
+                                ),
+                            ),
                             rx.cond(
                                 State.error,
                                 rx.text(State.error, color="red", font_weight="bold"),
@@ -1582,7 +1635,16 @@ def recommended_opening():
         }
     )
 
-app = rx.App(stylesheets=["https://fonts.googleapis.com/css2?family=Libre+Baskerville:ital,wght@0,400;0,700;1,400&display=swap"])
-app.add_page(index, route = "/")
+app = rx.App(
+    stylesheets=["https://fonts.googleapis.com/css2?family=Libre+Baskerville:ital,wght@0,400;0,700;1,400&display=swap"],
+    api_transformer=api
+)
+app.register_lifespan_task(configure_executor)
+app.register_lifespan_task(warm_up_models)
+app.add_page(index, route = "/", on_load=State.cancel_analysis)
 app.add_page(send_game, route = "/send-game")
-app.add_page(recommended_opening, route = "/opening-recommended")
\ No newline at end of file
+app.add_page(recommended_opening, route = "/opening-recommended")
+
+apply_thread_budget()
+if PREFORK:
+    prefork_load()
\ No newline at end of file
@@ -0,0 +1,50 @@
+import gc
+import os
+
+from open_reper.model_loader import analyzer, recommender
+
+# Carga previa al fork: con gunicorn --preload (backend de producción de Reflex) los modelos
+# se cargan una sola vez en el proceso padre y los workers comparten sus páginas
+PREFORK = os.environ.get("OPEN_REPER_PREFORK", "0") == "1"
+
+MEMORY_FIELDS = ("Rss", "Pss", "Shared_Clean", "Shared_Dirty", "Private_Clean", "Private_Dirty")
+
+
+def process_memory(pid="self"):
+    """Memoria del proceso en kB según /proc: RSS, PSS y páginas compartidas/privadas.
+    Vacío si /proc no está disponible"""
+    memory = {"pid": os.getpid() if pid == "self" else pid}
+    try:
+        with open(f"/proc/{pid}/smaps_rollup") as f:
+            for line in f:
+                field, _, value = line.partition(":")
+                if field in MEMORY_FIELDS:
+                    memory[field.lower() + "_kb"] = int(value.split()[0])
+    except OSError:
+        try:
+            with open(f"/proc/{pid}/status") as f:
+                for line in f:
+                    if line.startswith("VmRSS:"):
+                        memory["rss_kb"] = int(line.split()[1])
+        except OSError:
+            return {}
+    return memory
+
+
+def prefork_load():
+    """Carga en el padre los modelos que admiten fork y congela el heap del intérprete
+
+    Los pesos quedan en arrays mapeados de solo lectura y `gc.freeze()` saca los
+    objetos ya creados de las pasadas del recolector, así que los workers no
+    escriben en esas páginas y siguen compartidas (copy-on-write).
+    """
+    for handle in (analyzer, recommender):
+        if handle.fork_safe:
+            handle.preload()
+        else:
+            print(f"El modelo {handle._name} usa TensorFlow: se cargará en cada worker")
+    gc.collect()
+    gc.freeze()
+    memory = process_memory()
+    print(f"Modelos cargados antes del fork (pid {memory.get('pid')}, RSS {memory.get('rss_kb', 0) / 1024:.0f} MB, "
+          f"{gc.get_freeze_count()} objetos congelados)")
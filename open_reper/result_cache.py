@@ -0,0 +1,213 @@
+import chess.variant
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+
+from models.features.extraction import PARSE_PLIES, parse_color
+from models.features.pgn_reader import mainline_tokens
+
+# Entradas del nivel en memoria (por proceso) y del nivel SQLite (compartido entre workers)
+RESULT_CACHE_ENTRIES = int(os.environ.get("OPEN_REPER_RESULT_CACHE_ENTRIES", 1024))
+RESULT_CACHE_DISK_ENTRIES = int(os.environ.get("OPEN_REPER_RESULT_CACHE_DISK_ENTRIES", 100000))
+# Vida de un resultado en segundos (7 días); 0 no caduca
+RESULT_CACHE_TTL = float(os.environ.get("OPEN_REPER_RESULT_CACHE_TTL", 7 * 24 * 3600))
+# Ruta de la base SQLite; vacía desactiva el nivel en disco
+RESULT_CACHE_PATH = os.environ.get("OPEN_REPER_RESULT_CACHE_PATH", ".cache/open_reper_results.sqlite")
+
+# Cada cuántas escrituras se recorta la tabla al tamaño máximo
+PRUNE_EVERY = 100
+
+
+def canonical_moves(pgn_text, limit=PARSE_PLIES, tokens=None, headers=None):
+    """Jugadas de la línea principal normalizadas y cabeceras que cambian la posición inicial
+
+    Cabeceras, comentarios, variantes, NAGs y espacios no cuentan. Solo se
+    usan las primeras `limit` jugadas, que son las que lee el análisis. Con
+    `tokens` y `headers` de `scan_pgn` no se vuelve a leer el texto.
+    """
+    if headers is None:
+        headers = {}
+    if tokens is None:
+        tokens = mainline_tokens(pgn_text, headers, limit)
+    moves = [token.replace("0", "O").replace("=", "") for token in tokens[:limit]]
+    # Los alias de una misma variante ("Standard", "Chess"...) comparten clave
+    variant = headers.get("Variant", "").strip().lower() or "chess"
+    try:
+        variant = chess.variant.find_variant(variant).uci_variant + ("960" if "960" in variant else "")
+    except ValueError:
+        pass
+    fen = " ".join(headers.get("FEN", "").split())
+    return moves, variant, fen
+
+
+def result_key(pgn_text, color, model_version, tokens=None, headers=None):
+    """Hash de (jugadas canónicas, color, versión de los modelos)"""
+    moves, variant, fen = canonical_moves(pgn_text, tokens=tokens, headers=headers)
+    color = "white" if parse_color(color) else "black"
+    text = "\n".join((model_version, color, variant, fen, " ".join(moves)))
+    return hashlib.blake2b(text.encode("utf-8"), digest_size=16).hexdigest()
+
+
+class ResultCache:
+    """Caché de resultados de análisis en dos niveles: LRU en memoria y SQLite en disco
+
+    El nivel en disco sobrevive a los reinicios y lo comparten todos los
+    workers; un acierto en disco se copia al LRU del proceso. Los valores se
+    guardan en JSON, así que cada `get` devuelve una copia propia.
+    """
+
+    def __init__(self, path=RESULT_CACHE_PATH, max_entries=RESULT_CACHE_ENTRIES,
+                 max_disk_entries=RESULT_CACHE_DISK_ENTRIES, ttl=RESULT_CACHE_TTL):
+        self.path = path
+        self.max_entries = max_entries
+        self.max_disk_entries = max_disk_entries
+        self.ttl = ttl
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        self._writes = 0
+        self.memory_hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        self.expired = 0
+        self.stores = 0
+        self.disk_errors = 0
+
+    def _connection(self):
+        # sqlite3 no comparte conexiones entre hilos ni procesos: una por hilo y pid
+        connection = getattr(self._local, "connection", None)
+        if connection is not None and self._local.pid == os.getpid():
+            return connection
+        directory = os.path.dirname(self.path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        connection = sqlite3.connect(self.path, timeout=5, isolation_level=None)
+        connection.execute("PRAGMA journal_mode=WAL")
+        connection.execute("PRAGMA synchronous=NORMAL")
+        connection.execute("CREATE TABLE IF NOT EXISTS results (key TEXT PRIMARY KEY, value TEXT NOT NULL, created REAL NOT NULL)")
+        connection.execute("CREATE INDEX IF NOT EXISTS results_created ON results (created)")
+        self._local.connection = connection
+        self._local.pid = os.getpid()
+        return connection
+
+    def _expired(self, created, now):
+        return self.ttl > 0 and now - created > self.ttl
+
+    def _remember(self, key, created, value):
+        if not self.max_entries:
+            return
+        with self._lock:
+            self._entries[key] = (created, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def _disk_get(self, key, now):
+        """Fila (valor, creación) del disco; las caducadas se borran y cuentan como caducadas"""
+        if not self.path:
+            return None, False
+        try:
+            connection = self._connection()
+            row = connection.execute("SELECT value, created FROM results WHERE key = ?", (key,)).fetchone()
+            if row is not None and self._expired(row[1], now):
+                connection.execute("DELETE FROM results WHERE key = ?", (key,))
+                return None, True
+            return row, False
+        except (sqlite3.Error, OSError) as e:
+            with self._lock:
+                self.disk_errors += 1
+            print(f"Error leyendo la caché de resultados: {str(e)}")
+            return None, False
+
+    def get(self, key):
+        now = time.time()
+        expired = False
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                if not self._expired(entry[0], now):
+                    self._entries.move_to_end(key)
+                    self.memory_hits += 1
+                    return json.loads(entry[1])
+                del self._entries[key]
+                expired = True
+
+        row, disk_expired = self._disk_get(key, now)
+        if row is None:
+            with self._lock:
+                self.misses += 1
+                self.expired += expired or disk_expired
+            return None
+        value, created = row
+        self._remember(key, created, value)
+        with self._lock:
+            self.disk_hits += 1
+        return json.loads(value)
+
+    def put(self, key, result):
+        now = time.time()
+        value = json.dumps(result, ensure_ascii=False)
+        self._remember(key, now, value)
+        with self._lock:
+            self.stores += 1
+            self._writes += 1
+            prune = self._writes % PRUNE_EVERY == 0
+        if not self.path:
+            return
+        try:
+            connection = self._connection()
+            connection.execute("INSERT OR REPLACE INTO results (key, value, created) VALUES (?, ?, ?)", (key, value, now))
+            if prune:
+                self.prune(now)
+        except (sqlite3.Error, OSError) as e:
+            with self._lock:
+                self.disk_errors += 1
+            print(f"Error escribiendo la caché de resultados: {str(e)}")
+
+    def prune(self, now=None):
+        """Borra del disco los resultados caducados y los más antiguos por encima del máximo"""
+        connection = self._connection()
+        if self.ttl > 0:
+            connection.execute("DELETE FROM results WHERE created < ?", ((now or time.time()) - self.ttl,))
+        connection.execute(
+            "DELETE FROM results WHERE key IN (SELECT key FROM results ORDER BY created DESC LIMIT -1 OFFSET ?)",
+            (self.max_disk_entries,))
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self.memory_hits = self.disk_hits = self.misses = self.expired = self.stores = 0
+        if self.path:
+            self._connection().execute("DELETE FROM results")
+
+    def stats(self):
+        disk_entries = None
+        if self.path and os.path.exists(self.path):
+            try:
+                disk_entries = self._connection().execute("SELECT COUNT(*) FROM results").fetchone()[0]
+            except (sqlite3.Error, OSError):
+                pass
+        with self._lock:
+            hits = self.memory_hits + self.disk_hits
+            total = hits + self.misses
+            return {
+                "entries": len(self._entries),
+                "max_entries": self.max_entries,
+                "disk_entries": disk_entries,
+                "max_disk_entries": self.max_disk_entries if self.path else 0,
+                "ttl_seconds": self.ttl,
+                "memory_hits": self.memory_hits,
+                "disk_hits": self.disk_hits,
+                "misses": self.misses,
+                "expired": self.expired,
+                "stores": self.stores,
+                "disk_errors": self.disk_errors,
+                "hit_rate": hits / total if total else 0.0
+            }
+
+
+result_cache = ResultCache()
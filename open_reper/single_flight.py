@@ -0,0 +1,184 @@
+import asyncio
+import copy
+import threading
+from concurrent.futures import FIRST_COMPLETED, Future, wait
+
+from models.features.cancellation import TIMEOUT_ERROR, CancelToken
+
+# Claves con esperas que se listan en las métricas
+TOP_WAITING_KEYS = 10
+
+
+class _Flight:
+    __slots__ = ("future", "waiters", "interested", "token", "listeners", "last_progress", "lock")
+
+    def __init__(self, token):
+        self.future = Future()
+        # El futuro nunca se ejecuta en un executor: se marca en curso para que no se pueda cancelar
+        self.future.set_running_or_notify_cancel()
+        self.waiters = 0
+        self.interested = 1
+        self.token = token
+        self.listeners = []
+        self.last_progress = None
+        self.lock = threading.Lock()
+
+    def listen(self, progress):
+        # Quien se une tarde recibe primero la última etapa ya alcanzada
+        with self.lock:
+            self.listeners.append(progress)
+            last = self.last_progress
+        if last is not None:
+            progress(*last)
+
+    def report(self, stage, detail=None):
+        """Reparte una etapa de progreso del cálculo entre todos los que esperan"""
+        with self.lock:
+            self.last_progress = (stage, detail)
+            listeners = list(self.listeners)
+        for progress in listeners:
+            progress(stage, detail)
+
+
+class SingleFlight:
+    """Une las peticiones concurrentes con la misma clave en un único cálculo
+
+    La primera petición de una clave (líder) ejecuta el cálculo; las que llegan
+    mientras sigue en curso esperan su futuro en lugar de repetirlo. Cada
+    llamador recibe su propia copia del resultado. Sirve tanto desde hilos
+    (`run`) como desde el bucle de eventos (`run_async`).
+
+    Con `token`, cada llamador deja de esperar cuando el suyo se cancela o vence,
+    y el cálculo compartido (que lleva su propio token con el plazo del líder)
+    solo se cancela cuando ya no queda nadie esperándolo.
+    """
+
+    def __init__(self, name="flight"):
+        self.name = name
+        self._flights = {}
+        self._lock = threading.Lock()
+        self.leaders = 0
+        self.shared = 0
+        self.abandoned = 0
+        self.max_waiters = 0
+
+    def in_flight(self, key):
+        """True si ya hay un cálculo en curso para `key`"""
+        with self._lock:
+            return key in self._flights
+
+    def join(self, key, token=None, progress=None):
+        """Devuelve (vuelo, True si quien llama es el líder y debe calcularlo).
+        `progress(etapa, detalle)` recibe las etapas que vaya informando el cálculo"""
+        with self._lock:
+            flight = self._flights.get(key)
+            leader = flight is None
+            if leader:
+                flight = _Flight(token)
+                self._flights[key] = flight
+                self.leaders += 1
+            else:
+                flight.waiters += 1
+                flight.interested += 1
+                self.shared += 1
+                self.max_waiters = max(self.max_waiters, flight.waiters)
+        if progress is not None:
+            flight.listen(progress)
+        return flight, leader
+
+    def leave(self, key, flight, leader, progress=None):
+        """Quien llama deja de esperar antes de que termine el cálculo"""
+        if progress is not None:
+            with flight.lock:
+                flight.listeners.remove(progress)
+        with self._lock:
+            if self._flights.get(key) is not flight:
+                return
+            flight.interested -= 1
+            if not leader:
+                flight.waiters -= 1
+            abandoned = flight.interested == 0
+            if abandoned:
+                self._flights.pop(key)
+                self.abandoned += 1
+        if abandoned and flight.token is not None:
+            flight.token.cancel()
+
+    def lead(self, key, flight, function):
+        """Ejecuta `function(token, progress)` como líder y resuelve el futuro de todos los que esperan"""
+        try:
+            result = function(flight.token, flight.report)
+        except BaseException as e:
+            self._finish(key, flight)
+            flight.future.set_exception(e)
+            return
+        self._finish(key, flight)
+        flight.future.set_result(result)
+
+    def _finish(self, key, flight):
+        # Se retira antes de resolver: quien llegue después empieza (o encuentra en caché) otro cálculo
+        with self._lock:
+            if self._flights.get(key) is flight:
+                self._flights.pop(key)
+
+    def run(self, key, function, token=None, progress=None):
+        """Calcula `function(token, progress)` o espera al cálculo en curso de la misma clave.
+        Si `token` se cancela o vence antes del resultado, devuelve su error"""
+        flight, leader = self.join(key, CancelToken(token.deadline) if token is not None else None, progress)
+        if token is None:
+            if leader:
+                self.lead(key, flight, function)
+                return flight.future.result()
+            return copy.deepcopy(flight.future.result())
+
+        if leader:
+            # El cálculo va en su propio hilo: si el líder deja de esperar, los demás lo siguen recibiendo
+            threading.Thread(target=self.lead, args=(key, flight, function), daemon=True).start()
+        stop = Future()
+        token.on_cancel(lambda: stop.set_result(None))
+        wait({flight.future, stop}, timeout=token.remaining(), return_when=FIRST_COMPLETED)
+        if flight.future.done():
+            result = flight.future.result()
+            return result if leader else copy.deepcopy(result)
+        self.leave(key, flight, leader, progress)
+        return token.error() or dict(TIMEOUT_ERROR)
+
+    async def run_async(self, key, function, executor=None, token=None, progress=None):
+        """Como `run`, con el cálculo en `executor`; quien espera no ocupa ningún hilo.
+        Si `token` se cancela o vence antes del resultado, devuelve su error"""
+        flight, leader = self.join(key, CancelToken(token.deadline) if token is not None else None, progress)
+        loop = asyncio.get_running_loop()
+        if leader:
+            loop.run_in_executor(executor, self.lead, key, flight, function)
+        result = asyncio.wrap_future(flight.future)
+        if token is None:
+            return copy.deepcopy(await result)
+
+        stop = loop.create_future()
+        token.on_cancel(lambda: loop.call_soon_threadsafe(lambda: stop.done() or stop.set_result(None)))
+        try:
+            done, _ = await asyncio.wait({result, stop}, timeout=token.remaining(), return_when=asyncio.FIRST_COMPLETED)
+        except asyncio.CancelledError:
+            # La tarea que esperaba se ha cancelado (p. ej. se cerró la conexión)
+            self.leave(key, flight, leader, progress)
+            raise
+        finally:
+            stop.cancel()
+        if result in done:
+            return copy.deepcopy(result.result())
+        self.leave(key, flight, leader, progress)
+        return token.error() or dict(TIMEOUT_ERROR)
+
+    def stats(self):
+        with self._lock:
+            waiting = sorted(((flight.waiters, key) for key, flight in self._flights.items() if flight.waiters),
+                             reverse=True)
+            return {
+                "in_flight": len(self._flights),
+                "waiters": sum(count for count, _ in waiting),
+                "waiters_by_key": {str(key)[:16]: count for count, key in waiting[:TOP_WAITING_KEYS]},
+                "leaders": self.leaders,
+                "shared": self.shared,
+                "abandoned": self.abandoned,
+                "max_waiters": self.max_waiters
+            }
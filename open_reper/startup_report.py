@@ -0,0 +1,66 @@
+import subprocess
+import sys
+import time
+
+TOP_IMPORTS = 15
+
+
+def import_times(module):
+    """Tiempos de `python -X importtime` al importar `module` en un proceso limpio.
+    Devuelve [(acumulado en ms, propio en ms, nivel, nombre)]"""
+    completed = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+        capture_output=True, text=True)
+    times = []
+    for line in completed.stderr.splitlines():
+        if not line.startswith("import time:") or "|" not in line:
+            continue
+        own, cumulative, name = line[len("import time:"):].split("|")
+        if not own.strip().isdigit():
+            continue
+        level = (len(name) - len(name.lstrip())) // 2
+        times.append((int(cumulative) / 1000, int(own) / 1000, level, name.strip()))
+    return times
+
+
+def startup_report(module="open_reper.open_reper", top=TOP_IMPORTS):
+    """Imprime dónde se va el tiempo de arranque: imports y carga de modelos"""
+    times = import_times(module)
+    root = next((i for i, t in enumerate(times) if t[3] == module and t[2] == 0), None)
+    if root is None:
+        print(f"No se pudo importar {module}")
+        return
+    print(f"Import de {module}: {times[root][0]:.0f} ms")
+
+    # -X importtime lista cada módulo después de sus imports: el subárbol del módulo
+    # son las entradas anteriores hasta el import de nivel 0 previo
+    start = root
+    while start > 0 and times[start - 1][2] > 0:
+        start -= 1
+    subtree = times[start:root + 1]
+
+    # Imports directos del módulo agrupados por paquete: reparten su tiempo acumulado
+    packages = {}
+    for cumulative, _, level, name in subtree:
+        if level == 1:
+            package = name.split(".")[0]
+            packages[package] = packages.get(package, 0) + cumulative
+    print("\nTiempo por paquete:")
+    for name, cumulative in sorted(packages.items(), key=lambda item: -item[1])[:top]:
+        print(f"  {cumulative:>9.1f} ms  {name}")
+
+    print("\nMódulos más lentos (tiempo propio):")
+    for _, own, _, name in sorted(subtree, key=lambda t: -t[1])[:top]:
+        print(f"  {own:>9.1f} ms  {name}")
+
+    from open_reper.model_loader import analyzer, recommender
+    print("\nCarga de modelos:")
+    for handle in (analyzer, recommender):
+        start_time = time.time()
+        handle.preload()
+        print(f"  {(time.time() - start_time) * 1000:>9.1f} ms  {handle._name}")
+
+
+if __name__ == "__main__":
+    # Uso: python -m open_reper.startup_report [módulo]
+    startup_report(*sys.argv[1:2])
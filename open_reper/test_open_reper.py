@@ -1,5 +1,40 @@
 import pytest
-from open_reper.model_loader import analyzer, recommender
+import chess
+import chess.pgn
+import asyncio
+import io
+import multiprocessing
+import os
+import threading
+import time
+import numpy as np
+from concurrent.futures import ThreadPoolExecutor
+from open_reper.model_loader import STYLE_MODEL, LazyModel, analyzer, recommender
+from open_reper.analysis import PROGRESS_STAGES, _wait_result, progress_message, run_analysis
+from open_reper.admission import BUSY_ERROR, AdmissionController
+from open_reper.coalescer import InferenceCoalescer
+from open_reper import extraction_pool as pool_module
+from open_reper.extraction_pool import ExtractionPool
+from open_reper.result_cache import ResultCache, result_cache, result_key
+from open_reper.single_flight import SingleFlight
+from open_reper.jobs import SessionJobs
+from models.features.cancellation import CANCELLED_ERROR, TIMEOUT_ERROR, AnalysisCancelled, CancelToken
+from open_reper import warmup
+from open_reper.warmup import is_ready, sample_pgn, warm_up
+from models.features.batch import opening_batch, style_batch
+from models.features.extraction import MAX_PGN_LENGTH, MAX_PLIES, analyze_pgn, extract_move_features, prevalidate_pgn, read_pgn
+from models.features.pgn_reader import mainline_tokens
+from models.features.position_cache import position_key
+from models.inference.numpy_engine import block_matmul, quantize_kernel
+from models.features.replay import replay_mainline
+
+# Las pruebas no deben leer resultados guardados en disco por ejecuciones anteriores
+result_cache.path = ""
+
+# Las pruebas nuevas que cargan el modelo de estilo se saltan si no está en el árbol
+needs_style_model = pytest.mark.skipif(
+    not any(os.path.isfile(f"{STYLE_MODEL}{ext}") for ext in (".keras", ".h5", ".npz")),
+    reason="Falta el modelo de estilo")
 
 pgn = """
 [Event "Rated blitz game"]
@@ -64,4 +99,337 @@ def test_recommendation_invalid_pgn_2():
     assert recommender.recommend_for_pgn(pgn_not_valid_2, "white", "posicional") == {"status": "error", "message": "No se ha enviado un PGN válido"}
     
 def test_recommendation_less_than_30_moves():
-    assert recommender.recommend_for_pgn(pgn_less_than_30_moves, "white", "posicional") == {"status": "error", "message": "El PGN enviado debe contener un mínimo de 30 movimientos"}
\ No newline at end of file
+    assert recommender.recommend_for_pgn(pgn_less_than_30_moves, "white", "posicional") == {"status": "error", "message": "El PGN enviado debe contener un mínimo de 30 movimientos"}
+    
+@needs_style_model
+def test_analysis_white_player():
+    assert run_analysis(pgn, "white") == {"status": "success", "style": "Posicional", "openings": [{"apertura" : "Catalana", "probabilidad" : 0.78}, {"apertura" : "Italiana", "probabilidad" : 0.22}, {"apertura" : "Escocesa", "probabilidad" : 0.00}]}
+    
+def test_analysis_invalid_pgn():
+    assert run_analysis(pgn_not_valid_2, "white") == {"status": "error", "message": "No se ha enviado un PGN válido"}
+    
+def test_analysis_less_than_30_moves():
+    assert run_analysis(pgn_less_than_30_moves, "white") == {"status": "error", "message": "El PGN enviado debe contener un mínimo de 30 movimientos"}
+    
+def test_batch_features_match_single_game():
+    game = chess.pgn.read_game(io.StringIO(pgn))
+    batch = opening_batch([game, game], [chess.WHITE, chess.BLACK])
+    assert batch.shape == (2, 30, 13) and batch.dtype == np.float32
+    assert np.array_equal(batch[0], np.array(extract_move_features(game, chess.WHITE), dtype=np.float32))
+    assert np.array_equal(batch[1], np.array(extract_move_features(game, chess.BLACK), dtype=np.float32))    
+
+def test_batch_features_match_special_moves_and_mixed_lengths():
+    special = [
+        # Captura al paso y enroques corto y largo; menos jugadas que MOVES_TO_ANALYZE
+        "1. e4 a6 2. e5 d5 3. exd6 Qxd6 4. Nf3 Nc6 5. Bc4 Be6 6. O-O Qd7 7. d4 O-O-O 8. Re1 Bxc4 *",
+        # Coronaciones (también a caballo) desde una posición FEN
+        '[FEN "8/P5k1/8/8/8/8/p5K1/8 w - - 0 1"]\n[SetUp "1"]\n\n1. a8=Q a1=N 2. Qb7+ Kg6 3. Qe4+ Kf6 4. Qd4+ Kf7 *',
+    ]
+    games = [chess.pgn.read_game(io.StringIO(text)) for text in special]
+    games += [chess.pgn.read_game(io.StringIO(sample_pgn(seed, plies))) for seed, plies in ((1, 7), (2, 40), (3, 61), (4, 120))]
+    games, colors = games * 2, [chess.WHITE] * len(games) + [chess.BLACK] * len(games)
+    openings, styles = opening_batch(games, colors), style_batch(games, colors)
+    assert openings.shape == (len(games), 30, 13) and styles.shape == (len(games), 30, 12)
+    for game, color, opening, style in zip(games, colors, openings, styles):
+        rows = np.array(extract_move_features(game, color), dtype=np.float32).reshape(-1, 13)
+        assert np.array_equal(opening[:len(rows)], rows) and not opening[len(rows):].any()
+        assert np.array_equal(style[:len(rows)], rows[:, :12]) and not style[len(rows):].any()
+def test_replay_board_matches_chess_board():
+    game = chess.pgn.read_game(io.StringIO(pgn))
+    board = game.board()
+    for move, replay in zip(game.mainline_moves(), replay_mainline(game)):
+        board.push(move)
+        assert (replay.pawns, replay.knights, replay.bishops, replay.rooks, replay.queens, replay.kings) == (board.pawns, board.knights, board.bishops, board.rooks, board.queens, board.kings)
+        assert replay.occupied_co == board.occupied_co and replay.turn == board.turn
+        assert replay.key == position_key(board)
+    
+def test_read_pgn_keeps_only_needed_mainline():
+    game, error = read_pgn(pgn)
+    full_game = chess.pgn.read_game(io.StringIO(pgn))
+    assert error is None and game.plies == 60
+    assert game.mainline_moves() == list(full_game.mainline_moves())[:60]
+    assert game.board() == full_game.board()
+    
+def test_prevalidation_limits():
+    assert prevalidate_pgn(pgn) is None
+    assert prevalidate_pgn("PGN INVALID") == {"status": "error", "message": "No se ha enviado un PGN válido"}
+    assert prevalidate_pgn(pgn_less_than_30_moves) == {"status": "error", "message": "El PGN enviado debe contener un mínimo de 30 movimientos"}
+    assert prevalidate_pgn("1. e4 " * (MAX_PGN_LENGTH // 6 + 1))["message"] == "El PGN enviado supera el tamaño máximo permitido"
+    assert prevalidate_pgn("1. Nf3 Nf6 2. Ng1 Ng8 " * (MAX_PLIES // 4 + 1))["message"] == f"El PGN enviado debe contener un máximo de {MAX_PLIES // 2} movimientos"
+    
+def test_block_matmul_matches_widened_kernel():
+    rng = np.random.default_rng(0)
+    x = rng.standard_normal((5, 300)).astype(np.float32)
+    for precision in ("float16", "int8"):
+        kernel = quantize_kernel(rng.standard_normal((300, 40)), precision)[0]
+        expected = x @ kernel.astype(np.float32)
+        assert np.allclose(block_matmul(x, kernel, block_rows=128), expected, rtol=1e-5, atol=1e-4)
+
+def test_coalescer_matches_direct_predictions():
+    rows = np.random.default_rng(0).standard_normal((16, 393)).astype(np.float32)
+    coalescer = InferenceCoalescer(recommender.model.model, "test", window_ms=20)
+    with ThreadPoolExecutor(max_workers=16) as executor:
+        results = list(executor.map(lambda row: coalescer.predict(row.reshape(1, -1)), rows))
+    assert np.allclose(np.concatenate(results), recommender.model.model.predict(rows), atol=1e-6)
+    stats = coalescer.stats()
+    assert stats["rows"] == 16 and stats["batches"] < 16
+
+def test_coalescer_restarts_one_worker_after_fork():
+    coalescer = InferenceCoalescer(recommender.model.model, "reinicio", window_ms=1)
+    row = np.zeros(393, dtype=np.float32)
+    # Simula el primer uso en un proceso hijo desde varios hilos a la vez
+    coalescer._pid = -1
+    with ThreadPoolExecutor(max_workers=8) as executor:
+        results = list(executor.map(lambda _: coalescer.predict(row), range(8)))
+    # Sin fork real sigue vivo el hilo original: solo debe haberse arrancado uno más
+    workers = [thread for thread in threading.enumerate() if thread.name == "inference-reinicio"]
+    assert len(workers) == 2 and all(result.shape == (1, results[0].shape[1]) for result in results)
+    
+def test_speculative_recommendation_matches_sequential():
+    features = analyze_pgn(pgn, "white")["opening_features"]
+    predictions = recommender.model.predict(recommender.style_variants(features))
+    for style in ("posicional", "combinativo", "universal"):
+        assert recommender.recommend_from_variants(predictions, style) == recommender.recommend_from_features(features.copy(), style)
+
+def test_speculative_wait_gives_up_on_a_stalled_coalescer():
+    started, release = threading.Event(), threading.Event()
+
+    class StalledModel:
+        def predict(self, rows, verbose=0):
+            started.set()
+            release.wait(5)
+            return rows[:, :3]
+
+    coalescer = InferenceCoalescer(StalledModel(), "test", window_ms=0)
+    rows = np.ones((3, 393), dtype=np.float32)
+    coalescer.submit(rows)
+    started.wait(5)
+    stalled = coalescer.submit(rows)
+    with pytest.raises(AnalysisCancelled) as error:
+        _wait_result(stalled, CancelToken.with_timeout(0.05))
+    assert error.value.error == TIMEOUT_ERROR and stalled.cancelled()
+    release.set()
+    # La petición abandonada no tumba el hilo del coalescedor
+    assert coalescer.predict(rows).shape == (3, 3)
+    
+@needs_style_model
+def test_warm_up_sets_ready():
+    assert prevalidate_pgn(sample_pgn()) is None
+    assert warm_up() and is_ready()
+    
+def test_failed_warm_up_retries_then_serves_degraded(monkeypatch):
+    attempts = []
+
+    def missing_model():
+        attempts.append(1)
+        raise OSError("No se encuentra el modelo")
+
+    monkeypatch.setattr(warmup, "preload_models", missing_model)
+    monkeypatch.setattr(warmup, "_ready", threading.Event())
+    monkeypatch.setattr(warmup, "warmup_report", {})
+    assert asyncio.run(warmup.warm_up_models(attempts=3, backoff=0)) is False
+    assert len(attempts) == 3 and warmup.is_ready()
+    assert warmup.warmup_report["status"] == "degraded" and warmup.warmup_report["attempts"] == 3
+
+def test_lazy_model_loads_once_on_first_use():
+    calls = []
+    handle = LazyModel("test", lambda: calls.append(1) or recommender.get())
+    assert not handle.loaded and not calls
+    assert handle.style_spanish_mapping == recommender.style_spanish_mapping
+    handle.preload()
+    assert handle.loaded and len(calls) == 1
+    
+def test_extraction_pool_matches_in_process_extraction():
+    pool = ExtractionPool(processes=2, max_tasks=2)
+    try:
+        pgns = [sample_pgn(seed) for seed in range(5)]
+        for pgn_text in pgns:
+            result, expected = pool.analyze(pgn_text, "black"), analyze_pgn(pgn_text, "black")
+            assert np.array_equal(result["style_features"], expected["style_features"])
+            assert np.array_equal(result["opening_features"], expected["opening_features"])
+        assert pool.analyze("", "white") == analyze_pgn("", "white")
+        stats = pool.stats()
+        assert stats["tasks"] == 6 and stats["workers_seen"] > 2
+    finally:
+        pool.shutdown()
+    
+def test_recommend_many_matches_single_recommendations():
+    pgns = [sample_pgn(seed) for seed in range(4)] + ["", pgn_less_than_30_moves]
+    colors = ["white", "black"] * 3
+    styles = ["posicional", "combinativo", "universal", "desconocido", "universal", "universal"]
+    expected = [recommender.recommend_for_pgn(*item) for item in zip(pgns, colors, styles)]
+    assert recommender.recommend_many(pgns, colors, styles) == expected
+    with pytest.raises(ValueError):
+        recommender.recommend_many(pgns, colors, styles[:2])
+    # El fallo de una partida queda en su resultado y no en el de todo el lote
+    results = recommender.recommend_many(pgns[:2], ["white", None], "universal")
+    assert results[0] == recommender.recommend_for_pgn(pgns[0], "white", "universal") and results[1]["status"] == "error"
+
+@needs_style_model
+def test_detect_styles_matches_per_game_features():
+    pgns = [sample_pgn(seed) for seed in range(4)] + ["", pgn_less_than_30_moves]
+    colors = ["white", "black"] * 3
+    expected = []
+    for item in zip(pgns, colors):
+        analysis = analyze_pgn(*item)
+        if analysis["status"] == "success":
+            analysis = analyzer.detect_style_from_features(analysis["style_features"])
+        expected.append(analysis)
+    assert analyzer.detect_styles(pgns, colors) == expected
+    with pytest.raises(ValueError):
+        analyzer.detect_styles(pgns, colors[:2])
+    results = analyzer.detect_styles(pgns[:2], ["white", None])
+    assert results[0] == expected[0] and results[1]["status"] == "error"
+
+@needs_style_model
+def test_detect_styles_empty_batch():
+    assert analyzer.detect_styles([], []) == []
+    assert analyzer.detect_styles([], "white") == []
+    
+def test_result_key_ignores_headers_comments_and_whitespace():
+    moves = pgn.split("\n\n", 1)[1]
+    assert result_key(pgn, "white", "v1") == result_key(moves, "White", "v1") == result_key("\n" + moves.replace(" ", "  "), "white", "v1")
+    assert result_key(pgn, "white", "v1") != result_key(pgn, "black", "v1")
+    assert result_key(pgn, "white", "v1") != result_key(pgn, "white", "v2")
+
+def test_mainline_tokens_match_python_chess_reader():
+    pgns = [
+        pgn,
+        sample_pgn(3),
+        '[Event "Escapes \\"raros\\" ]"]\n\n1. e4 {comentario\nen dos líneas} e5 $1 2. Nf3!? (2. f4 exf4 (2... d5) 3. Nf3) Nc6 ; resto ignorado\n3. Bb5 a6 *',
+        '% línea de escape\n1. d4 Nf6 2. c4 e6 3. Nc3 Bb4 4. e3 O-O 5. Bd3 d5 6. Nf3 c5 7. 0-0 {[%clk 0:01:00]} Nc6 1/2-1/2',
+        '[FEN "8/P7/8/8/8/8/k6K/8 w - - 0 1"]\n[SetUp "1"]\n\n1. a8=Q+ Kb2 2. Qb7+ (2. Qa1+?? Kxa1) Kc3 *',
+        '1. e4 e5 2. Nf3 Nc6\n\n1. d4 d5 *',
+        '{ inicio (no es variante) } 1. e4 (1. d4 {)} d5) e5 2. Nf3 $14 (2. f4 ; línea\n exf4) Nc6 1-0',
+    ]
+    for text in pgns:
+        game = chess.pgn.read_game(io.StringIO(text))
+        headers = {}
+        board = game.board()
+        moves = [board.push_san(token) for token in mainline_tokens(text, headers)]
+        assert moves == list(game.mainline_moves())
+        assert headers.items() <= dict(game.headers).items()
+
+def test_result_cache_tiers_and_ttl(tmp_path):
+    path = str(tmp_path / "results.sqlite")
+    cache = ResultCache(path=path, max_entries=1, ttl=60)
+    cache.put("a", {"status": "success", "style": "Posicional"})
+    cache.put("b", {"status": "success", "style": "Universal"})
+    assert cache.get("b")["style"] == "Universal" and cache.get("a")["style"] == "Posicional"
+    # Otro proceso (otra instancia) ve el nivel en disco
+    other = ResultCache(path=path, ttl=60)
+    assert other.get("b") == {"status": "success", "style": "Universal"} and other.get("c") is None
+    assert cache.stats()["memory_hits"] == 1 and cache.stats()["disk_hits"] == 1 and other.stats()["misses"] == 1
+    cache.ttl = 1e-9
+    assert cache.get("a") is None and cache.stats()["expired"] == 1
+
+def test_single_flight_shares_one_computation():
+    flights = SingleFlight()
+    calls = []
+    release = threading.Event()
+
+    def compute(token, progress):
+        calls.append(1)
+        release.wait(5)
+        return {"status": "success", "openings": []}
+
+    with ThreadPoolExecutor(max_workers=8) as executor:
+        futures = [executor.submit(flights.run, "partida", compute) for _ in range(8)]
+        while flights.stats()["waiters"] < 7:
+            release.wait(0.01)
+        assert flights.stats()["waiters_by_key"] == {"partida": 7}
+        release.set()
+        results = [future.result() for future in futures]
+    assert len(calls) == 1 and all(result == results[0] for result in results)
+    assert flights.stats()["in_flight"] == 0 and flights.stats()["shared"] == 7
+
+def test_single_flight_keeps_computing_for_followers_when_leader_cancels():
+    flights = SingleFlight()
+    started, release = threading.Event(), threading.Event()
+    shared_tokens = []
+
+    def compute(token, progress):
+        shared_tokens.append(token)
+        started.set()
+        release.wait(5)
+        return {"status": "success", "openings": []}
+
+    leader_token = CancelToken.with_timeout(30)
+    with ThreadPoolExecutor(max_workers=2) as executor:
+        leader = executor.submit(flights.run, "partida", compute, leader_token)
+        started.wait(5)
+        follower = executor.submit(flights.run, "partida", compute, CancelToken.with_timeout(30))
+        while flights.stats()["waiters"] < 1:
+            release.wait(0.01)
+        leader_token.cancel()
+        assert leader.result(5) == CANCELLED_ERROR
+        release.set()
+        assert follower.result(5) == {"status": "success", "openings": []}
+    assert len(shared_tokens) == 1 and not shared_tokens[0].cancelled
+    assert flights.stats()["abandoned"] == 0 and flights.stats()["in_flight"] == 0
+
+def test_cancelled_and_expired_jobs_stop_with_clear_errors():
+    jobs = SessionJobs(timeout=30)
+    first = jobs.start("sesion")
+    second = jobs.start("sesion")
+    assert first.cancelled and not second.cancelled
+    assert analyze_pgn(pgn, "white", token=first) == CANCELLED_ERROR
+    assert analyze_pgn(pgn, "white", token=second)["status"] == "success"
+    assert run_analysis(pgn, "white", use_cache=False, token=CancelToken.with_timeout(1e-9)) == TIMEOUT_ERROR
+    jobs.cancel("sesion")
+    assert second.cancelled and jobs.stats()["superseded"] == 1 and jobs.stats()["active"] == 0
+
+def test_pool_worker_stops_when_parent_flags_cancel(monkeypatch):
+    state = multiprocessing.RawArray("i", 2 * pool_module.SLOT_FIELDS)
+    monkeypatch.setattr(pool_module, "_job_state", state)
+    state[pool_module.SLOT_FIELDS] = 1
+    assert pool_module._extract(pgn, "white", time.monotonic(), None, False, 1)[0] == CANCELLED_ERROR
+    assert pool_module._extract(pgn, "white", time.monotonic(), None, False, 0)[0]["status"] == "success"
+
+@needs_style_model
+def test_analysis_reports_progress_stages_in_order():
+    stages = []
+    result = run_analysis(pgn, "white", use_cache=False, progress=lambda stage, detail=None: stages.append(stage))
+    assert result["status"] == "success"
+    assert stages[0] == "parsed" and "plies" in stages and stages[-3:] == ["features", "style", "openings"]
+    assert stages == sorted(stages, key=list(PROGRESS_STAGES).index)
+    # Con y sin procesos de extracción llegan la lectura y las jugadas analizadas
+    for processes in (0, 1):
+        pool = ExtractionPool(processes=processes)
+        reported = []
+        try:
+            analysis = pool.analyze(pgn, "white", progress=lambda stage, detail=None: reported.append((stage, detail)))
+        finally:
+            pool.shutdown()
+        assert analysis["status"] == "success" and reported[0] == ("parsed", 60) and reported[-1] == ("plies", 30)
+    assert progress_message("plies", 20)[0] == 45 and progress_message("style", "Universal")[1] == "Estilo detectado: Universal"
+
+def test_admission_queues_fairly_and_sheds_load():
+    async def scenario():
+        controller = AdmissionController(limit=1, max_queue=3, max_queue_per_session=2)
+        order = []
+
+        async def submit(session, name):
+            error = await controller.acquire(session)
+            if error:
+                return error
+            order.append(name)
+            await asyncio.sleep(0)
+            controller.release()
+
+        assert await controller.acquire("a") is None
+        tasks = [asyncio.ensure_future(submit(*args)) for args in (("a", "a2"), ("a", "a3"), ("b", "b1"))]
+        await asyncio.sleep(0)
+        # Cuota de la sesión y cola llenas: respuesta inmediata
+        assert await controller.acquire("a") == BUSY_ERROR and await controller.acquire("c") == BUSY_ERROR
+        assert controller.stats()["in_flight"] == 1 and controller.stats()["queued"] == 3
+        cancelled = CancelToken()
+        cancelled.cancel()
+        assert await AdmissionController(limit=0).acquire("d", cancelled) == CANCELLED_ERROR
+        controller.release()
+        await asyncio.gather(*tasks)
+        return order, controller.stats()
+
+    order, stats = asyncio.run(scenario())
+    assert order == ["a2", "b1", "a3"]
+    assert stats["in_flight"] == 0 and stats["queued"] == 0 and stats["rejected"] == 2 and stats["waited"] == 3
@@ -0,0 +1,106 @@
+import asyncio
+import os
+import sys
+from concurrent.futures import ThreadPoolExecutor
+
+# Variables que leen OpenBLAS/MKL/OpenMP/numexpr al arrancar y TensorFlow al crear su runtime
+BLAS_ENV_VARS = ("OMP_NUM_THREADS", "OPENBLAS_NUM_THREADS", "MKL_NUM_THREADS", "BLIS_NUM_THREADS",
+                 "VECLIB_MAXIMUM_THREADS", "NUMEXPR_NUM_THREADS")
+TF_ENV_VARS = ("TF_NUM_INTRAOP_THREADS", "TF_NUM_INTEROP_THREADS")
+
+thread_budget = {}
+
+
+def _env_int(name, default):
+    value = os.environ.get(name)
+    return int(value) if value else default
+
+
+def available_cores():
+    try:
+        return len(os.sched_getaffinity(0))
+    except AttributeError:
+        return os.cpu_count() or 1
+
+
+def compute_thread_budget(cores=None, workers=None):
+    """Reparte los núcleos de la máquina entre los procesos y, dentro de cada proceso,
+    entre los procesos de extracción, el executor de asyncio, los hilos BLAS y los pools de TensorFlow
+
+    Todo se puede fijar por entorno (OPEN_REPER_CPU_BUDGET, OPEN_REPER_EXTRACTION_PROCESSES,
+    OPEN_REPER_ANALYSIS_CONCURRENCY, OPEN_REPER_EXECUTOR_THREADS, OPEN_REPER_BLAS_THREADS, OPEN_REPER_TF_INTRA_THREADS, OPEN_REPER_TF_INTER_THREADS).
+    """
+    cores = cores or available_cores()
+    workers = workers or _env_int("OPEN_REPER_WORKERS", _env_int("WEB_CONCURRENCY", 1))
+    budget = _env_int("OPEN_REPER_CPU_BUDGET", max(cores // max(workers, 1), 1))
+    return {
+        "cores": cores,
+        "workers": workers,
+        "cpu_budget": budget,
+        # Procesos de extracción (0 la ejecuta en el hilo de la petición)
+        "extraction_processes": _env_int("OPEN_REPER_EXTRACTION_PROCESSES", budget),
+        # Análisis admitidos a la vez: uno por núcleo, el resto espera en la cola de admisión
+        "analysis_concurrency": _env_int("OPEN_REPER_ANALYSIS_CONCURRENCY", budget),
+        # La extracción es Python puro: un par de hilos por núcleo cubre las esperas de E/S
+        "executor_threads": _env_int("OPEN_REPER_EXECUTOR_THREADS", min(2 * budget, 32)),
+        # Las redes son pequeñas: BLAS multihilo solo compensa en lotes grandes
+        "blas_threads": _env_int("OPEN_REPER_BLAS_THREADS", max(budget // 4, 1)),
+        "tf_intra_op_threads": _env_int("OPEN_REPER_TF_INTRA_THREADS", max(budget // 2, 1)),
+        "tf_inter_op_threads": _env_int("OPEN_REPER_TF_INTER_THREADS", 1)
+    }
+
+
+def apply_thread_budget():
+    """Aplica el reparto antes de cargar los modelos y lo imprime. Se puede llamar varias veces"""
+    if thread_budget:
+        return thread_budget
+    budget = compute_thread_budget()
+
+    for name in BLAS_ENV_VARS:
+        os.environ[name] = str(budget["blas_threads"])
+    for name, key in zip(TF_ENV_VARS, ("tf_intra_op_threads", "tf_inter_op_threads")):
+        os.environ[name] = str(budget[key])
+
+    # Si NumPy ya cargó su BLAS, las variables no bastan: se limita en caliente
+    try:
+        from threadpoolctl import threadpool_limits
+        threadpool_limits(limits=budget["blas_threads"])
+    except ImportError:
+        pass
+
+    # TensorFlow solo se importa en el modo Keras; si ya está cargado se configura directamente
+    if "tensorflow" in sys.modules:
+        try:
+            tf = sys.modules["tensorflow"]
+            tf.config.threading.set_intra_op_parallelism_threads(budget["tf_intra_op_threads"])
+            tf.config.threading.set_inter_op_parallelism_threads(budget["tf_inter_op_threads"])
+        except RuntimeError as e:
+            # El runtime ya estaba inicializado: se mantienen sus pools
+            budget["tf_error"] = str(e)
+
+    thread_budget.update(budget)
+    print("Reparto de hilos: " + ", ".join(f"{key}={value}" for key, value in budget.items()))
+    return thread_budget
+
+
+def effective_threads():
+    """Hilos realmente configurados en cada librería cargada"""
+    effective = {"executor_threads": thread_budget.get("executor_threads")}
+    try:
+        from threadpoolctl import threadpool_info
+        for pool in threadpool_info():
+            effective[f"{pool['internal_api']}_threads"] = pool["num_threads"]
+    except ImportError:
+        pass
+    if "tensorflow" in sys.modules:
+        tf = sys.modules["tensorflow"]
+        effective["tf_intra_op_threads"] = tf.config.threading.get_intra_op_parallelism_threads()
+        effective["tf_inter_op_threads"] = tf.config.threading.get_inter_op_parallelism_threads()
+    return effective
+
+
+async def configure_executor():
+    """Tarea de arranque de Reflex: executor por defecto del bucle con el tamaño del reparto"""
+    budget = apply_thread_budget()
+    executor = ThreadPoolExecutor(max_workers=budget["executor_threads"], thread_name_prefix="open-reper")
+    asyncio.get_running_loop().set_default_executor(executor)
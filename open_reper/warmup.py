@@ -0,0 +1,116 @@
+import asyncio
+import chess
+import chess.pgn
+import numpy as np
+import os
+import random
+import threading
+import time
+
+from models.features.extraction import analyze_pgn
+from open_reper.analysis import run_analysis
+from open_reper.coalescer import MAX_BATCH_SIZE
+from open_reper.extraction_pool import extraction_pool
+from open_reper.model_loader import analyzer, preload_models, recommender
+
+WARMUP_PLIES = 80
+# Intentos de calentamiento y espera inicial entre ellos (se dobla en cada fallo, hasta un minuto)
+WARMUP_ATTEMPTS = int(os.environ.get("OPEN_REPER_WARMUP_ATTEMPTS", 5))
+WARMUP_BACKOFF = float(os.environ.get("OPEN_REPER_WARMUP_BACKOFF", 2))
+WARMUP_MAX_DELAY = 60
+
+_ready = threading.Event()
+warmup_report = {}
+
+
+def is_ready():
+    """True cuando los modelos, cachés y parser ya están calentados, o cuando el
+    calentamiento agotó sus intentos y la réplica atiende en modo degradado"""
+    return _ready.is_set()
+
+
+def sample_pgn(seed=0, plies=WARMUP_PLIES):
+    """PGN sintético con comentarios [%clk], NAGs y una variante para ejercitar el parser"""
+    rng = random.Random(seed)
+    board = chess.Board()
+    game = chess.pgn.Game()
+    node = game
+    while len(board.move_stack) < plies:
+        moves = list(board.legal_moves)
+        if not moves:
+            # Partida terminada antes de tiempo: se vuelve a empezar con otra semilla
+            return sample_pgn(seed + 1, plies)
+        move = rng.choice(moves)
+        if len(board.move_stack) == 1:
+            node.add_variation(moves[0] if moves[0] != move else moves[-1]).comment = "variante"
+        node = node.add_main_variation(move)
+        node.comment = "[%eval 0.17] [%clk 0:03:00]"
+        node.nags.add(chess.pgn.NAG_GOOD_MOVE)
+        board.push(move)
+    return str(game)
+
+
+def warmup_batch_sizes(max_batch=MAX_BATCH_SIZE):
+    """1, 3 (recomendación especulativa) y potencias de dos hasta el lote máximo"""
+    sizes = {1, 3, max_batch}
+    size = 2
+    while size < max_batch:
+        sizes.add(size)
+        size *= 2
+    return sorted(sizes)
+
+
+def warm_up():
+    """Recorre una vez el camino completo y cada tamaño de lote de ambos modelos"""
+    start_time = time.time()
+    pgn_text = sample_pgn()
+    try:
+        preload_models()
+        extraction_pool.start(pgn_text)
+
+        # Parser, tabla de peones, caché de posiciones e hilos de inferencia
+        for color in ("white", "black"):
+            result = run_analysis(pgn_text, color, use_cache=False)
+            if result["status"] != "success":
+                raise RuntimeError(result["message"])
+
+        analysis = analyze_pgn(pgn_text, "white")
+        sizes = warmup_batch_sizes()
+        for model, features in ((analyzer.model, analysis["style_features"]),
+                                (recommender.model, analysis["opening_features"])):
+            model = getattr(model, "model", model)
+            for size in sizes:
+                model.predict(np.repeat(features, size, axis=0), verbose=0)
+    except Exception as e:
+        warmup_report.update({"status": "error", "message": str(e)})
+        print(f"Error en el calentamiento de los modelos: {str(e)}")
+        return False
+
+    elapsed_time = time.time() - start_time
+    warmup_report.pop("message", None)
+    warmup_report.update({"status": "success", "seconds": round(elapsed_time, 3), "batch_sizes": sizes})
+    _ready.set()
+    print(f"Tiempo de calentamiento de los modelos: {elapsed_time:.2f} segundos")
+    return True
+
+
+async def warm_up_models(attempts=WARMUP_ATTEMPTS, backoff=WARMUP_BACKOFF):
+    """Tarea de arranque de Reflex: calienta los modelos sin bloquear el servidor
+
+    Si falla se reintenta con espera exponencial. Agotados los intentos la réplica
+    pasa a estar lista en modo degradado (`warmup_report["status"] == "degraded"`):
+    cada petición devuelve su propio error en lugar de rechazarse todas para siempre.
+    """
+    for attempt in range(1, attempts + 1):
+        warmup_report["attempts"] = attempt
+        if await asyncio.to_thread(warm_up):
+            return True
+        if attempt < attempts:
+            delay = min(backoff * 2 ** (attempt - 1), WARMUP_MAX_DELAY)
+            print(f"Reintentando el calentamiento en {delay:.0f} segundos ({attempt} de {attempts})")
+            await asyncio.sleep(delay)
+
+    warmup_report["status"] = "degraded"
+    _ready.set()
+    print("El calentamiento ha fallado: la réplica atiende en modo degradado")
+    return False